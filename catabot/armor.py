@@ -0,0 +1,166 @@
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from catabot.columns import ItemColumns, QueryError
+from catabot.normalize import Protection, material_portions
+
+ARMOR_TYPES = {'ARMOR', 'TOOL_ARMOR'}
+
+# Body parts of /top, left and right ones together
+BODY_PARTS = {
+    'head': ('head',),
+    'eyes': ('eyes',),
+    'mouth': ('mouth',),
+    'torso': ('torso',),
+    'arms': ('arm_l', 'arm_r'),
+    'hands': ('hand_l', 'hand_r'),
+    'legs': ('leg_l', 'leg_r'),
+    'feet': ('foot_l', 'foot_r'),
+}
+PART_ALIASES = {'arm': 'arms', 'hand': 'hands', 'leg': 'legs', 'foot': 'feet', 'eye': 'eyes', 'chest': 'torso',
+                'face': 'mouth'}
+
+# Stats of /top: protection and warmth from the item columns, coverage and encumbrance of the body part
+PROTECTION = {'bash': 'armor_bash', 'cut': 'armor_cut', 'bullet': 'armor_bullet', 'acid': 'armor_acid',
+              'fire': 'armor_fire', 'environmental': 'environmental', 'warmth': 'warmth'}
+STATS = tuple(PROTECTION) + ('coverage', 'encumbrance')
+STAT_ALIASES = {'ballistic': 'bullet', 'env': 'environmental'}
+# the least is the best
+ASCENDING = {'encumbrance'}
+# resistances of the materials, in the order of the fields of Protection
+RESISTANCES = ('bash_resist', 'cut_resist', 'bullet_resist', 'acid_resist', 'fire_resist')
+
+
+def has_protection(row: dict) -> bool:
+    return row['type'] in ARMOR_TYPES and ('environmental_protection' in row or bool(row.get('material')))
+
+
+def armor_protection(rows: List[dict], material_table: dict) -> List[Protection]:
+    """
+    Protection of armor JSON rows, all computed at once: the portions of the materials of every row times
+    the resistances of every material, averaged over the portions. Bash, cut and bullet resistances grow
+    with the thickness of the armor, acid and fire ones are reduced below 10 environmental protection.
+    """
+    materials = {material_id: i for i, material_id in enumerate(material_table)}
+    resists = np.array([[row[r] if r in row else 0 for r in RESISTANCES] for row in material_table.values()],
+                       np.float64).reshape(len(materials), len(RESISTANCES))
+    portions = np.zeros((len(rows), len(materials)), np.float64)
+    # portions of materials missing from the table count as no resistance
+    totals = np.zeros(len(rows), np.float64)
+    for i, row in enumerate(rows):
+        for material_id, portion in material_portions(row['material']) if 'material' in row else ():
+            totals[i] += portion
+            if material_id in materials:
+                portions[i, materials[material_id]] += portion
+    environmental = [row['environmental_protection'] if 'environmental_protection' in row else 0 for row in rows]
+    env = np.array(environmental, np.float64)
+    thickness = np.array([row['material_thickness'] if 'material_thickness' in row else 0 for row in rows],
+                         np.float64)
+
+    protection = (portions @ resists) / np.where(totals > 0, totals, 1)[:, None]
+    protection[:, :3] *= thickness[:, None]
+    protection[:, 3:] *= np.where(env < 10, env / 10, 1)[:, None]
+    return [Protection(*values, row_env) for values, row_env in zip(protection.tolist(), environmental)]
+
+
+def _part_stats(row, parts: Tuple[str, ...]) -> Optional[Tuple[float, float]]:
+    """:return: coverage and encumbrance of the body part or None if the item doesn't cover it"""
+    if not row['covered'].intersection(parts):
+        return None
+    if 'armor_portions' not in row:
+        return row.get('coverage', 0), row.get('encumbrance', 0)
+    portions = [portion for portion in row['armor_portions'] if set(portion.covers).intersection(parts)]
+    if not portions:
+        return row.get('coverage', 0), row.get('encumbrance', 0)
+    return max(portion.coverage for portion in portions), max(portion.encumbrance for portion in portions)
+
+
+def parse_top(text: str) -> Tuple[str, str, Optional[float]]:
+    """
+    Parse ``<body part> <stat> [max encumbrance]``
+    :return: body part, stat and max encumbrance or None
+    """
+    words = text.lower().split()
+    if len(words) not in (2, 3):
+        raise QueryError("Expected a body part, a stat and optionally the max encumbrance")
+    part = PART_ALIASES.get(words[0], words[0])
+    stat = STAT_ALIASES.get(words[1], words[1])
+    if part not in BODY_PARTS:
+        raise QueryError(f"Unknown body part {words[0]}")
+    if stat not in STATS:
+        raise QueryError(f"Unknown stat {words[1]}")
+    max_encumbrance = None
+    if len(words) == 3:
+        try:
+            max_encumbrance = float(words[2])
+        except ValueError:
+            raise QueryError(f"{words[2]} is not a number") from None
+    return part, stat, max_encumbrance
+
+
+class _Board:
+    """Armor covering one body part: positions in the item columns, their coverage and encumbrance"""
+
+    def __init__(self, positions: List[int], stats: List[Tuple[float, float]], columns: ItemColumns):
+        self.positions = np.array(positions, np.int32)
+        self.coverage = np.array([coverage for coverage, _ in stats], np.float32)
+        self.encumbrance = np.array([encumbrance for _, encumbrance in stats], np.float32)
+        # indexes into the arrays above from the best to the worst armor for every stat, without the armor
+        # that doesn't have the stat at all
+        self.orders: Dict[str, np.ndarray] = {}
+        for stat in STATS:
+            values = self.stat(stat, columns)
+            order = np.argsort(values if stat in ASCENDING else -values, kind='stable')
+            self.orders[stat] = order[~np.isnan(values[order])].astype(np.int32)
+
+    def stat(self, stat: str, columns: ItemColumns) -> np.ndarray:
+        if stat == 'coverage':
+            return self.coverage
+        if stat == 'encumbrance':
+            return self.encumbrance
+        return columns.numeric[PROTECTION[stat]][self.positions]
+
+
+class ArmorBoards:
+    """
+    Armor leaderboards: for every body part the armor covering it, already sorted by every stat,
+    so the best armor for a body part is a slice of a sorted index (filtered by encumbrance if asked)
+    """
+
+    def __init__(self, rows, columns: ItemColumns):
+        self.keys = columns.keys
+        positions = {part: [] for part in BODY_PARTS}
+        stats = {part: [] for part in BODY_PARTS}
+        for i, row in enumerate(rows):
+            if row['type'] not in ARMOR_TYPES:
+                continue
+            for part, parts in BODY_PARTS.items():
+                part_stats = _part_stats(row, parts)
+                if part_stats is not None:
+                    positions[part].append(i)
+                    stats[part].append(part_stats)
+        self.boards = {part: _Board(positions[part], stats[part], columns) for part in BODY_PARTS}
+
+    def top(self, part: str, stat: str, limit: int, max_encumbrance: Optional[float] = None) -> List[str]:
+        """Keys of the best armor for a body part by a stat, the first `limit` ones"""
+        board = self.boards[part]
+        order = board.orders[stat]
+        if max_encumbrance is not None:
+            order = order[board.encumbrance[order] <= max_encumbrance]
+        return [self.keys[i] for i in board.positions[order[:limit]]]
+
+
+def stat_value(row, part: str, stat: str) -> Optional[float]:
+    """Stat of an item for a body part, as /top compares it"""
+    part_stats = _part_stats(row, BODY_PARTS[part])
+    if part_stats is None:
+        return None
+    if stat == 'coverage':
+        return part_stats[0]
+    if stat == 'encumbrance':
+        return part_stats[1]
+    if stat == 'warmth':
+        return row.get('warmth')
+    protection = row.get('protection')
+    return getattr(protection, stat) if protection is not None else None
@@ -0,0 +1,113 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+from telebot.async_telebot import AsyncTeleBot
+from telebot.asyncio_helper import ApiException
+from telebot.types import User, Message, CallbackQuery, InlineQuery
+
+from catabot import constants, github, metrics
+from catabot.commands.admin import async_memory, async_profile, is_admin
+from catabot.commands.release import async_get_release
+from catabot.commands.search import (async_search, async_btn_pressed, async_find_items, async_flag, async_inline,
+                                     async_top)
+from catabot.tgbot import ALL_CONTENT_TYPES, callback_handler
+
+
+class AsyncTelegramBot:
+    """
+    Same bot as :class:`catabot.tgbot.TelegramBot` on top of AsyncTeleBot: updates are handled concurrently
+    on one event loop, network calls don't block a thread and searches and rendering run in a pool of `workers` threads.
+    """
+
+    def __init__(self, token, clean=False, debug=False, workers=4):
+        self.token: str = token
+        self.clean: bool = clean
+        self.debug: bool = debug
+        self.workers: int = workers
+
+        self.bot: AsyncTeleBot = AsyncTeleBot(token)
+        self.me: User = None
+        # handlers get a proxy of the bot timing Bot API calls
+        self.api = metrics.TimedApi(self.bot)
+
+        @self.bot.message_handler(['search', 's', 'item', 'i',
+                                   'craft', 'c', 'recipe', 'r',
+                                   'disassemble', 'disasm', 'd', 'uncraft', 'u',
+                                   'monster', 'mob', 'm',
+                                   'uses', 'tree'])
+        async def _search(message: Message):
+            with metrics.request('search'):
+                await async_search(self.api, message)
+
+        @self.bot.message_handler(['flag'])
+        async def _flag(message: Message):
+            with metrics.request('flag'):
+                await async_flag(self.api, message)
+
+        @self.bot.message_handler(['find'])
+        async def _find(message: Message):
+            with metrics.request('find'):
+                await async_find_items(self.api, message)
+
+        @self.bot.message_handler(['top'])
+        async def _top(message: Message):
+            with metrics.request('top'):
+                await async_top(self.api, message)
+
+        @self.bot.inline_handler(func=lambda query: True)
+        async def _inline(query: InlineQuery):
+            with metrics.request('inline'):
+                await async_inline(self.api, query)
+
+        @self.bot.callback_query_handler(func=lambda call: call.data)
+        async def _btn_pressed(call: CallbackQuery):
+            with metrics.request(callback_handler(call.data)):
+                if call.message and call.message.reply_to_message:
+                    if call.message.reply_to_message.from_user.id != call.from_user.id:
+                        await self.api.answer_callback_query(call.id, "Эти кнопки только для того кто вызвал команду", True)
+                        return
+                await async_btn_pressed(self.api, call.message, call.data)
+
+        @self.bot.message_handler(['release', 'get_release'])
+        async def _get_release(message):
+            with metrics.request('release'):
+                await async_get_release(self.api, message)
+
+        @self.bot.message_handler(['profile'], func=is_admin)
+        async def _profile(message: Message):
+            with metrics.request('profile'):
+                await async_profile(self.api, message)
+
+        @self.bot.message_handler(['memory'], func=is_admin)
+        async def _memory(message: Message):
+            with metrics.request('memory'):
+                await async_memory(self.api, message)
+
+        @self.bot.message_handler(func=lambda m: m.from_user and m.from_user.id == 777000, content_types=ALL_CONTENT_TYPES)
+        async def _unpin(message):
+            with metrics.request('unpin'):
+                try:
+                    await self.api.unpin_chat_message(message.chat.id, message.message_id)
+                except ApiException:
+                    pass
+
+    # Start the bot (admins are notified once the event loop is running)
+    def bot_start_polling(self):
+        pass
+
+    # Go in idle mode
+    def bot_idle(self):
+        asyncio.run(self._main())
+
+    async def _main(self):
+        asyncio.get_running_loop().set_default_executor(ThreadPoolExecutor(self.workers, 'catabot'))
+        self.me = await self.bot.get_me()
+        for admin in constants.ADMINS:
+            await self.bot.send_message(admin, 'I was restarted')
+        try:
+            if self.debug:
+                await self.bot.polling(non_stop=False, skip_pending=self.clean)
+            else:
+                await self.bot.infinity_polling(skip_pending=self.clean)
+        finally:
+            await github.client.close_async()
@@ -0,0 +1,158 @@
+import json
+import math
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+from argparse import ArgumentParser
+from typing import Callable, Dict, List
+
+from catabot.bench.synthetic import changelog_body, generate
+from catabot.columns import parse_query
+from catabot.commands import search
+from catabot.requirements import expand_recipes
+from catabot.sessions import Session
+from catabot.snapshot import build_snapshot, gc_paused
+from changelog.github import Release
+from changelog.tgbot import get_bundles
+
+KEYWORDS = ['a', 'knife', 'makeshift knife', 'spear', 'glazed tenderloin', 'survivor', 'battery', 'steel', 'jacket',
+            'rope', 'xyzzy']
+TYPOS = ['knfie', 'wodden spaer', 'survivr', 'batery', 'kevlr jacket']
+QUERIES = ['type:ARMOR covers:torso warmth>=20 weight<1kg sort:-coverage', 'sort:weight', 'sort:-storage',
+           'type:tool,gun cut>10', 'flag:spear sort:-cut material:steel']
+TOPS = [('torso', 'cut', 10), ('head', 'bash', None), ('feet', 'encumbrance', None), ('arms', 'bullet', 20),
+        ('hands', 'warmth', 5)]
+
+
+class Operation:
+    """A benchmarked call: `run` is called with inputs cycled from `inputs`"""
+
+    def __init__(self, name: str, run: Callable, inputs: list, samples: int):
+        self.name = name
+        self.run = run
+        self.inputs = inputs
+        self.samples = samples
+
+
+def _operations(data_text: str, samples: int, seed: int, raw_path: str) -> List[Operation]:
+    with gc_paused():
+        raw_data = build_snapshot(json.loads(data_text), raw_path)
+    rng = random.Random(seed)
+    items = rng.sample(list(raw_data['item']), min(200, len(raw_data['item'])))
+    recipes = rng.sample(list(raw_data['recipe']), min(200, len(raw_data['recipe'])))
+    session = Session(raw_data.version, 'view', 'a', tuple(search._search_results(raw_data, 'item', 'a')), False)
+    pages = list(range(1, math.ceil(len(session.ids) / 10) + 1))
+    release = Release(1, 'Cataclysm-DDA experimental build 2024-01-01-0000', 'https://github.com/', '2024-01-01T00:00:00Z',
+                      changelog_body(seed))
+
+    def _load_data(_):
+        with gc_paused():
+            build_snapshot(json.loads(data_text), raw_path)
+
+    return [
+        Operation('load_data', _load_data, [None], max(3, samples // 100)),
+        Operation('expand_recipes', lambda _: expand_recipes(raw_data.tables), [None], max(3, samples // 20)),
+        Operation('search', lambda keyword: search._search_results(raw_data, 'item', keyword), KEYWORDS, samples),
+        Operation('fuzzy_search', lambda keyword: search._fuzzy_results(raw_data, 'item', keyword), TYPOS, samples),
+        Operation('prefix_search', lambda keyword: raw_data.prefix_index['item'].search(keyword, 10), KEYWORDS, samples),
+        Operation('find', lambda query: raw_data.item_columns.find(parse_query(query), search.FIND_RESULTS), QUERIES,
+                  samples),
+        Operation('top', lambda args: raw_data.armor_boards.top(*args[:2], search.TOP_RESULTS, args[2]), TOPS, samples),
+        Operation('view_item', lambda row_id: search._view_item(raw_data, row_id), items, samples),
+        Operation('raw_item', lambda row_id: search._view_item(raw_data, row_id, True), items, samples),
+        Operation('used_in', lambda row_id: search._used_in(raw_data, row_id), items, samples),
+        Operation('craft_item', lambda row_id: search._craft_item(raw_data, row_id), recipes, samples),
+        Operation('craft_tree', lambda row_id: search._tree_view(raw_data, row_id, 'time'), recipes, samples),
+        Operation('page_view', lambda page: search._page_view(raw_data, 'bench', session, page), pages, samples),
+        Operation('get_bundles', lambda _: get_bundles(release), [None], samples),
+    ]
+
+
+def _percentile(times: List[float], q: float) -> float:
+    return times[min(len(times) - 1, int(q * len(times)))]
+
+
+def _measure(operation: Operation) -> Dict[str, float]:
+    inputs = operation.inputs
+    operation.run(inputs[0])  # warm up
+    times = []
+    for i in range(operation.samples):
+        started = time.perf_counter()
+        operation.run(inputs[i % len(inputs)])
+        times.append(time.perf_counter() - started)
+    total = sum(times)
+    times.sort()
+
+    # allocations are traced in a separate pass, tracing slows everything down
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        for i in range(min(len(inputs), operation.samples)):
+            operation.run(inputs[i])
+        peak = tracemalloc.get_traced_memory()[1] - before
+    finally:
+        tracemalloc.stop()
+    return {
+        'p50': _percentile(times, .5),
+        'p90': _percentile(times, .9),
+        'p99': _percentile(times, .99),
+        'max': times[-1],
+        'ops': len(times) / total,
+        'peak': peak,
+    }
+
+
+def _ms(seconds: float) -> str:
+    return f"{seconds * 1000:.3f}"
+
+
+def _change(value: float, baseline: float) -> str:
+    if not baseline:
+        return ''
+    return f"{(value - baseline) / baseline * 100:+.0f}%"
+
+
+def main():
+    parser = ArgumentParser(description="Benchmark loading, searching and rendering on synthetic game data")
+    parser.add_argument("-items", dest="items", type=int, default=10000, help="number of items in the synthetic data")
+    parser.add_argument("-seed", dest="seed", type=int, default=1, help="random seed of the synthetic data")
+    parser.add_argument("-samples", dest="samples", type=int, default=300, help="timed calls per operation")
+    parser.add_argument("-save", dest="save", help="save the results as a baseline", metavar="FILE")
+    parser.add_argument("-baseline", dest="baseline", help="compare with a saved baseline", metavar="FILE")
+    parser.add_argument("operations", nargs='*', help="operations to run (all by default)")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    data_text = json.dumps(generate(args.items, args.seed))
+    # the raw JSON of the synthetic data must not replace the one of the real data
+    raw_dir = tempfile.TemporaryDirectory()
+    operations = _operations(data_text, args.samples, args.seed, os.path.join(raw_dir.name, 'data.raw'))
+    print(f"synthetic data: {args.items} items, {len(data_text) / 1024 / 1024:.1f} MiB of JSON, "
+          f"prepared in {time.perf_counter() - started:.1f}s")
+
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline, 'r') as file:
+            baseline = json.load(file)
+
+    results = {}
+    print(f"{'operation':<16}{'p50, ms':>10}{'p90, ms':>10}{'p99, ms':>10}{'max, ms':>10}{'ops/s':>10}"
+          f"{'peak, KiB':>11}{'p50 vs base':>13}")
+    for operation in operations:
+        if args.operations and operation.name not in args.operations:
+            continue
+        result = results[operation.name] = _measure(operation)
+        base = baseline.get(operation.name, {})
+        print(f"{operation.name:<16}{_ms(result['p50']):>10}{_ms(result['p90']):>10}{_ms(result['p99']):>10}"
+              f"{_ms(result['max']):>10}{result['ops']:>10.0f}{result['peak'] / 1024:>11.0f}"
+              f"{_change(result['p50'], base.get('p50')):>13}")
+
+    if args.save:
+        with open(args.save, 'w') as file:
+            json.dump(results, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
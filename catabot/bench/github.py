@@ -0,0 +1,162 @@
+import asyncio
+import gzip
+import json
+import tempfile
+import threading
+from argparse import ArgumentParser
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List
+
+from catabot.github import GitHubClient, GitHubError
+
+DATA = {'name': 'Cataclysm-DDA experimental build #1', 'assets': []}
+THREADS = 8
+THREAD_REQUESTS = 20
+
+
+class _Handler(BaseHTTPRequestHandler):
+    """
+    Stand-in for the GitHub API: ``/json`` answers with an ``ETag`` and a 304 to a matching ``If-None-Match``,
+    ``/gzip`` is always compressed, ``/redirect`` points to ``/json`` and ``/fail`` answers 403 like a rate limit.
+    ``/json`` fails too while the server's `failing` is set.
+    """
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        server: _Server = self.server
+        with server.lock:
+            server.hits.append((self.path, self.headers.get('If-None-Match')))
+        if self.path == '/redirect':
+            self._send(302, b'', {'Location': '/json'})
+        elif self.path == '/fail' or (self.path == '/json' and server.failing):
+            self._send(403, b'{"message": "API rate limit exceeded"}')
+        elif self.path == '/json' and self.headers.get('If-None-Match') == server.etag:
+            self._send(304, b'')
+        elif self.path == '/json':
+            self._send(200, json.dumps(DATA).encode(), {'ETag': server.etag})
+        elif self.path == '/gzip':
+            self._send(200, gzip.compress(json.dumps(DATA).encode()), {'Content-Encoding': 'gzip'})
+        else:
+            self._send(404, b'{"message": "Not Found"}')
+
+    def _send(self, status: int, body: bytes, headers: Dict[str, str] = None):
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), _Handler)
+        self.etag = '"v1"'
+        self.failing = False
+        self.hits = []
+        self.lock = threading.Lock()
+
+    def url(self, path: str) -> str:
+        return f'http://127.0.0.1:{self.server_port}{path}'
+
+    def take_hits(self) -> list:
+        with self.lock:
+            hits, self.hits = self.hits, []
+        return hits
+
+
+def _check(name: str, condition: bool, details=None):
+    if not condition:
+        raise AssertionError(f"{name} failed: {details!r}")
+    print(f"ok {name}")
+
+
+def _run_checks(server: _Server, get_json: Callable[[GitHubClient, str, float], object], mode: str):
+    with tempfile.TemporaryDirectory() as cache_dir:
+        client = GitHubClient(cache_dir, ttl=60)
+        url = server.url('/json')
+        server.take_hits()
+
+        _check(f'{mode}: fetch', get_json(client, url, None) == DATA and client.requests == 1)
+        get_json(client, url, None)
+        _check(f'{mode}: fresh response from the cache', server.take_hits() == [('/json', None)])
+
+        _check(f'{mode}: 304 revalidation', get_json(client, url, 0) == DATA and client.not_modified == 1)
+        hits = server.take_hits()
+        _check(f'{mode}: revalidated with the ETag', hits == [('/json', server.etag)], hits)
+
+        revalidating = GitHubClient(cache_dir, ttl=0)
+        get_json(revalidating, url, None)
+        _check(f'{mode}: ETag kept on disk', revalidating.not_modified == 1 and server.take_hits()[0][1] == server.etag)
+
+        server.failing = True
+        try:
+            _check(f'{mode}: stale fallback', get_json(client, url, 0) == DATA)
+        finally:
+            server.failing = False
+        try:
+            get_json(client, server.url('/fail'), None)
+        except GitHubError as e:
+            _check(f'{mode}: error without a cached response', e.status == 403, e)
+        else:
+            _check(f'{mode}: error without a cached response', False)
+
+        server.take_hits()
+        _check(f'{mode}: redirect', get_json(client, server.url('/redirect'), None) == DATA)
+        _check(f'{mode}: redirect followed', [path for path, _ in server.take_hits()] == ['/redirect', '/json'])
+        _check(f'{mode}: gzip', get_json(client, server.url('/gzip'), None) == DATA)
+
+
+def _check_counters(server: _Server):
+    client = GitHubClient(None)
+    url = server.url('/gzip')
+
+    def work():
+        for _ in range(THREAD_REQUESTS):
+            client.get_json(url, 0)
+
+    threads = [threading.Thread(target=work) for _ in range(THREADS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    _check('counters from several threads', client.requests == THREADS * THREAD_REQUESTS, client.requests)
+
+
+def main():
+    parser = ArgumentParser(description="Check the GitHub client against a local stand-in server")
+    parser.add_argument("-no-async", dest="run_async", action="store_false", default=True,
+                        help="skip the aiohttp requests of the async bot")
+    args = parser.parse_args()
+
+    server = _Server()
+    threading.Thread(target=server.serve_forever, name='github-stand-in', daemon=True).start()
+    try:
+        _run_checks(server, lambda client, url, ttl: client.get_json(url, ttl), 'sync')
+        _check_counters(server)
+        if args.run_async:
+            clients: List[GitHubClient] = []
+
+            def get_json_async(client: GitHubClient, url: str, ttl: float):
+                clients.append(client)
+                return loop.run_until_complete(client.get_json_async(url, ttl))
+
+            loop = asyncio.new_event_loop()
+            try:
+                _run_checks(server, get_json_async, 'async')
+            finally:
+                for client in clients:
+                    loop.run_until_complete(client.close_async())
+                loop.close()
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+import os
+import tempfile
+import time
+from argparse import ArgumentParser
+
+from catabot.snapshot import SnapshotManager, row_names
+from download_data import ALL_DATA_FILE, SNAPSHOT_FILE
+
+KEYWORDS = ['a', 'knife', 'makeshift knife', 'spear', 'glazed tenderloin', 'survivor', 'zombie', 'battery',
+            '9mm', 'steel', 'jacket', 'xl', 'mre', 'rope', 'atomic', 'xyzzy']
+
+
+def _scan(table: dict, keyword: str) -> list:
+    # search as it was done before the trigram index
+    return [row['id'] for row in table.values()
+            if 'id' in row and any(keyword.lower() in n.lower() for n in row_names(row))]
+
+
+def _best_time(func, *args, repeat: int) -> float:
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func(*args)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    parser = ArgumentParser(description="Compare full-scan and trigram index search")
+    parser.add_argument("-data", dest="data", default=ALL_DATA_FILE, help="path to data.json", metavar="FILE")
+    parser.add_argument("-snapshot", dest="snapshot", default=SNAPSHOT_FILE, help="path to the compiled snapshot",
+                        metavar="FILE")
+    parser.add_argument("-repeat", dest="repeat", type=int, default=5, help="runs per keyword, the best one counts")
+    parser.add_argument("keywords", nargs='*', default=KEYWORDS)
+    args = parser.parse_args()
+
+    # a snapshot built from data.json here must not replace the raw JSON of the running bot
+    raw_dir = tempfile.TemporaryDirectory()
+    raw_data = SnapshotManager(args.data, args.snapshot, os.path.join(raw_dir.name, 'data.raw')).current()
+    print(f"build {raw_data.version}")
+    print(f"{'typ':<8}{'keyword':<20}{'results':>8}{'scan, ms':>10}{'index, ms':>11}{'speedup':>9}")
+    total_scan = total_index = 0
+    for typ, index in raw_data.search_index.items():
+        for keyword in args.keywords:
+            results = index.search(keyword)
+            if results != _scan(raw_data[typ], keyword):
+                raise AssertionError(f"index and scan disagree on {typ} {keyword!r}")
+            scan = _best_time(_scan, raw_data[typ], keyword, repeat=args.repeat)
+            indexed = _best_time(index.search, keyword, repeat=args.repeat)
+            total_scan += scan
+            total_index += indexed
+            print(f"{typ:<8}{keyword:<20}{len(results):>8}{scan * 1000:>10.2f}{indexed * 1000:>11.3f}"
+                  f"{scan / indexed:>8.0f}x")
+    print(f"total: scan {total_scan * 1000:.1f} ms, index {total_index * 1000:.1f} ms, "
+          f"{total_scan / total_index:.0f}x faster")
+
+
+if __name__ == "__main__":
+    main()
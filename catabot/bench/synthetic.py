@@ -0,0 +1,144 @@
+import json
+import random
+import sys
+from argparse import ArgumentParser
+
+WORDS = "glazed tenderloin makeshift knife wooden spear steel pipe cloth leather kevlar helmet jacket boots gloves " \
+        "pistol rifle magazine battery cell small large heavy light military tactical hunting combat survivor " \
+        "rope bag backpack canteen bottle jar can soup meat fish bread water clean dirty rotten cooked raw " \
+        "copper wire scrap metal plank nail hammer saw drill welder torch lamp flashlight radio phone book manual".split()
+MATS = ['steel', 'iron', 'wood', 'cotton', 'leather', 'kevlar', 'plastic', 'glass', 'flesh', 'paper']
+TYPES = ["GENERIC", "TOOL", "ARMOR", "COMESTIBLE", "GUN", "AMMO", "MAGAZINE", "BOOK", "TOOL_ARMOR", "GUNMOD"]
+BPS = ['head', 'eyes', 'mouth', 'torso', 'arm_l', 'arm_r', 'hand_l', 'hand_r', 'leg_l', 'leg_r', 'foot_l', 'foot_r']
+AMMO_TYPES = ['9mm', '556', 'battery', 'arrow', 'shot']
+FLAGS = ['SPEAR', 'STAB', 'MAG_BELT', 'BATTERY_SMALL', 'WATERPROOF', 'OUTER', 'BELTED', 'SKINTIGHT']
+QUALS = ['CUT', 'HAMMER', 'SAW_M', 'WELD', 'SCREW', 'COOK']
+
+
+def generate(items: int = 10000, seed: int = 1, build_number: str = '2024-01-01-0000') -> dict:
+    """
+    Game data shaped like all.json: items of all kinds with pockets and armor, copy-from chains,
+    recipes with nested requirements, disassembly, monsters and rows of types the bot skips
+    :param items: number of items, the other tables are sized after it
+    :param seed: the same seed always gives the same data
+    """
+    rng = random.Random(seed)
+    data = []
+    for m in MATS:
+        data.append({"type": "material", "id": m, "name": m.capitalize(), "bash_resist": rng.randint(0, 6),
+                     "cut_resist": rng.randint(0, 6), "bullet_resist": rng.randint(0, 6),
+                     "acid_resist": rng.randint(0, 9), "fire_resist": rng.randint(0, 9)})
+    for a in AMMO_TYPES:
+        data.append({"type": "ammunition_type", "id": a, "name": a + " ammo", "default": a + "_fmj"})
+    for q in QUALS:
+        data.append({"type": "tool_quality", "id": q, "name": {"str": q.lower() + "ing"}})
+    for p in ['prof_a', 'prof_b']:
+        data.append({"type": "proficiency", "id": p, "name": {"str": p}})
+    ids = []
+    for i in range(items):
+        typ = rng.choice(TYPES)
+        iid = f"item_{i}"
+        name = ' '.join(rng.sample(WORDS, rng.randint(1, 3)))
+        row = {"type": typ, "id": iid, "name": {"str": name} if rng.random() < .8 else name,
+               "description": f"A {name}. " * rng.randint(1, 4),
+               # current data gives materials with their portions, older data only their ids
+               "material": rng.choice([rng.sample(MATS, rng.randint(1, 2)),
+                                       [{"type": m, "portion": rng.randint(1, 3)} for m in rng.sample(MATS, 2)]]),
+               "volume": rng.choice([f"{rng.randint(1, 3000)} ml", f"{rng.randint(1, 5)} L", rng.randint(1, 8)]),
+               "weight": rng.choice([f"{rng.randint(1, 3000)} g", f"{rng.randint(1, 5)} kg", f"{rng.randint(1, 900)} mg"]),
+               "flags": rng.sample(FLAGS, rng.randint(0, 3)),
+               "bashing": rng.randint(0, 20), "cutting": rng.randint(0, 20),
+               "to_hit": rng.choice([rng.randint(-2, 3),
+                                     {"grip": "solid", "length": "long", "surface": "point", "balance": "good"}])}
+        if rng.random() < .2 and ids:
+            row = {"type": typ, "id": iid, "copy-from": rng.choice(ids[-50:]), "name": {"str": name}}
+        if typ in ('ARMOR', 'TOOL_ARMOR') and 'copy-from' not in row:
+            row['warmth'] = rng.randint(0, 50)
+            row['material_thickness'] = rng.randint(1, 5)
+            row['environmental_protection'] = rng.randint(0, 10)
+            row['armor'] = [{"covers": rng.sample(BPS, 2), "coverage": rng.randint(10, 100),
+                             "encumbrance": rng.choice([rng.randint(0, 30), [5, 15]])}]
+        if typ == 'AMMO':
+            row['ammo_type'] = rng.choice(AMMO_TYPES)
+        if typ == 'COMESTIBLE':
+            row['calories'] = rng.randint(0, 900)
+            row['vitamins'] = [["vitA", 5]]
+            row['charges'] = rng.randint(1, 4)
+        if typ in ('GUN', 'TOOL', 'MAGAZINE') or rng.random() < .1:
+            pockets = [{"pocket_type": "CONTAINER", "max_contains_volume": "2 L", "max_contains_weight": "3 kg",
+                        "watertight": True, "moves": 200}]
+            if typ in ('GUN', 'MAGAZINE', 'TOOL'):
+                pockets.append({"pocket_type": "MAGAZINE_WELL", "flag_restriction": ['MAG_BELT', 'BATTERY_SMALL']})
+                pockets.append({"pocket_type": "MAGAZINE", "ammo_restriction": {rng.choice(AMMO_TYPES): 30}})
+            if 'copy-from' not in row:
+                row['pocket_data'] = pockets
+        if typ == 'TOOL' and 'copy-from' not in row:
+            row['qualities'] = [[rng.choice(QUALS), rng.randint(1, 3)]]
+            row['charges_per_use'] = 1
+        data.append(row)
+        ids.append(iid)
+    data.append({"type": "GENERIC", "abstract": "abstract_base", "name": "abstract thing", "volume": "1 L"})
+    reqs = []
+    for i in range(300):
+        rid = f"req_{i}"
+        comps = [[[rng.choice(ids), rng.randint(1, 5)] for _ in range(rng.randint(1, 4))]]
+        if reqs and rng.random() < .4:
+            comps[0].append([rng.choice(reqs), rng.randint(1, 3), "LIST"])
+        data.append({"type": "requirement", "id": rid, "components": comps,
+                     "tools": [[[rng.choice(ids), rng.randint(-1, 5)]]],
+                     "qualities": [{"id": rng.choice(QUALS), "level": 1}]})
+        reqs.append(rid)
+    for i in range(items // 2):
+        result = rng.choice(ids)
+        row = {"type": "recipe", "result": result, "category": "CC_OTHER", "skill_used": "fabrication",
+               "difficulty": rng.randint(0, 8), "time": f"{rng.randint(1, 90)} m",
+               "components": [[[rng.choice(ids), rng.randint(1, 4)] for _ in range(rng.randint(1, 3))]
+                              for _ in range(rng.randint(1, 3))],
+               "tools": [[[rng.choice(ids), rng.choice([-1, 5])]]],
+               "qualities": [{"id": rng.choice(QUALS), "level": rng.randint(1, 2)}],
+               "autolearn": True, "reversible": rng.random() < .2,
+               "proficiencies": [{"proficiency": "prof_a", "time_multiplier": 2}],
+               "book_learn": [[rng.choice(ids), 3]],
+               "byproducts": [[rng.choice(ids), 2]] if rng.random() < .1 else None}
+        if row['byproducts'] is None:
+            del row['byproducts']
+        if rng.random() < .3:
+            row['components'].append([[rng.choice(reqs), rng.randint(1, 3), "LIST"]])
+        if rng.random() < .3:
+            row['using'] = [[rng.choice(reqs), rng.randint(1, 3)]]
+        if rng.random() < .1:
+            row['charges'] = rng.randint(2, 10)
+        data.append(row)
+    for i in range(items // 10):
+        data.append({"type": "uncraft", "result": rng.choice(ids), "time": "5 m",
+                     "components": [[[rng.choice(ids), rng.randint(1, 4)]]],
+                     "qualities": [{"id": "CUT", "level": 1}]})
+    for i in range(items // 10):
+        data.append({"type": "MONSTER", "id": f"mon_{i}", "name": {"str": ' '.join(rng.sample(WORDS, 2))},
+                     "volume": "62500 ml", "weight": "81500 g"})
+    for i in range(items * 2):
+        data.append({"type": rng.choice(["terrain", "furniture", "mapgen", "overmap_terrain", "effect_type"]),
+                     "id": f"filler_{i}", "name": ' '.join(rng.sample(WORDS, 3)),
+                     "object": {"rows": ["." * 24] * 24, "palettes": ["p"], "flags": ["A", "B"]}})
+    return {"build_number": build_number, "release": "synthetic", "data": data}
+
+
+def changelog_body(seed: int = 1, lines: int = 400) -> str:
+    """Release notes shaped like the ones of experimental builds, for changelog benchmarks"""
+    rng = random.Random(seed)
+    notes = ["## What's Changed"]
+    for _ in range(lines):
+        notes.append(f"* {' '.join(rng.sample(WORDS, rng.randint(3, 9))).capitalize()} by @dev{rng.randint(1, 300)} "
+                     f"in https://github.com/CleverRaven/Cataclysm-DDA/pull/{rng.randint(60000, 80000)} "
+                     f"#{rng.randint(60000, 80000)}")
+    notes.append("**Full Changelog**: https://github.com/CleverRaven/Cataclysm-DDA/compare/a...b")
+    return '\n'.join(notes)
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="Write synthetic game data shaped like all.json to stdout")
+    parser.add_argument("-items", dest="items", type=int, default=10000, help="number of items")
+    parser.add_argument("-seed", dest="seed", type=int, default=1, help="random seed")
+    parser.add_argument("-build", dest="build", default='2024-01-01-0000', help="build number")
+    args = parser.parse_args()
+    json.dump(generate(args.items, args.seed, args.build), sys.stdout)
@@ -0,0 +1,188 @@
+import operator
+import re
+from typing import Callable, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+MASS = {'': 1, 'mg': .001, 'g': 1, 'kg': 1000}
+VOLUME = {'': 1, 'ml': 1, 'l': 1000}
+LENGTH = {'': 1, 'mm': 1, 'cm': 10, 'm': 1000, 'km': 1000000}
+NUMBER = {'': 1}
+
+_COMPARISON = re.compile(r'^([a-z_]+)(<=|>=|!=|<|>|=)(.+)$')
+_VALUE = re.compile(r'^(-?\d+(?:\.\d+)?)\s*([a-z]*)$')
+_OPERATORS = {'<': operator.lt, '<=': operator.le, '>': operator.gt, '>=': operator.ge, '=': operator.eq,
+              '!=': operator.ne}
+
+
+class QueryError(ValueError):
+    pass
+
+
+class Column(NamedTuple):
+    value: Callable[[object], Optional[float]]
+    # units a value can be given in and the unit it is shown in
+    units: Dict[str, float]
+    unit: str
+
+
+def _field(name: str) -> Callable[[object], Optional[float]]:
+    return lambda row: row[name] if name in row else None
+
+
+def _protection(name: str) -> Callable[[object], Optional[float]]:
+    return lambda row: getattr(row['protection'], name) if 'protection' in row else None
+
+
+def _armor(name: str) -> Callable[[object], Optional[float]]:
+    # the most of all armor portions
+    def value(row) -> Optional[float]:
+        if 'armor_portions' in row and row['armor_portions']:
+            return max(getattr(portion, name) for portion in row['armor_portions'])
+        return row[name] if name in row else None
+    return value
+
+
+# Numeric attributes of items, from the fields made by catabot.normalize
+NUMERIC = {
+    'weight': Column(_field('weight_g'), MASS, 'g'),
+    'volume': Column(_field('volume_ml'), VOLUME, 'ml'),
+    'length': Column(_field('length_mm'), LENGTH, 'mm'),
+    'storage': Column(_field('storage_ml'), VOLUME, 'ml'),
+    'bash': Column(_field('bashing'), NUMBER, ''),
+    'cut': Column(_field('cutting'), NUMBER, ''),
+    'to_hit': Column(_field('to_hit_bonus'), NUMBER, ''),
+    'moves': Column(_field('moves_per_attack'), NUMBER, ''),
+    'coverage': Column(_armor('coverage'), NUMBER, '%'),
+    'encumbrance': Column(_armor('encumbrance'), NUMBER, ''),
+    'warmth': Column(_field('warmth'), NUMBER, ''),
+    'armor_bash': Column(_protection('bash'), NUMBER, ''),
+    'armor_cut': Column(_protection('cut'), NUMBER, ''),
+    'armor_bullet': Column(_protection('bullet'), NUMBER, ''),
+    'armor_acid': Column(_protection('acid'), NUMBER, ''),
+    'armor_fire': Column(_protection('fire'), NUMBER, ''),
+    'environmental': Column(_protection('environmental'), NUMBER, ''),
+    'calories': Column(_field('calories'), NUMBER, 'kcal'),
+}
+
+# Attributes with a set of values per item, matched case-insensitively
+CATEGORIES = {
+    'type': lambda row: (row['type'],),
+    'covers': lambda row: row['covered'],
+    'flag': lambda row: row['flags'] if 'flags' in row else (),
+    'material': lambda row: row['materials'],
+}
+
+
+class Filter(NamedTuple):
+    field: str
+    op: str
+    value: object
+
+
+class Query(NamedTuple):
+    filters: Tuple[Filter, ...]
+    # numeric field to sort by or None, descending if reverse
+    sort: Optional[str]
+    reverse: bool
+
+
+def _number(field: str, text: str) -> float:
+    match = _VALUE.match(text.lower())
+    if not match:
+        raise QueryError(f"{text} is not a number")
+    units = NUMERIC[field].units
+    if match.group(2) not in units:
+        raise QueryError(f"{field} can't be in {match.group(2)}, only in {', '.join(u for u in units if u)}"
+                         if len(units) > 1 else f"{field} is a number without units")
+    return float(match.group(1)) * units[match.group(2)]
+
+
+def parse_query(text: str) -> Query:
+    """
+    Parse filters like ``type:ARMOR covers:torso warmth>=20 weight<1kg sort:-coverage``: `field:value` (or values
+    separated by commas) for categories, comparisons for numbers with optional units, `sort:field` or `sort:-field`
+    """
+    filters = []
+    sort = None
+    reverse = False
+    for token in text.split():
+        field, _, value = token.partition(':')
+        field = field.lower()
+        if value and field == 'sort':
+            reverse = value.startswith('-')
+            sort = value.lstrip('-+').lower()
+            if sort not in NUMERIC:
+                raise QueryError(f"Can't sort by {sort}")
+        elif value and field in CATEGORIES:
+            filters.append(Filter(field, ':', tuple(v.lower() for v in value.split(',') if v)))
+        else:
+            match = _COMPARISON.match(token.lower())
+            if not match or match.group(1) not in NUMERIC:
+                raise QueryError(f"Unknown filter {token}")
+            field, op, value = match.groups()
+            filters.append(Filter(field, op, _number(field, value)))
+    if not filters and sort is None:
+        raise QueryError("No filters")
+    return Query(tuple(filters), sort, reverse)
+
+
+class ItemColumns:
+    """
+    Numeric attributes of all items as float arrays (NaN if an item doesn't have one) and item positions
+    by the values of their categories, so a query is a few vectorized comparisons instead of a loop over rows
+    """
+
+    def __init__(self, rows: Iterable[Tuple[str, object]]):
+        rows = list(rows)
+        self.keys: List[str] = [key for key, _ in rows]
+        self.numeric: Dict[str, np.ndarray] = {}
+        for name, column in NUMERIC.items():
+            values = (column.value(row) for _, row in rows)
+            self.numeric[name] = np.fromiter((np.nan if v is None else v for v in values), np.float32, len(rows))
+        self.categories: Dict[str, Dict[str, np.ndarray]] = {}
+        for name, values in CATEGORIES.items():
+            postings = {}
+            for i, (_, row) in enumerate(rows):
+                for value in values(row):
+                    postings.setdefault(value.lower(), []).append(i)
+            self.categories[name] = {value: np.array(positions, np.int32) for value, positions in postings.items()}
+
+    def _mask(self, query: Query) -> np.ndarray:
+        mask = np.ones(len(self.keys), bool)
+        for field, op, value in query.filters:
+            if op == ':':
+                matches = np.zeros(len(self.keys), bool)
+                for v in value:
+                    if v in self.categories[field]:
+                        matches[self.categories[field][v]] = True
+                mask &= matches
+            else:
+                column = self.numeric[field]
+                # NaN compares as unequal to everything, an item without the attribute never matches
+                mask &= _OPERATORS[op](column, value) & ~np.isnan(column)
+        if query.sort is not None:
+            mask &= ~np.isnan(self.numeric[query.sort])
+        return mask
+
+    def find(self, query: Query, limit: int) -> Tuple[List[str], int]:
+        """
+        Items matching a query
+        :param limit: max number of items to return, the first ones by the sort field
+        :return: keys of the items and the number of all matching items
+        """
+        positions = np.flatnonzero(self._mask(query))
+        total = len(positions)
+        if limit <= 0:
+            return [], total
+        if query.sort is None:
+            positions = positions[:limit]
+        else:
+            values = self.numeric[query.sort][positions]
+            if query.reverse:
+                values = -values
+            if total > limit:
+                top = np.argpartition(values, limit - 1)[:limit]
+                positions, values = positions[top], values[top]
+            positions = positions[np.argsort(values, kind='stable')]
+        return [self.keys[i] for i in positions], total
@@ -0,0 +1,91 @@
+import asyncio
+import io
+from typing import TYPE_CHECKING, Callable, Optional, Tuple
+
+from telebot import TeleBot
+from telebot.types import InputFile, Message
+
+from catabot import constants, profiling, utils
+
+if TYPE_CHECKING:
+    from telebot.async_telebot import AsyncTeleBot
+
+PROFILE_REQUESTS = 20
+MAX_PROFILE_REQUESTS = 1000
+
+
+def is_admin(message: Message) -> bool:
+    return bool(message.from_user) and message.from_user.id in constants.ADMINS
+
+
+def _document(report: str, file_name: str) -> InputFile:
+    return InputFile(io.BytesIO(report.encode()), file_name=file_name)
+
+
+def _profile_reply(keyword: str, send_report: Callable[[str], None]) -> str:
+    if keyword == 'stop':
+        return "Stopping, the report is sent when the profiled updates are handled" if profiling.stop_profile() \
+            else "Profiling isn't running"
+    if keyword and not keyword.isdigit():
+        return f"Usage: <code>/profile [updates, {PROFILE_REQUESTS} by default]</code> or <code>/profile stop</code>"
+    requests = min(int(keyword or PROFILE_REQUESTS), MAX_PROFILE_REQUESTS)
+    if not requests:
+        return "Nothing to profile"
+    if not profiling.start_profile(requests, send_report):
+        return "Profiling is already running, <code>/profile stop</code> to get the report"
+    return f"Profiling the next {requests} updates"
+
+
+def _memory_reply(keyword: str) -> Tuple[str, Optional[str]]:
+    """:return: text of the reply and the report to send if there is one"""
+    if keyword == 'start':
+        if not profiling.start_tracemalloc():
+            return "Allocations are already traced", None
+        return "Tracing allocations, <code>/memory</code> shows what was allocated since", None
+    if keyword not in ('', 'stop'):
+        return "Usage: <code>/memory start</code>, <code>/memory</code> or <code>/memory stop</code>", None
+    report = profiling.memory_report(stop=keyword == 'stop')
+    if report is None:
+        return "Allocations aren't traced, <code>/memory start</code> first", None
+    return "Stopped tracing allocations" if keyword == 'stop' else "Allocations since tracing started", report
+
+
+def profile(bot: TeleBot, message: Message):
+    chat_id = message.chat.id
+
+    def send_report(report: str):
+        bot.send_document(chat_id, _document(report, 'profile.txt'), caption="cProfile report")
+
+    bot.reply_to(message, _profile_reply(utils.get_keyword(message, False).lower(), send_report), parse_mode='html')
+
+
+def memory(bot: TeleBot, message: Message):
+    text, report = _memory_reply(utils.get_keyword(message, False).lower())
+    if report is None:
+        bot.reply_to(message, text, parse_mode='html')
+    else:
+        bot.send_document(message.chat.id, _document(report, 'memory.txt'), reply_to_message_id=message.message_id,
+                          caption=text)
+
+
+async def async_profile(bot: 'AsyncTeleBot', message: Message):
+    chat_id = message.chat.id
+    loop = asyncio.get_running_loop()
+
+    # the last profiled update may finish in any thread
+    def send_report(report: str):
+        asyncio.run_coroutine_threadsafe(
+            bot.send_document(chat_id, _document(report, 'profile.txt'), caption="cProfile report"), loop)
+
+    text = _profile_reply(utils.get_keyword(message, False).lower(), send_report)
+    await bot.reply_to(message, text, parse_mode='html')
+
+
+async def async_memory(bot: 'AsyncTeleBot', message: Message):
+    # taking a snapshot of all traced allocations is slow
+    text, report = await utils.in_executor(lambda: _memory_reply(utils.get_keyword(message, False).lower()))
+    if report is None:
+        await bot.reply_to(message, text, parse_mode='html')
+    else:
+        await bot.send_document(message.chat.id, _document(report, 'memory.txt'),
+                                reply_to_message_id=message.message_id, caption=text)
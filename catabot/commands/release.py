@@ -1,12 +1,16 @@
-import json
-import urllib.request
+import os
 from enum import Enum, auto
+from typing import TYPE_CHECKING, Generator, Optional, Tuple
 
 from telebot import TeleBot
-from telebot.apihelper import ApiException
 from telebot.types import Message
 
-from catabot import utils
+from catabot import github, metrics, utils
+from catabot.releases import Release, ReleaseIndex, ReleaseSync, release_build
+from download_data import RELEASES_CACHE_DIR
+
+if TYPE_CHECKING:
+    from telebot.async_telebot import AsyncTeleBot
 
 CATADDA_GIT_API = "https://api.github.com/repos/CleverRaven/Cataclysm-DDA/releases"
 CATATAIRESH_GIT_API = "https://api.github.com/repos/Tairesh/Cataclysm-DDA/releases"
@@ -42,10 +46,14 @@ class Mode(Enum):
     INVALID = auto()
 
 
-def get_release(bot: TeleBot, message: Message):
-    bot.send_chat_action(message.chat.id, 'typing')
-    keyword = utils.get_keyword(message, False).lower().strip()
+# Yielded by a release lookup when the first page of releases wasn't enough, to let the user know it takes a while
+SLOW = object()
+SLOW_TEXT = "🤔 I did not find a suitable version on the first page, please wait a little."
 
+Lookup = Generator[object, object, Optional[Tuple[str, dict]]]
+
+
+def _parse_keyword(keyword: str) -> (Mode, object, str):
     mode = Mode.LAST
     fork = None
     version = None
@@ -91,97 +99,196 @@ def get_release(bot: TeleBot, message: Message):
     else:
         api = CATADDA_GIT_API
 
-    def _last_release() -> int:
-        return int(json.loads(urllib.request.urlopen(api).read())[0]['name'].split('#').pop())
-
-    def _links_from_assets(assets) -> dict:
-        links = {
-            LINUX: None,
-            WINDOWS: None,
-            OSX: None,
-            ANDROID: None,
-        }
-
-        asset_names_by_platform = {
-            LINUX: LINUX_ASSET_NAMES,
-            OSX: OSX_ASSET_NAMES,
-            WINDOWS: WINDOWS_ASSET_NAMES,
-            WINDOWS32: WINDOWS32_ASSET_NAMES,
-            ANDROID: ANDROID_ASSET_NAMES,
-            ANDROID32: ANDROID32_ASSET_NAMES,
-        }
-
-        for platform in asset_names_by_platform:
-            for asset in assets:
-                for s in asset_names_by_platform[platform]:
-                    if s in asset['name']:
-                        links[platform] = asset['browser_download_url']
-                        break
-        return links
-
-    def _send_links(name, links):
-        text = name + ':\n\n'
-        for platform, link in links.items():
-            text += platform + ': '
-            if link:
-                file = link.split('/').pop()
-                text += f'<a href="{link}">{file}</a>\n'
-            else:
-                text += 'not compiled\n'
-        bot.reply_to(message, text, parse_mode='html')
+    return mode, version, api
 
-    def _release_name(release):
-        name = release['name'] if release['name'] else release['tag_name']
-        date = release['published_at'].replace('T', ' ').replace('Z', '')
-        return f"Release <b>{name}</b> <i>{date}</i>"
 
-    if mode == Mode.INVALID:
-        cmd = utils.get_command(message)
-        bot.reply_to(message, "Usage example:\n"
-                              f"`{cmd}` — latest experimental release\n"
-                              f"`{cmd} all` — last experimental release, builded for all platforms\n"
-                              f"`{cmd} windows|linux|osx|android` — last (successful) release, builded for selected platform\n"
-                              f"`{cmd} stable` — last stable release\n"
-                              f"`{cmd} bn` — Cataclysm: Bright Nights last release", parse_mode='Markdown')
-        return
-    elif mode == Mode.VERSION:
-        delta = _last_release() - version
-        page = int(delta / 100) + 1
-        data = json.loads(urllib.request.urlopen(api + f'?page={page}&per_page=100').read())
-
-        for release in data:
-            if release['name'].endswith(keyword):
-                _send_links(_release_name(release), _links_from_assets(release['assets']))
-                return
+def _links_from_assets(assets) -> dict:
+    links = {
+        LINUX: None,
+        WINDOWS: None,
+        OSX: None,
+        ANDROID: None,
+    }
+
+    asset_names_by_platform = {
+        LINUX: LINUX_ASSET_NAMES,
+        OSX: OSX_ASSET_NAMES,
+        WINDOWS: WINDOWS_ASSET_NAMES,
+        WINDOWS32: WINDOWS32_ASSET_NAMES,
+        ANDROID: ANDROID_ASSET_NAMES,
+        ANDROID32: ANDROID32_ASSET_NAMES,
+    }
+
+    for platform in asset_names_by_platform:
+        for asset in assets:
+            for s in asset_names_by_platform[platform]:
+                if s in asset['name']:
+                    links[platform] = asset['browser_download_url']
+                    break
+    return links
+
+
+def _links_text(name, links) -> str:
+    text = name + ':\n\n'
+    for platform, link in links.items():
+        text += platform + ': '
+        if link:
+            file = link.split('/').pop()
+            text += f'<a href="{link}">{file}</a>\n'
+        else:
+            text += 'not compiled\n'
+    return text
+
+
+def _to_release(release: dict) -> Release:
+    name = release['name'] if release['name'] else release['tag_name']
+    return Release(release['id'], name, release['published_at'], release_build(name), _links_from_assets(release['assets']))
+
+
+def _release_name(release: Release):
+    date = release.published.replace('T', ' ').replace('Z', '')
+    return f"Release <b>{release.name}</b> <i>{date}</i>"
+
+
+release_indexes = {
+    api: ReleaseIndex(api, os.path.join(RELEASES_CACHE_DIR, f'{fork}.json'), _to_release)
+    for fork, api in (('dda', CATADDA_GIT_API), ('bn', CATABN_GIT_API), ('tairesh', CATATAIRESH_GIT_API))
+}
+release_sync = ReleaseSync(list(release_indexes.values()))
+
+# Returned by an index lookup when the index can't tell, so GitHub has to be asked
+NOT_INDEXED = object()
+
+
+@metrics.timed('search')
+def _from_index(mode: Mode, version, api: str):
+    """Release name and links from the local release index, None if there is no such release"""
+    index = release_indexes[api]
+    if not index.synced:
+        return NOT_INDEXED
+    if mode == Mode.VERSION:
+        if not index.covers_build(version):
+            return NOT_INDEXED
+        release = index.build(version)
     elif mode == Mode.STABLE:
-        release = json.loads(urllib.request.urlopen(api + '/latest').read())
-        _send_links(_release_name(release), _links_from_assets(release['assets']))
-        return
+        release = index.stable()
+    elif mode == Mode.PLATFORM:
+        release = index.latest_for(version)
+        return (_release_name(release), {version: release.links[version]}) if release else None
+    elif mode == Mode.ALL:
+        release = index.latest_complete()
     else:
-        page = 1
-        tmp_message = None
-        while page < 10:
-            data = json.loads(urllib.request.urlopen(api + f'?page={page}&per_page=100').read())
-            for release in data:
-                links = _links_from_assets(release['assets'])
-                if (mode == Mode.PLATFORM and version in links and links[version]) \
-                        or (mode == Mode.ALL and all(links.values())) \
-                        or mode == Mode.LAST:
-                    _send_links(_release_name(release), {version: links[version]} if mode == Mode.PLATFORM else links)
-                    if tmp_message:
-                        try:
-                            bot.delete_message(tmp_message.chat.id, tmp_message.message_id)
-                        except ApiException:
-                            pass
-                    return
-            if page == 1:
-                tmp_message = bot.reply_to(message, "🤔 I did not find a suitable version on the first page,"
-                                                    " please wait a little.")
-            page += 1
+        release = index.latest()
+    return (_release_name(release), release.links) if release else None
+
+
+def _usage(cmd: str) -> str:
+    return "Usage example:\n" \
+           f"`{cmd}` — latest experimental release\n" \
+           f"`{cmd} all` — last experimental release, builded for all platforms\n" \
+           f"`{cmd} windows|linux|osx|android` — last (successful) release, builded for selected platform\n" \
+           f"`{cmd} stable` — last stable release\n" \
+           f"`{cmd} bn` — Cataclysm: Bright Nights last release"
+
+
+def _lookup(mode: Mode, version, keyword: str, api: str) -> Lookup:
+    """
+    Find a release on GitHub without doing any I/O: yields GitHub API urls and receives their decoded JSON
+    (or yields :data:`SLOW` and receives None), returns the release name and its links or None.
+    Only used for what the release index doesn't know yet
+    """
+    if mode == Mode.VERSION:
+        last_release = int((yield api)[0]['name'].split('#').pop())
+        page = int((last_release - version) / 100) + 1
+        for release in (yield api + f'?page={page}&per_page=100'):
+            if release['name'].endswith(keyword):
+                release = _to_release(release)
+                return _release_name(release), release.links
+        return None
+    elif mode == Mode.STABLE:
+        release = _to_release((yield api + '/latest'))
+        return _release_name(release), release.links
+
+    for page in range(1, 10):
+        for release in (yield api + f'?page={page}&per_page=100'):
+            release = _to_release(release)
+            links = release.links
+            if (mode == Mode.PLATFORM and version in links and links[version]) \
+                    or (mode == Mode.ALL and all(links.values())) \
+                    or mode == Mode.LAST:
+                return _release_name(release), {version: links[version]} if mode == Mode.PLATFORM else links
+        if page == 1:
+            yield SLOW
+    return None
+
+
+@metrics.timed('github')
+def _fetch_json(url: str):
+    return github.client.get_json(url)
+
+
+def _release_reply(keyword: str, command: str) -> Generator[object, object, Optional[Tuple[str, str]]]:
+    """
+    Reply to a release command without doing any I/O: yields what :func:`_lookup` yields and returns
+    the text and parse mode of the reply or None if no release was found
+    """
+    mode, version, api = _parse_keyword(keyword)
+    if mode == Mode.INVALID:
+        return _usage(command), 'Markdown'
+    found = _from_index(mode, version, api)
+    if found is NOT_INDEXED:
+        found = yield from _lookup(mode, version, keyword, api)
+    return (_links_text(*found), 'html') if found else None
+
+
+def get_release(bot: TeleBot, message: Message):
+    bot.send_chat_action(message.chat.id, 'typing')
+    lookup = _release_reply(utils.get_keyword(message, False).lower().strip(), utils.get_command(message))
+    tmp_message = None
+    try:
+        request = next(lookup)
+        while True:
+            if request is SLOW:
+                tmp_message = bot.reply_to(message, SLOW_TEXT)
+                request = lookup.send(None)
+            else:
+                request = lookup.send(_fetch_json(request))
+    except StopIteration as stop:
+        reply = stop.value
+
+    if reply:
+        text, parse_mode = reply
+        bot.reply_to(message, text, parse_mode=parse_mode)
+    if tmp_message:
+        utils.delete_message(bot, tmp_message)
+    if not reply:
+        bot.send_sticker(message.chat.id, utils.NOT_FOUND_STICKER, message.message_id)
+
+
+async def _async_fetch_json(url: str):
+    with metrics.phase('github'):
+        return await github.client.get_json_async(url)
+
+
+async def async_get_release(bot: 'AsyncTeleBot', message: Message):
+    await bot.send_chat_action(message.chat.id, 'typing')
+    lookup = _release_reply(utils.get_keyword(message, False).lower().strip(), utils.get_command(message))
+    tmp_message = None
+    try:
+        request = next(lookup)
+        while True:
+            if request is SLOW:
+                tmp_message = await bot.reply_to(message, SLOW_TEXT)
+                request = lookup.send(None)
+            else:
+                request = lookup.send(await _async_fetch_json(request))
+    except StopIteration as stop:
+        reply = stop.value
 
+    if reply:
+        text, parse_mode = reply
+        await bot.reply_to(message, text, parse_mode=parse_mode)
     if tmp_message:
-        try:
-            bot.delete_message(tmp_message.chat.id, tmp_message.message_id)
-        except ApiException:
-            pass
-    bot.send_sticker(message.chat.id, 'CAADAgADxgADOtDfAeLvpRcG6I1bFgQ', message.message_id)
+        await utils.async_delete_message(bot, tmp_message)
+    if not reply:
+        await bot.send_sticker(message.chat.id, utils.NOT_FOUND_STICKER, message.message_id)
@@ -1,13 +1,21 @@
 import json
-import logging
 import math
-from typing import List, Union
+from typing import TYPE_CHECKING, Callable, List, NamedTuple, Optional, Tuple
 
 from telebot import TeleBot
-from telebot.types import Message, InlineKeyboardMarkup, InlineKeyboardButton
+from telebot.types import (Message, InlineKeyboardMarkup, InlineKeyboardButton, InlineQuery, InlineQueryResultArticle,
+                           InputTextMessageContent)
 
-from catabot import utils
-from download_data import ALL_DATA_FILE
+from catabot import metrics, utils
+from catabot.armor import BODY_PARTS, PROTECTION, STATS, parse_top, stat_value
+from catabot.cache import LRUCache
+from catabot.columns import CATEGORIES, NUMERIC, QueryError, parse_query
+from catabot.reverse_index import item_qualities
+from catabot.sessions import Session, SessionStore
+from catabot.snapshot import Snapshot, row_name, snapshots
+
+if TYPE_CHECKING:
+    from telebot.async_telebot import AsyncTeleBot
 
 
 NUMBERS_EMOJI = {
@@ -23,251 +31,189 @@ NUMBERS_EMOJI = {
     10: "🔟",
 }
 
-raw_data = {
-    'version': None,
-    'item': {},
-    'uncraft': {},
-    'recipe': {},
-    'material': {},
-    'monster': {},
-    'ammunition_type': {},
-    'requirement': {},
-    'tool_quality': {},
-    'proficiency': {},
-}
+# Actions that list items related to the keyword instead of searching for it
+LISTINGS = {'fits', 'flag', 'find', 'top', 'used_in'}
 
+# Rendered views by (build, action, row id), a view never changes within a build
+views = LRUCache(max_items=4096, max_bytes=32 * 1024 * 1024)
+snapshots.on_swap(lambda _: views.clear())
 
-def _update_data():
-    data_json = json.load(open(ALL_DATA_FILE, 'r'))
-    version = data_json['build_number']
-    if raw_data['version'] != version:
-        for key in raw_data:
-            if key == "version":
-                raw_data["version"] = version
-            else:
-                raw_data[key].clear()
-        typs = set()
-        for row in data_json['data']:
-            typ = _mapped_type(row['type'])
-            if typ == 'item':
-                if 'id' in row:
-                    row_id = row['id']
-                elif 'abstract' in row:
-                    row_id = row['abstract']
-                else:
-                    logging.warning('no id and no abstract: {}', row)
-                    continue
-                raw_data['item'][row_id] = row
-            elif typ == 'recipe':
-                # TODO: there are some abstract craft recipes
-                if 'result' in row and 'category' in row and row['category'] != 'CC_BUILDING' and \
-                        ('on_display' not in row or row['on_display']):
-                    if row['result'] in raw_data['recipe']:
-                        raw_data['recipe'][row['result']].append(row)
-                    else:
-                        raw_data['recipe'][row['result']] = [row, ]
-            elif typ == 'uncraft' and 'result' in row:  # TODO: there are some abstract uncraft recipes
-                if row['result'] in raw_data['uncraft']:
-                    raw_data['uncraft'][row['result']].append(row)
-                else:
-                    raw_data['uncraft'][row['result']] = [row, ]
-            elif typ == 'material':
-                if 'id' in row:
-                    row_id = row['id']
-                elif 'abstract' in row:
-                    row_id = row['abstract']
-                else:
-                    logging.warning('no id and no abstract: {}', row)
-                    continue
-                raw_data['material'][row_id] = row
-            elif typ == 'monster':
-                if 'id' in row:
-                    row_id = row['id']
-                elif 'abstract' in row:
-                    row_id = row['abstract']
-                else:
-                    logging.warning('no id and no abstract: {}', row)
-                    continue
-                raw_data['monster'][row_id] = row
-            elif typ == 'ammunition_type':
-                raw_data['ammunition_type'][row['id']] = row
-            elif typ == 'requirement':
-                raw_data['requirement'][row['id']] = row
-            elif typ == 'tool_quality':
-                raw_data['tool_quality'][row['id']] = row
-            elif typ == 'proficiency':
-                raw_data['proficiency'][row['id']] = row
-            else:
-                typs.add(typ)
-        # print(typs)
-        for typ in {'item', 'material', 'monster'}:
-            for row in raw_data[typ].values():
-                if 'copy-from' in row:
-                    _add_copy_from(typ, row)
-                if 'volume' not in row:
-                    row['volume'] = 0
-                if 'weight' not in row:
-                    row['weight'] = 0
-        for rows_row in raw_data['recipe'].values():
-            for row in rows_row:
-                if 'reversible' in row and row['reversible']:
-                    if row['result'] in raw_data['uncraft']:
-                        raw_data['uncraft'][row['result']].append(row)
-                    else:
-                        raw_data['uncraft'][row['result']] = [row, ]
-
-
-def _add_copy_from(typ: str, row: dict):
-    if 'copy-from' in row:
-        fr = raw_data[typ][row['copy-from']]
-        row.pop('copy-from')
-        for key in fr:
-            if key not in row and key != 'abstract':
-                row[key] = fr[key]
-        _add_copy_from(typ, row)
-
-
-def _name(row: dict) -> str:
-    if 'name' in row:
-        if isinstance(row['name'], str):
-            return row['name']
-        elif 'str' in row['name']:
-            return row['name']['str']
-        elif 'str_sp' in row['name']:
-            return row['name']['str_sp']
-    if 'id' in row:
-        return row['id']
-    return ''
-
-
-def _names(row: dict) -> List[str]:
-    names = []
-    if 'name' in row:
-        if isinstance(row['name'], str):
-            names.append(row['name'])
-        elif 'str' in row['name']:
-            names.append(row['name']['str'])
-        elif 'str_sp' in row['name']:
-            names.append(row['name']['str_sp'])
-    if 'id' in row:
-        names.append(row['id'])
-    return names
-
-
-def _match_row(row: dict, keyword: str) -> bool:
-    return any(keyword.lower() in n.lower() for n in _names(row))
-
-
-def _mapped_type(typ: str) -> str:
-    if typ in {"AMMO", "GUN", "ARMOR", "PET_ARMOR", "TOOL", "TOOLMOD", "TOOL_ARMOR", "BOOK",
-               "COMESTIBLE", "ENGINE", "WHEEL", "GUNMOD", "MAGAZINE", "BATTERY", "GENERIC", "BIONIC_ITEM"}:
-        return "item"
-    elif typ == "city_building":
-        return "overmap_special"
-    else:
-        return typ.lower()
+sessions = SessionStore()
+metrics.watch_cache('views', views)
+metrics.watch_cache('sessions', sessions)
 
+# Items matching a /find query kept for paging
+FIND_RESULTS = 100
+FIND_USAGE = "Usage example:\n" \
+             f"<code>{utils.escape('/find type:ARMOR covers:torso warmth>=20 weight<1kg sort:-coverage')}</code>\n\n" \
+             f"Numbers (compare with {utils.escape('< <= > >= = !=')}, weight, volume and length can have units): " \
+             f"{', '.join(NUMERIC)}\n" \
+             f"Categories (<code>field:value,value</code>): {', '.join(CATEGORIES)}\n" \
+             "Sorting: <code>sort:field</code>, <code>sort:-field</code> for the most first"
 
-def _search_results(typ, keyword: str) -> list:
-    results = []
-    for row in raw_data[typ].values():
-        if 'id' in row and _match_row(row, keyword) and row['id'] in raw_data[typ]:
-            results.append(row)
-    return results
+# Crafting tree views by the metric their recipes are picked by, and how much of a tree they show
+TREE_ACTIONS = {'tree': 'time', 'tree_components': 'components'}
+TREE_LINES = 20
+TREE_MATERIALS = 15
 
+# Armor listed by /top
+TOP_RESULTS = 50
+TOP_USAGE = "Usage example:\n<code>/top torso cut 10</code> (the best cut protection for the torso with encumbrance " \
+            "up to 10)\n\n" \
+            f"Body parts: {', '.join(BODY_PARTS)}\n" \
+            f"Stats: {', '.join(STATS)}"
+
+# Inline mode: results per query and how long Telegram may reuse an answer to the same query
+INLINE_RESULTS = 10
+INLINE_CACHE_TIME = 300
+
+
+@metrics.timed('load')
+def _current() -> Snapshot:
+    return snapshots.current()
 
-def _page_view(results: list, keyword: str, action: str, page: int = 1) -> (str, InlineKeyboardMarkup):
-    maxpage = int(len(results) / 10)
-    results = results[(page - 1) * 10: page * 10:]
-    typ = 'monster' if action == 'monster' else 'item'
 
-    text = f"Search results for {action} {keyword}:\n\n"
+def _search_results(raw_data: Snapshot, typ, keyword: str) -> list:
+    return raw_data.search_index[typ].search(keyword)
+
+
+def _fuzzy_results(raw_data: Snapshot, typ, keyword: str) -> list:
+    return raw_data.fuzzy_index[typ].search(keyword)
+
+
+@metrics.timed('search')
+def _find(raw_data: Snapshot, typ, keyword: str) -> (list, bool):
+    """Ids of rows with `keyword` in their names or, if there are none, of the closest ones; and whether they are fuzzy"""
+    results = _search_results(raw_data, typ, keyword)
+    if results:
+        return results, False
+    return _fuzzy_results(raw_data, typ, keyword), True
+
+
+def _fits(raw_data: Snapshot, row_id: str) -> list:
+    """Items that can be put into the restricted pockets of `row_id`: magazines, batteries, ammo"""
+    data = raw_data['item'][row_id]
+    fits = []
+    for pocket in data['pocket_data'] if 'pocket_data' in data else []:
+        if 'flag_restriction' in pocket:
+            fits += raw_data.flag_index.lookup(pocket['flag_restriction'])
+        if 'ammo_restriction' in pocket:
+            fits += raw_data.ammo_index.lookup(pocket['ammo_restriction'])
+        if 'item_restriction' in pocket:
+            fits += pocket['item_restriction']
+    return [item_id for item_id in dict.fromkeys(fits)
+            if item_id in raw_data['item'] and 'id' in raw_data['item'][item_id]]
+
+
+def _used_in(raw_data: Snapshot, row_id: str) -> list:
+    """Items with craft recipes using `row_id` as a component, a tool or a byproduct, then the ones using its qualities"""
+    uses = raw_data.used_in.lookup([row_id])
+    uses += raw_data.quality_used_in.lookup(item_qualities(raw_data['item'][row_id]))
+    return [item_id for item_id in dict.fromkeys(uses) if item_id in raw_data['item']]
+
+
+def _is_used(raw_data: Snapshot, row_id: str, data: dict) -> bool:
+    return row_id in raw_data.used_in.postings or \
+        any(quality in raw_data.quality_used_in.postings for quality in item_qualities(data))
+
+
+def _has_restricted_pockets(data: dict) -> bool:
+    return 'pocket_data' in data and any(
+        'flag_restriction' in p or 'ammo_restriction' in p or 'item_restriction' in p for p in data['pocket_data']
+    )
+
+
+@metrics.timed('search')
+def _listing_results(raw_data: Snapshot, action: str, keyword: str) -> list:
+    if action == 'fits':
+        return _fits(raw_data, keyword)
+    elif action == 'flag':
+        return [item_id for item_id in raw_data.flag_index.lookup([keyword]) if 'id' in raw_data['item'][item_id]]
+    elif action == 'find':
+        return raw_data.item_columns.find(parse_query(keyword), FIND_RESULTS)[0]
+    elif action == 'top':
+        part, stat, max_encumbrance = parse_top(keyword)
+        return raw_data.armor_boards.top(part, stat, TOP_RESULTS, max_encumbrance)
+    elif action == 'used_in':
+        return _used_in(raw_data, keyword)
+    return []
+
+
+def _results_view(raw_data: Snapshot, results: list, keyword: str, action: str,
+                  fuzzy: bool = False) -> (str, InlineKeyboardMarkup):
+    session = Session(raw_data.version, action, keyword, tuple(results), fuzzy)
+    return _page_view(raw_data, sessions.put(session), session)
+
+
+@metrics.timed('render')
+def _page_view(raw_data: Snapshot, token: str, session: Session, page: int = 1) -> (str, InlineKeyboardMarkup):
+    action, keyword = session.action, session.keyword
+    maxpage = max(math.ceil(len(session.ids) / 10), 1)
+    typ = 'monster' if action == 'monster' else 'item'
+    # results of an older build can refer to rows that are gone now
+    results = [row_id for row_id in session.ids[(page - 1) * 10: page * 10:] if row_id in raw_data[typ]]
+    # listings are lists of items, their buttons open item descriptions (recipes for what uses an item)
+    view_action = 'craft' if action == 'used_in' else 'view' if action in LISTINGS else action
+
+    if action == 'fits':
+        text = f"What fits in {_item_name(raw_data, keyword)}:\n\n"
+    elif action == 'flag':
+        text = f"Items with flag {keyword}:\n\n"
+    elif action == 'used_in':
+        text = f"What uses {_item_name(raw_data, keyword)}:\n\n"
+    elif action == 'find':
+        text = f"Items matching <code>{utils.escape(keyword)}</code>:\n\n"
+        sort = parse_query(keyword).sort
+    elif action == 'top':
+        part, stat, max_encumbrance = parse_top(keyword)
+        text = f"Best armor for the {part} by {stat + ' protection' if stat in PROTECTION else stat}"
+        text += f" with encumbrance up to {max_encumbrance:g}:\n\n" if max_encumbrance is not None else ":\n\n"
+    elif session.fuzzy:
+        text = f"Nothing found for {action} {keyword}, closest matches:\n\n"
+    else:
+        text = f"Search results for {action} {keyword}:\n\n"
     btns = []
 
-    for i, row in enumerate(results):
+    for i, row_id in enumerate(results):
         btns.append(InlineKeyboardButton(
             text=NUMBERS_EMOJI[i + 1],
-            callback_data=f"cdda:{action}:{row['id']}"
+            callback_data=f"cdda:{view_action}:{row_id}"
         ))
-        text += f"{NUMBERS_EMOJI[i + 1]} {_link_name(typ, row['id'])}"
-        if action == 'craft' and row['id'] not in raw_data['recipe']:
+        text += f"{NUMBERS_EMOJI[i + 1]} {_link_name(raw_data, typ, row_id)}"
+        if action in {'craft', 'tree'} and row_id not in raw_data['recipe']:
             text += " (can't be crafted)"
-        if action == 'uncraft' and row['id'] not in raw_data['uncraft']:
+        if action == 'uncraft' and row_id not in raw_data['uncraft']:
             text += " (can't be disassembled)"
+        if action == 'find' and sort is not None:
+            text += _sort_value(raw_data, sort, row_id)
+        if action == 'top':
+            text += _top_values(raw_data['item'][row_id], part, stat)
         text += '\n'
-    text += f"\n(page {page} of {maxpage+1})"
+    text += f"\n(page {page} of {maxpage})"
     markup = InlineKeyboardMarkup(row_width=5)
     markup.add(*btns)
     btm_row = []
     if page > 1:
-        btm_row.append(InlineKeyboardButton(text="⬅️ Prev.", callback_data=f"cdda_page{page - 1}_{action}:{keyword}"))
+        btm_row.append(InlineKeyboardButton(text="⬅️ Prev.", callback_data=f"cdda_page{page - 1}:{token}"))
     btm_row.append(InlineKeyboardButton(text="❌ Cancel", callback_data="cdda_cancel"))
-    if page <= maxpage:
-        btm_row.append(InlineKeyboardButton(text="➡ Next️️", callback_data=f"cdda_page{page + 1}_{action}:{keyword}"))
+    if page < maxpage:
+        btm_row.append(InlineKeyboardButton(text="➡ Next️️", callback_data=f"cdda_page{page + 1}:{token}"))
     markup.add(*btm_row)
     return text, markup
 
 
-def _parse_volume(vol: Union[str, int]) -> int:
-    if not vol:
-        return 0
-    if isinstance(vol, int):
-        return vol * 250
-    try:
-        if vol.lower().endswith("ml"):
-            return int(vol[:-2].strip())
-        if vol.lower().endswith("l"):
-            return int(vol[:-1].strip()) * 1000
-    except ValueError:
-        logging.warning("invalid volume: {}", vol)
-    return 0
-
-
-def _parse_mass(weight: Union[str, int]) -> float:
-    if not weight:
-        return 0
-    if isinstance(weight, int):
-        return weight
-    try:
-        if weight.lower().endswith("mg"):
-            return int(weight[:-2].strip()) / 1000
-        if weight.lower().endswith("kg"):
-            return int(weight[:-2].strip()) * 1000
-        if weight.lower().endswith("g"):
-            return int(weight[:-1].strip())
-    except ValueError:
-        logging.warning("invalid weight: {}", weight)
-    return 0
-
-
-def _mpa(row: dict) -> int:
-    return math.floor(65 + math.floor(_parse_volume(row['volume']) / 62.5) + math.floor(_parse_mass(row['weight']) / 60.0))
-
-
-def _item_length(row: dict) -> str:
-    if 'longest_side' in row:
-        return row['longest_side']
-    return f"{round(_parse_volume(row['volume']) ** (1.0/3.0))} cm"
-
+def _sort_value(raw_data: Snapshot, sort: str, row_id: str) -> str:
+    """Value of the attribute /find results are sorted by"""
+    column = NUMERIC[sort]
+    value = column.value(raw_data['item'][row_id])
+    return '' if value is None else f" ({sort} {value:.4g}{' ' if column.unit.isalpha() else ''}{column.unit})"
 
-def _compute_to_hit(to_hit: Union[int, dict]) -> int:
-    if isinstance(to_hit, int):
-        return to_hit
-    return -2 + {'bad': -1, 'none': 0, 'solid': 1, 'weapon': 2}[to_hit['grip']] + \
-        {'hand': 0, 'short': 1, 'long': 2}[to_hit['length']] + \
-        {'point': -2, 'line': -1, 'any': 0, 'every': 1}[to_hit['surface']] + \
-        {'clumsy': -2, 'uneven': -1, 'neutral': 0, 'good': 1}[to_hit['balance']]
 
-
-def _covers(row: dict, body_part: str) -> bool:
-    if 'covers' in row:
-        if body_part in row['covers']:
-            return True
-    if 'armor' in row:
-        if any(body_part in a['covers'] for a in row['armor']):
-            return True
-
-    return False
+def _top_values(row, part: str, stat: str) -> str:
+    """Stat /top results are sorted by and the encumbrance of the body part"""
+    values = [(name, stat_value(row, part, name)) for name in dict.fromkeys((stat, 'encumbrance'))]
+    values = [f"{name} {value:.4g}{'%' if name == 'coverage' else ''}" for name, value in values if value is not None]
+    return f" ({', '.join(values)})" if values else ''
 
 
 def _part_name(part: str) -> str:
@@ -279,28 +225,35 @@ def _part_name(part: str) -> str:
     return part
 
 
-def _link_name(typ: str, row_id: str) -> str:
+def _link_name(raw_data: Snapshot, typ: str, row_id: str) -> str:
     data = raw_data[typ][row_id]
-    return f"<a href=\"https://nornagon.github.io/cdda-guide/#/{typ}/{row_id}\">{utils.escape(_name(data))}</a>"
+    return f"<a href=\"https://nornagon.github.io/cdda-guide/#/{typ}/{row_id}\">{utils.escape(row_name(data))}</a>"
+
 
+def _raw_json(raw_data: Snapshot, typ: str, row_id: str) -> str:
+    value = raw_data.raw.get(typ, row_id)
+    if value is None:
+        return "<i>Raw JSON of this game data is not available anymore</i>"
+    return f"<code>{json.dumps(value, indent=2)}</code>"
 
-def _view_item(row_id: str, raw=False) -> (str, InlineKeyboardMarkup):
+
+def _view_item(raw_data: Snapshot, row_id: str, raw=False) -> (str, InlineKeyboardMarkup):
     # this is basically a poor copy of https://github.com/nornagon/cdda-guide/blob/main/src/types/Item.svelte
     data = raw_data['item'][row_id]
     if raw:
-        text = f"<code>{json.dumps(data, indent=2)}</code>"
+        text = _raw_json(raw_data, 'item', row_id)
     else:
-        text = f"{_link_name('item', row_id)}\n" \
+        text = f"{_link_name(raw_data, 'item', row_id)}\n" \
                f"<i>{data['description']}</i>\n\n" \
-               f"Materials: {', '.join(data['material']) if 'material' in data else 'None'}\n" \
+               f"Materials: {', '.join(data['materials']) if 'material' in data else 'None'}\n" \
                f"Volume: {data['volume']}\n" \
                f"Weight: {data['weight']}\n" \
-               f"Length: {_item_length(data)}\n" \
+               f"Length: {data['length']}\n" \
                f"Flags: {', '.join(data['flags']) if 'flags' in data and len(data['flags']) > 0 else 'None'}\n"
         # TODO: flags' descriptions
         # TODO: possible faults
         if 'qualities' in data:
-            qualities = map(lambda q: f"{_name(raw_data['tool_quality'][q[0]])} ({q[1]})", data['qualities'])
+            qualities = map(lambda q: f"{row_name(raw_data['tool_quality'][q[0]])} ({q[1]})", data['qualities'])
             text += f"Qualities: {', '.join(qualities)}\n"
         # TODO: vehicle parts
         # TODO: ascii_picture
@@ -310,22 +263,23 @@ def _view_item(row_id: str, raw=False) -> (str, InlineKeyboardMarkup):
             text += "\nArmor:\n"
             text += "Covers: "
             covers = ""
-            if _covers(data, "head"):
+            covered = data['covered']
+            if "head" in covered:
                 covers += "The head. "
-            if _covers(data, "eyes"):
+            if "eyes" in covered:
                 covers += "The eyes. "
-            if _covers(data, "mouth"):
+            if "mouth" in covered:
                 covers += "The mouth. "
-            if _covers(data, "torso"):
+            if "torso" in covered:
                 covers += "The torso. "
             for sg, pl in [("arm", "arms"), ("hand", "hands"), ("leg", "legs"), ("foot", "feet")]:
-                if 'sided' in data and data['sided'] and (_covers(data, sg+'_l') or _covers(data, sg+'_r')):
+                if 'sided' in data and data['sided'] and (sg+'_l' in covered or sg+'_r' in covered):
                     covers += f"Either {sg}. "
-                elif _covers(data, sg+'_l') and _covers(data, sg+'_r'):
+                elif sg+'_l' in covered and sg+'_r' in covered:
                     covers += f"The {pl}. "
-                elif _covers(data, sg+'_l'):
+                elif sg+'_l' in covered:
                     covers += f"The left {sg}. "
-                elif _covers(data, sg+'_r'):
+                elif sg+'_r' in covered:
                     covers += f"The right {sg}. "
             if not covers:
                 covers = "Nothing."
@@ -349,10 +303,10 @@ def _view_item(row_id: str, raw=False) -> (str, InlineKeyboardMarkup):
             text += f"\nWarmth: {data['warmth'] if 'warmth' in data else 0}\n"
             if 'armor' in data:
                 text += "Encumbrance:\n"
-                for apd in data['armor']:
-                    text += f"{', '.join(map(_part_name, apd['covers']))}: "
-                    text += str(apd['encumbrance']) if isinstance(apd['encumbrance'], int) else \
-                        f"{apd['encumbrance'][0]} ({apd['encumbrance'][1]} when full)"
+                for portion in data['armor_portions']:
+                    text += f"{', '.join(map(_part_name, portion.covers))}: "
+                    text += str(portion.encumbrance) if portion.max_encumbrance is None else \
+                        f"{portion.encumbrance} ({portion.max_encumbrance} when full)"
                     text += "\n"
             else:
                 text += f"Encumbrance: {data['encumbrance'] if 'encumbrance' in data else 0}"
@@ -363,35 +317,21 @@ def _view_item(row_id: str, raw=False) -> (str, InlineKeyboardMarkup):
             text += "Coverage: "
             if 'armor' in data:
                 text += '\n'
-                for apd in data['armor']:
-                    text += f"{', '.join(map(_part_name, apd['covers']))}: "
-                    text += f"{apd['coverage'] if 'coverage' in apd else 0}%\n"
+                for portion in data['armor_portions']:
+                    text += f"{', '.join(map(_part_name, portion.covers))}: "
+                    text += f"{portion.coverage}%\n"
             else:
                 text += f"{data['coverage'] if 'coverage' in data else 0}\n"
-            if 'environmental_protection' in data or ('material' in data and len(data['material']) > 0):
+            if 'protection' in data:
                 text += "Protection:\n"
-                env = data['environmental_protection'] if 'environmental_protection' in data else 0
-                thickness = data['material_thickness'] if 'material_thickness' in data else 0
-                if 'material' in data:
-                    materials = [data['material']] if isinstance(data['material'], str) else data['material']
-
-                    def _resist_sum(r) -> int:
-                        return sum(raw_data['material'][m][r] for m in materials if r in raw_data['material'][m])
-
-                    bash = (_resist_sum('bash_resist') * thickness) / len(materials)
-                    cut = (_resist_sum('cut_resist') * thickness) / len(materials)
-                    bullet = (_resist_sum('bullet_resist') * thickness) / len(materials)
-                    acid = _resist_sum('acid_resist') / len(materials)
-                    fire = _resist_sum('fire_resist') / len(materials)
-                    if env < 10:
-                        acid *= env / 10
-                        fire *= env / 10
-                    text += f"Bash: {bash:.2}\n"
-                    text += f"Cut: {cut:.2}\n"
-                    text += f"Ballistic: {bullet:.2}\n"
-                    text += f"Acid: {acid:.2}\n"
-                    text += f"Fire: {fire:.2}\n"
-                text += f"Environmental: {env}\n"
+                protection = data['protection']
+                if data['materials']:
+                    text += f"Bash: {protection.bash:.2}\n"
+                    text += f"Cut: {protection.cut:.2}\n"
+                    text += f"Ballistic: {protection.bullet:.2}\n"
+                    text += f"Acid: {protection.acid:.2}\n"
+                    text += f"Fire: {protection.fire:.2}\n"
+                text += f"Environmental: {protection.environmental}\n"
 
         if data['type'] in {'TOOL', 'TOOL_ARMOR'} and (
             'charges_per_use' in data or 'power_draw' in data or 'turns_per_charge' in data or 'sub' in data
@@ -404,7 +344,7 @@ def _view_item(row_id: str, raw=False) -> (str, InlineKeyboardMarkup):
             if 'turns_per_charge' in data:
                 text += f"Turns Per Charge: {data['turns_per_charge']}\n"
             if 'sub' in data:
-                text += f"Substitute: {_link_name('item', data['sub'])}\n"
+                text += f"Substitute: {_link_name(raw_data, 'item', data['sub'])}\n"
 
         # TODO: if data['type'] == 'ENGINE'
         if data['type'] == 'COMESTIBLE':
@@ -428,8 +368,8 @@ def _view_item(row_id: str, raw=False) -> (str, InlineKeyboardMarkup):
             else:
                 text += "Cut: "
             text += str(data['cutting'] if 'cutting' in data else 0)
-            text += f"\nTo Hit: {_compute_to_hit(data['to_hit']) if 'to_hit' in data else 0}"
-            text += f"\nMoves Per Attack: {_mpa(data)}\n"
+            text += f"\nTo Hit: {data['to_hit_bonus']}"
+            text += f"\nMoves Per Attack: {data['moves_per_attack']}\n"
             if 'techniques' in data:  # TODO: techniques names
                 text += f"Techniques: {str(data['techniques'])}\n"
 
@@ -492,18 +432,13 @@ def _view_item(row_id: str, raw=False) -> (str, InlineKeyboardMarkup):
                                      f"{'s' if max_charges > 1 else ''} of {raw_data['ammunition_type'][ammo_id]['name']}")
                     pocket_data.append(f"Supported Ammo Types: {' / '.join(ammos)}")
                 if 'flag_restriction' in pocket:
-                    items = []
-                    for item in raw_data['item'].values():
-                        if 'flags' in item:
-                            for flag in pocket['flag_restriction']:
-                                if flag in item['flags']:
-                                    items.append(_name(item))
-                                    break
+                    items = [row_name(raw_data['item'][item_id])
+                             for item_id in raw_data.flag_index.lookup(pocket['flag_restriction'])]
                     pocket_data.append(f"Supported Magazines: {' / '.join(items)}")
                 if 'item_restriction' in pocket:
                     items = []
                     for item_id in pocket['item_restriction']:
-                        items.append(_name(raw_data['item'][item_id]))
+                        items.append(row_name(raw_data['item'][item_id]))
                     pocket_data.append(f"Supported Magazines: {' / '.join(items)}")
                 text += '\n'.join(pocket_data) + '\n'
 
@@ -517,13 +452,82 @@ def _view_item(row_id: str, raw=False) -> (str, InlineKeyboardMarkup):
         buttons.append(InlineKeyboardButton("🛠 Craft", callback_data=f"cdda:craft:{row_id}"))
     if row_id in raw_data['uncraft']:
         buttons.append(InlineKeyboardButton("🛠 Disassemble", callback_data=f"cdda:uncraft:{row_id}"))
+    if _has_restricted_pockets(data):
+        buttons.append(InlineKeyboardButton("🧲 What fits", callback_data=f"cdda:fits:{row_id}"))
+    if _is_used(raw_data, row_id, data):
+        buttons.append(InlineKeyboardButton("🔗 Used in", callback_data=f"cdda:used_in:{row_id}"))
     markup.add(*buttons)
     return text, markup
 
 
-def _craft_item(row_id, raw=False, typ='recipe') -> (str, InlineKeyboardMarkup):
+def _uses_view(raw_data: Snapshot, row_id: str) -> (str, InlineKeyboardMarkup):
+    """Items crafted with `row_id` or a message that there are none"""
+    results = _used_in(raw_data, row_id)
+    if results:
+        return _results_view(raw_data, results, row_id, 'used_in')
+    markup = InlineKeyboardMarkup()
+    markup.add(InlineKeyboardButton("👀 Description", callback_data=f"cdda:view:{row_id}"))
+    return f"{_link_name(raw_data, 'item', row_id)} isn't used in any recipe", markup
+
+
+def _duration(seconds: float) -> str:
+    parts = []
+    for unit, length in (('d', 86400), ('h', 3600), ('m', 60), ('s', 1)):
+        if seconds >= length:
+            parts.append(f"{int(seconds // length)} {unit}")
+            seconds %= length
+    return ' '.join(parts) if parts else '0 s'
+
+
+def _amount(amount: float) -> str:
+    # batch recipes leave fractions of their components for one unit
+    return f"{round(amount, 2):g}"
+
+
+def _item_name(raw_data: Snapshot, item_id: str) -> str:
+    # expanded requirements and sessions of an older build can name items missing from the data
+    return _link_name(raw_data, 'item', item_id) if item_id in raw_data['item'] else utils.escape(item_id)
+
+
+def _tree_view(raw_data: Snapshot, row_id: str, metric: str) -> (str, InlineKeyboardMarkup):
+    """Crafting tree of an item down to raw materials, with the recipes and components picked by `metric`"""
+    if row_id not in raw_data['recipe']:
+        return _craft_item(raw_data, row_id)
+    nodes = raw_data.crafting.walk(row_id, metric)
+    _, _, _, cost = next(nodes)
+    # costs are per unit, the tree is shown for one craft of the chosen recipe
+    makes = raw_data.crafting.makes(raw_data['recipe'][row_id][cost.recipe])
+    text = f"Crafting tree for {f'{makes} ' if makes > 1 else ''}{_link_name(raw_data, 'item', row_id)} " \
+           f"({'the fastest' if metric == 'time' else 'the fewest components'}):\n\n"
+    for i, (depth, item_id, amount, node) in enumerate(nodes):
+        if i == TREE_LINES:
+            text += "...\n"
+            break
+        text += f"{'  ' * (depth - 1)}- {_amount(amount * makes)} {_item_name(raw_data, item_id)}"
+        text += f" ({_duration(node.time * amount * makes)})\n" if node.recipe >= 0 else '\n'
+    text += "\nRaw materials:\n"
+    for item_id, amount in sorted(cost.materials, key=lambda material: -material[1])[:TREE_MATERIALS]:
+        text += f"- {_amount(amount * makes)} {_item_name(raw_data, item_id)}\n"
+    if len(cost.materials) > TREE_MATERIALS:
+        text += f"- and {len(cost.materials) - TREE_MATERIALS} more\n"
+    text += f"Total Time: {_duration(cost.time * makes)}"
+    if not cost.complete:
+        text += "\n\n<i>Components crafted from themselves or too deep in the tree are counted as raw materials</i>"
+
+    markup = InlineKeyboardMarkup()
+    markup.add(
+        InlineKeyboardButton("👀 Description", callback_data=f"cdda:view:{row_id}"),
+        InlineKeyboardButton("🛠 Craft", callback_data=f"cdda:craft:{row_id}"),
+        InlineKeyboardButton("🧮 Fewest components", callback_data=f"cdda:tree_components:{row_id}")
+        if metric == 'time' else
+        InlineKeyboardButton("⏱ Fastest", callback_data=f"cdda:tree:{row_id}"),
+    )
+    return text, markup
+
+
+def _craft_item(raw_data: Snapshot, row_id, raw=False, typ='recipe') -> (str, InlineKeyboardMarkup):
     if row_id not in raw_data[typ]:
-        text = f"{_link_name('item', row_id)} " \
+        text = f"{_link_name(raw_data, 'item', row_id)} " \
                f"can't be {'crafted' if typ == 'recipe' else 'disassembled'}!"
         markup = InlineKeyboardMarkup()
         buttons = [InlineKeyboardButton("👀 Description", callback_data=f"cdda:view:{row_id}")]
@@ -536,13 +540,13 @@ def _craft_item(row_id, raw=False, typ='recipe') -> (str, InlineKeyboardMarkup):
 
     datas = raw_data[typ][row_id]
     if raw:
-        text = f"<code>{json.dumps(datas, indent=2)}</code>"
+        text = _raw_json(raw_data, typ, row_id)
         if len(text) > 4080:
-            text = "<code>" + str(datas)[:4080] + "</code>"
+            text = "<code>" + str(raw_data.raw.get(typ, row_id))[:4080] + "</code>"
     else:
         text = f"{'Craft' if typ == 'recipe' else 'Uncraft'} recipe{'s' if len(datas) > 1 else ''} for " \
-               f"{_link_name('item', row_id)}\n\n"
-        for data in datas:
+               f"{_link_name(raw_data, 'item', row_id)}\n\n"
+        for data, requirements in zip(datas, raw_data.requirements[typ][row_id]):
             text += f"Primary skill: {data['skill_used'] if 'skill_used' in data else 'None'} " \
                     f"({data['difficulty'] if 'difficulty' in data else 0})\n"
             skills_required = []
@@ -556,7 +560,7 @@ def _craft_item(row_id, raw=False, typ='recipe') -> (str, InlineKeyboardMarkup):
                 text += f"Other skills: {' and '.join(skills_required)}\n"
 
             if 'proficiencies' in data:
-                proficiencies = map(lambda p: f"{_name(raw_data['proficiency'][p['proficiency']])}" + (
+                proficiencies = map(lambda p: f"{row_name(raw_data['proficiency'][p['proficiency']])}" + (
                     (f" (Time Multiplier x{p['time_multiplier']})"
                      if 'time_multiplier' in p and p['time_multiplier'] != 1 else '') +
                     (f" (Fail Multiplier x{p['fail_multiplier']})"
@@ -583,20 +587,19 @@ def _craft_item(row_id, raw=False, typ='recipe') -> (str, InlineKeyboardMarkup):
             if 'flags' in data:
                 text += f"Flags: {', '.join(data['flags'])}\n"
 
-            tools, qualities, components = _normalize_tools(data)
+            tools, qualities, components = requirements
 
             if any(tools) or any(qualities):
                 text += "Tools Required:\n"
                 if any(qualities):
                     for q in qualities:
-                        amount = q['amount'] if 'amount' in q else 1
-                        text += f"- {str(amount) + ' ' if amount > 1 else ''}tool{'s' if amount > 1 else ''} " \
-                                f"with {_name(raw_data['tool_quality'][q['id']])} of {q['level']} or more\n"
+                        text += f"- {str(q.amount) + ' ' if q.amount > 1 else ''}tool{'s' if q.amount > 1 else ''} " \
+                                f"with {row_name(raw_data['tool_quality'][q.id])} of {q.level} or more\n"
                 if any(tools):
                     for tool in tools:
                         tool_names = []
                         for tool_id, charges in tool:
-                            tool_names.append(f"{_link_name('item', tool_id)}" + (f" ({charges})" if charges > 0 else ''))
+                            tool_names.append(_link_name(raw_data, 'item', tool_id) + (f" ({charges})" if charges > 0 else ''))
                         text += f"- {' OR '.join(tool_names)}\n"
             if any(components):
                 text += "Components:\n"
@@ -604,14 +607,14 @@ def _craft_item(row_id, raw=False, typ='recipe') -> (str, InlineKeyboardMarkup):
                     components_names = []
                     for item_id, count in components_row:
                         if item_id in raw_data['item']:
-                            components_names.append(f"{count} {_link_name('item', item_id)}")
+                            components_names.append(f"{count} {_link_name(raw_data, 'item', item_id)}")
                     text += f"- {' OR '.join(components_names)}\n"
 
             if typ == 'recipe':
                 if 'byproducts' in data:
                     text += "Byproducts:\n"
                     for b in data['byproducts']:
-                        text += f"- {b[1] if len(b) > 1 else 1} {_link_name('item', b[0])}\n"
+                        text += f"- {b[1] if len(b) > 1 else 1} {_link_name(raw_data, 'item', b[0])}\n"
 
                 text += "Autolearn: "
                 if 'autolearn' in data:
@@ -644,7 +647,7 @@ def _craft_item(row_id, raw=False, typ='recipe') -> (str, InlineKeyboardMarkup):
                     else:
                         for book_id, book_data in data['book_learn'].items():
                             books.append((book_id, book_data['skill_level']))
-                    books = map(lambda r: f"{_link_name('item', r[0])} (at level {r[1]})", books)
+                    books = map(lambda r: f"{_link_name(raw_data, 'item', r[0])} (at level {r[1]})", books)
                     text += f"Written In: {', '.join(books)}\n"
 
             text += '\n'
@@ -661,6 +664,8 @@ def _craft_item(row_id, raw=False, typ='recipe') -> (str, InlineKeyboardMarkup):
         ),
         InlineKeyboardButton("👀 Description", callback_data=f"cdda:view:{row_id}"),
     ]
+    if typ == 'recipe':
+        buttons.append(InlineKeyboardButton("🌳 Tree", callback_data=f"cdda:tree:{row_id}"))
     if typ == 'recipe' and row_id in raw_data['uncraft']:
         buttons.append(InlineKeyboardButton("🛠 Disassemble", callback_data=f"cdda:uncraft:{row_id}"))
     if typ == 'uncraft' and row_id in raw_data['recipe']:
@@ -669,76 +674,25 @@ def _craft_item(row_id, raw=False, typ='recipe') -> (str, InlineKeyboardMarkup):
     return text, markup
 
 
-def _normalize_tools(data: dict) -> (list, list, list):
-    tools = data['tools'] if 'tools' in data else []
-    qualities = data['qualities'] if 'qualities' in data else []
-    components = data['components'] if 'components' in data else []
-    for components_row in components:
-        for component in components_row:
-            if len(component) == 3 and component[2] == 'LIST':
-                req_id, count, _ = component
-                components_row.remove(component)
-                req = raw_data['requirement'][req_id]
-                _, _, c = _normalize_tools(req)
-                for r in c[0]:
-                    if len(r) == 2:
-                        r[1] *= count
-                        components_row.append(r)
-                    else:
-                        req_id, count2, _ = r
-                        req = raw_data['requirement'][req_id]
-                        _, _, c = _normalize_tools(req)
-                        for r in c[0]:
-                            if len(r) == 2:
-                                r[1] *= count * count2
-                                components_row.append(r)
-                            else:
-                                logging.warning("third level of this shit! {} / {}", data, r)
-    for tool_row in tools:  # TODO: idk why but fake tools (like basecamp ones) doesnt appear here
-        for tool in tool_row:
-            if len(tool) == 3 and tool[2] == 'LIST':
-                req_id, count, _ = tool
-                tool_row.remove(tool)
-                req = raw_data['requirement'][req_id]
-                t, _, _ = _normalize_tools(req)
-                tool_row += map(lambda r: [r[0], r[1] * count], t[0])
-    if 'using' in data:
-        for req_id, count in data['using']:
-            req = raw_data['requirement'][req_id]
-            t, q, c = _normalize_tools(req)
-            for qq in q:
-                if qq not in qualities:
-                    qualities.append(qq)
-            for tr in t:
-                for r in tr:
-                    r[1] *= count
-            for tt in t:
-                if tt not in tools:
-                    tools.append(tt)
-            for cr in c:
-                for r in cr:
-                    r[1] *= count
-            for cc in c:
-                if cc not in components:
-                    components.append(cc)
-    # TODO: sum
-
-    return tools, qualities, components
-
-
-def _action_view(action: str, row_id: str) -> (str, InlineKeyboardMarkup):
+def _action_view(raw_data: Snapshot, action: str, row_id: str) -> (str, InlineKeyboardMarkup):
     if action == 'view':
-        return _view_item(row_id)
+        return _view_item(raw_data, row_id)
     elif action == 'item_raw':
-        return _view_item(row_id, True)
+        return _view_item(raw_data, row_id, True)
     elif action == 'craft':
-        return _craft_item(row_id)
+        return _craft_item(raw_data, row_id)
     elif action == 'craft_raw':
-        return _craft_item(row_id, True)
+        return _craft_item(raw_data, row_id, True)
     elif action == 'uncraft':
-        return _craft_item(row_id, typ='uncraft')
+        return _craft_item(raw_data, row_id, typ='uncraft')
     elif action == 'uncraft_raw':
-        return _craft_item(row_id, True, typ='uncraft')
+        return _craft_item(raw_data, row_id, True, typ='uncraft')
+    elif action in LISTINGS:
+        return _results_view(raw_data, _listing_results(raw_data, action, row_id), row_id, action)
+    elif action == 'uses':
+        return _uses_view(raw_data, row_id)
+    elif action in TREE_ACTIONS:
+        return _tree_view(raw_data, row_id, TREE_ACTIONS[action])
     # TODO: uncraft view
     # TODO: monster view
 
@@ -767,19 +721,25 @@ def _action_view(action: str, row_id: str) -> (str, InlineKeyboardMarkup):
             buttons.append(InlineKeyboardButton("🛠 Craft", callback_data=f"cdda:craft:{row_id}"))
     markup.add(*buttons)
 
-    data = raw_data[typ][row_id]
-    return f"<code>{json.dumps(data, indent=2)}</code>", markup
+    return _raw_json(raw_data, typ, row_id), markup
 
 
-def search(bot: TeleBot, message: Message):
-    bot.send_chat_action(message.chat.id, 'typing')
-    _update_data()
-    keyword = utils.get_keyword(message)
-    command = utils.get_command(message).lower()
-    if not keyword:
-        bot.reply_to(message, f"Usage example:\n<code>{command} glazed tenderloins</code>", parse_mode='html')
-        return
+@metrics.timed('render')
+def _cached_action_view(raw_data: Snapshot, action: str, row_id: str) -> (str, InlineKeyboardMarkup):
+    if action in LISTINGS or action == 'uses':
+        # listings point to their own session, which can expire before the cached view
+        return _action_view(raw_data, action, row_id)
+    key = (raw_data.version, action, row_id)
+    view = views.get(key)
+    if view is None:
+        view = _action_view(raw_data, action, row_id)
+        text, markup = view
+        views.put(key, view, len(text) + len(markup.to_json()))
+    return view
+
 
+def _search_reply(raw_data: Snapshot, command: str, keyword: str) -> Optional[Tuple[str, InlineKeyboardMarkup]]:
+    """Reply to a search command, None if nothing was found"""
     action = 'view'
     typ = 'item'
     # TODO: use match
@@ -790,53 +750,249 @@ def search(bot: TeleBot, message: Message):
     elif command in {'/m', '/mob', '/monster'}:
         action = 'monster'
         typ = 'monster'
+    elif command == '/uses':
+        action = 'uses'
+    elif command == '/tree':
+        action = 'tree'
+
+    results, fuzzy = _find(raw_data, typ, keyword)
+    if len(results) == 0:
+        return None
+    elif len(results) == 1 and not fuzzy:
+        text, markup = _cached_action_view(raw_data, action, results[0])
+        if len(text) > 4096:
+            text = text.split('\n\n')[0] + "\n\n<i>(text is too long for Telegram)</i>"
+        return text, markup
+    else:
+        return _results_view(raw_data, results, keyword, action, fuzzy)
+
 
-    tmp_message = bot.reply_to(message, "Loading search results...")
+def _flag_reply(raw_data: Snapshot, keyword: str) -> Optional[Tuple[str, InlineKeyboardMarkup]]:
+    flag_id = keyword.upper().replace(' ', '_')
+    results = _listing_results(raw_data, 'flag', flag_id)
+    if len(results) == 0:
+        return None
+    return _results_view(raw_data, results, flag_id, 'flag')
+
+
+def _find_items_reply(raw_data: Snapshot, keyword: str) -> Optional[Tuple[str, InlineKeyboardMarkup]]:
+    """Items matching a /find query, None if there are none; raises QueryError for a wrong query"""
+    results = _listing_results(raw_data, 'find', keyword)
+    if len(results) == 0:
+        return None
+    return _results_view(raw_data, results, keyword, 'find')
 
-    results = _search_results(typ, keyword)
+
+def _top_reply(raw_data: Snapshot, keyword: str) -> Optional[Tuple[str, InlineKeyboardMarkup]]:
+    """Best armor for a body part by a stat, None if there is none; raises QueryError for a wrong query"""
+    keyword = ' '.join(keyword.lower().split())
+    results = _listing_results(raw_data, 'top', keyword)
     if len(results) == 0:
-        bot.send_sticker(message.chat.id, 'CAADAgADxgADOtDfAeLvpRcG6I1bFgQ', message.message_id)
-    elif len(results) == 1:
-        text, markup = _action_view(action, results[0]['id'])
+        return None
+    return _results_view(raw_data, results, keyword, 'top')
+
+
+def _fit_text(text: str) -> str:
+    if len(text) > 4096:
+        text = text.split('\n\n')[0]
         if len(text) > 4096:
-            bot.reply_to(message, text.split('\n\n')[0] + "\n\n<i>(text is too long for Telegram)</i>",
-                         reply_markup=markup, parse_mode='HTML')
-        else:
-            bot.reply_to(message, text, reply_markup=markup, parse_mode='HTML')
+            text = text[:4000] + "...</code>\n\n<i>(text is too long for Telegram)</i>"
+        text += "\n\n<i>(full text is too long for Telegram)</i>"
+    return text
+
+
+def _button_view(raw_data: Snapshot, data: str) -> (str, InlineKeyboardMarkup):
+    action, row_id = data[5::].split(':')
+    text, markup = _cached_action_view(raw_data, action, row_id)
+    return _fit_text(text), markup
+
+
+def _inline_results(raw_data: Snapshot, query: str) -> List[InlineQueryResultArticle]:
+    """Items and monsters with names starting with `query` (or the closest ones if there are none) for inline mode"""
+    found = []
+    with metrics.phase('search'):
+        for typ in ('item', 'monster'):
+            found += [(typ, row_id) for row_id in raw_data.prefix_index[typ].search(query, INLINE_RESULTS - len(found))]
+        if not found:
+            for typ in ('item', 'monster'):
+                found += [(typ, row_id) for row_id in _fuzzy_results(raw_data, typ, query)[:INLINE_RESULTS - len(found)]]
+
+    results = []
+    for i, (typ, row_id) in enumerate(found):
+        # inline messages have no chat to send pressed buttons to, so only the text is sent
+        text, _ = _cached_action_view(raw_data, 'view' if typ == 'item' else 'monster', row_id)
+        results.append(InlineQueryResultArticle(
+            str(i), row_name(raw_data[typ][row_id]), InputTextMessageContent(_fit_text(text), parse_mode='HTML'),
+            description=f"{typ}: {row_id}"))
+    return results
+
+
+def _session_page(raw_data: Snapshot, data: str) -> Optional[Tuple[str, InlineKeyboardMarkup]]:
+    """Page of search results for a page button, None if the session has expired"""
+    page, token = data[9::].split(':', 1)
+    session = sessions.get(token) if page.isdigit() else None
+    if session is None or int(page) < 1:
+        return None
+    return _page_view(raw_data, token, session, int(page))
+
+
+def _expired_text(text: str) -> str:
+    return text.split('\n')[0] + '\n(expired, please repeat the search)'
+
+
+class _Command(NamedTuple):
+    """A search command: how it reads its keyword, its usage by the command name and its reply to the keyword"""
+    keyword: Callable[[Message], str]
+    usage: Callable[[str], str]
+    reply: Callable[[Snapshot, str, str], Optional[Tuple[str, InlineKeyboardMarkup]]]
+    # tell the user right away that the results are coming
+    loading: bool = False
+
+
+_SEARCH = _Command(utils.get_keyword, lambda command: f"Usage example:\n<code>{command} glazed tenderloins</code>",
+                   _search_reply, True)
+_FLAG = _Command(utils.get_keyword, lambda command: f"Usage example:\n<code>{command} MAG_BELT</code>",
+                 lambda raw_data, _, keyword: _flag_reply(raw_data, keyword))
+_FIND = _Command(lambda message: utils.get_keyword(message, False, keep_commas=True), lambda _: FIND_USAGE,
+                 lambda raw_data, _, keyword: _find_items_reply(raw_data, keyword))
+_TOP = _Command(lambda message: utils.get_keyword(message, False), lambda _: TOP_USAGE,
+                lambda raw_data, _, keyword: _top_reply(raw_data, keyword))
+
+
+def _command_reply(command: _Command, name: str, keyword: str) -> Optional[Tuple[str, Optional[InlineKeyboardMarkup]]]:
+    """Reply of a command to its keyword, the usage for a wrong query, None if nothing was found"""
+    try:
+        return command.reply(_current(), name, keyword)
+    except QueryError as e:
+        return f"{utils.escape(str(e))}\n\n{command.usage(name)}", None
+
+
+def _button_reply(data: str, text: str) -> Optional[Tuple[bool, str, Optional[InlineKeyboardMarkup]]]:
+    """
+    Reply to a pressed button of a message with `text`
+    :return: True to reply with a new message or False to edit the pressed one, text and markup;
+        None for buttons of other commands
+    """
+    if data.startswith('cdda:'):
+        return (True, *_button_view(_current(), data))
+    elif data == 'cdda_cancel':
+        return False, text.split('\n')[0] + '\n(canceled)', None
+    elif data.startswith('cdda_page'):
+        reply = _session_page(_current(), data)
+        return (False, *reply) if reply is not None else (False, _expired_text(text), None)
+    return None
+
+
+def _run_command(bot: TeleBot, message: Message, command: _Command):
+    bot.send_chat_action(message.chat.id, 'typing')
+    name = utils.get_command(message).lower()
+    keyword = command.keyword(message)
+    if not keyword:
+        bot.reply_to(message, command.usage(name), parse_mode='html')
+        return
+
+    tmp_message = bot.reply_to(message, "Loading search results...") if command.loading else None
+    reply = _command_reply(command, name, keyword)
+    if reply is None:
+        bot.send_sticker(message.chat.id, utils.NOT_FOUND_STICKER, message.message_id)
     else:
-        text, markup = _page_view(results, keyword, action)
+        text, markup = reply
         bot.reply_to(message, text, reply_markup=markup, parse_mode='HTML')
+    if tmp_message is not None:
+        utils.delete_message(bot, tmp_message)
+
+
+def search(bot: TeleBot, message: Message):
+    _run_command(bot, message, _SEARCH)
+
+
+def flag(bot: TeleBot, message: Message):
+    _run_command(bot, message, _FLAG)
 
-    utils.delete_message(bot, tmp_message)
+
+def find_items(bot: TeleBot, message: Message):
+    _run_command(bot, message, _FIND)
+
+
+def top(bot: TeleBot, message: Message):
+    _run_command(bot, message, _TOP)
 
 
 def btn_pressed(bot: TeleBot, message: Message, data: str):
     if data.startswith('cdda:'):
         bot.send_chat_action(message.chat.id, 'typing')
-        _update_data()
         utils.delete_message(bot, message)
-        action, row_id = data[5::].split(':')
-        text, markup = _action_view(action, row_id)
-        if len(text) > 4096:
-            text = text.split('\n\n')[0]
-            if len(text) > 4096:
-                text = text[:4000] + "...</code>\n\n<i>(text is too long for Telegram)</i>"
-            bot.reply_to(message.reply_to_message, text + "\n\n<i>(full text is too long for Telegram)</i>",
-                         reply_markup=markup, parse_mode='HTML')
-        else:
-            bot.reply_to(message.reply_to_message, text, reply_markup=markup, parse_mode='HTML')
-    elif data == 'cdda_cancel':
-        bot.edit_message_text(message.text.split('\n')[0] + '\n(canceled)', message.chat.id, message.message_id)
-    elif data.startswith('cdda_page'):
-        _update_data()
-        page, actkey = data[9::].split('_')
-        action, keyword = actkey.split(':')
-        page = int(page)
-        if page < 1:
-            return
-        typ = 'item'
-        if action == 'monster':
-            typ = 'monster'
-        results = _search_results(typ, keyword)
-        text, markup = _page_view(results, keyword, action, page=page)
-        bot.edit_message_text(text, message.chat.id, message.message_id, reply_markup=markup, parse_mode='HTML')
+    reply = _button_reply(data, message.text)
+    if reply is None:
+        return
+    new_message, text, markup = reply
+    if new_message:
+        bot.reply_to(message.reply_to_message, text, reply_markup=markup, parse_mode='HTML')
+    else:
+        # the text of the pressed message comes without its HTML, so only a new page is parsed
+        bot.edit_message_text(text, message.chat.id, message.message_id, reply_markup=markup,
+                              parse_mode='HTML' if markup is not None else None)
+
+
+def inline(bot: TeleBot, query: InlineQuery):
+    results = _inline_results(_current(), query.query) if query.query.strip() else []
+    bot.answer_inline_query(query.id, results, cache_time=INLINE_CACHE_TIME)
+
+
+# Versions of the handlers for AsyncTeleBot, searching and rendering run in the default executor
+
+
+async def _async_run_command(bot: 'AsyncTeleBot', message: Message, command: _Command):
+    await bot.send_chat_action(message.chat.id, 'typing')
+    name = utils.get_command(message).lower()
+    keyword = command.keyword(message)
+    if not keyword:
+        await bot.reply_to(message, command.usage(name), parse_mode='html')
+        return
+
+    tmp_message = await bot.reply_to(message, "Loading search results...") if command.loading else None
+    reply = await utils.in_executor(lambda: _command_reply(command, name, keyword))
+    if reply is None:
+        await bot.send_sticker(message.chat.id, utils.NOT_FOUND_STICKER, message.message_id)
+    else:
+        text, markup = reply
+        await bot.reply_to(message, text, reply_markup=markup, parse_mode='HTML')
+    if tmp_message is not None:
+        await utils.async_delete_message(bot, tmp_message)
+
+
+async def async_search(bot: 'AsyncTeleBot', message: Message):
+    await _async_run_command(bot, message, _SEARCH)
+
+
+async def async_flag(bot: 'AsyncTeleBot', message: Message):
+    await _async_run_command(bot, message, _FLAG)
+
+
+async def async_find_items(bot: 'AsyncTeleBot', message: Message):
+    await _async_run_command(bot, message, _FIND)
+
+
+async def async_top(bot: 'AsyncTeleBot', message: Message):
+    await _async_run_command(bot, message, _TOP)
+
+
+async def async_btn_pressed(bot: 'AsyncTeleBot', message: Message, data: str):
+    if data.startswith('cdda:'):
+        await bot.send_chat_action(message.chat.id, 'typing')
+        await utils.async_delete_message(bot, message)
+    reply = await utils.in_executor(lambda: _button_reply(data, message.text))
+    if reply is None:
+        return
+    new_message, text, markup = reply
+    if new_message:
+        await bot.reply_to(message.reply_to_message, text, reply_markup=markup, parse_mode='HTML')
+    else:
+        await bot.edit_message_text(text, message.chat.id, message.message_id, reply_markup=markup,
+                                    parse_mode='HTML' if markup is not None else None)
+
+
+async def async_inline(bot: 'AsyncTeleBot', query: InlineQuery):
+    results = await utils.in_executor(lambda: _inline_results(_current(), query.query)) \
+        if query.query.strip() else []
+    await bot.answer_inline_query(query.id, results, cache_time=INLINE_CACHE_TIME)
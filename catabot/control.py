@@ -0,0 +1,96 @@
+import json
+import logging
+import os
+import socket
+import socketserver
+import threading
+from typing import Optional
+
+from catabot.snapshot import SnapshotManager, snapshots
+from download_data import CONTROL_SOCKET
+
+TIMEOUT = 600
+
+
+class _ControlHandler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+        try:
+            request = json.loads(self.rfile.readline())
+            response = self.server.control.handle(request)
+        except Exception as e:
+            logging.exception('Control request failed')
+            response = {'ok': False, 'error': str(e)}
+        self.wfile.write(json.dumps(response).encode() + b'\n')
+
+
+class ControlServer:
+    """
+    Local control channel of the running bot: a Unix socket accepting one JSON line per connection.
+
+    ``{"command": "reload", "build_number": ...}`` is sent by ``download_data`` once it has replaced the data files,
+    the new snapshot is loaded and swapped in right away instead of on the next stat check.
+    """
+
+    def __init__(self, path: str = CONTROL_SOCKET, manager: SnapshotManager = snapshots):
+        self.path = path
+        self.manager = manager
+        self._server: Optional[socketserver.UnixStreamServer] = None
+
+    def start(self):
+        """Listen on the socket, replacing one left by a bot that has exited; raises RuntimeError if a bot is running"""
+        if not self.path or not hasattr(socket, 'AF_UNIX'):
+            return
+        if os.path.exists(self.path):
+            if _listening(self.path):
+                raise RuntimeError(f"Another bot is listening on '{self.path}'")
+            os.remove(self.path)
+        self._server = socketserver.UnixStreamServer(self.path, _ControlHandler)
+        self._server.control = self
+        os.chmod(self.path, 0o600)
+        threading.Thread(target=self._server.serve_forever, name='control', daemon=True).start()
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            os.remove(self.path)
+            self._server = None
+
+    def handle(self, request: dict) -> dict:
+        if request.get('command') == 'reload':
+            swapped = self.manager.reload()
+            version = self.manager.current().version
+            if request.get('build_number') and request['build_number'] != version:
+                logging.warning('Asked to load build %s, but the game data is for build %s',
+                                request['build_number'], version)
+            return {'ok': True, 'swapped': swapped, 'build_number': version}
+        return {'ok': False, 'error': f"unknown command: {request.get('command')!r}"}
+
+
+def _listening(path: str) -> bool:
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(5)
+        try:
+            sock.connect(path)
+        except (ConnectionRefusedError, FileNotFoundError):
+            return False
+        return True
+
+
+def send_command(request: dict, path: str = CONTROL_SOCKET) -> Optional[dict]:
+    """
+    Send a request to the running bot
+    :return: bot's response or None if the bot isn't running
+    """
+    if not hasattr(socket, 'AF_UNIX') or not os.path.exists(path):
+        return None
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(TIMEOUT)
+        try:
+            sock.connect(path)
+        except (ConnectionRefusedError, FileNotFoundError):
+            return None
+        sock.sendall(json.dumps(request).encode() + b'\n')
+        with sock.makefile('rb') as response:
+            return json.loads(response.readline())
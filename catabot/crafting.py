@@ -0,0 +1,163 @@
+from typing import Dict, Iterator, NamedTuple, Optional, Set, Tuple
+
+# Crafting levels below an item, deeper components are counted as raw materials
+MAX_DEPTH = 12
+# What the cheapest recipe and component alternative are picked by
+METRICS = ('time', 'components')
+
+
+class Cost(NamedTuple):
+    """Cost of one unit of an item, crafted from raw materials with the cheapest recipes"""
+    # seconds of crafting, of the item and of all its crafted components
+    time: float
+    # units of raw materials
+    count: float
+    # raw materials and their amounts, by id
+    materials: Tuple[Tuple[str, float], ...]
+    # position of the chosen recipe among the recipes of the item, -1 for a raw material
+    recipe: int
+    # chosen alternative of every component group of the recipe and its amount for one unit of the item
+    components: Tuple[Tuple[str, float], ...]
+    # crafting levels below the item
+    height: int
+    # False if a cycle or the depth limit cut the tree below: such a cost depends on where the item is
+    # in the tree and is never cached
+    complete: bool
+
+
+def _raw(item_id: str, complete: bool = True) -> Cost:
+    return Cost(0, 1, ((item_id, 1),), -1, (), 0, complete)
+
+
+def _order(cost: Cost, metric: str) -> Tuple[float, float]:
+    return (cost.time, cost.count) if metric == 'time' else (cost.count, cost.time)
+
+
+class CraftingGraph:
+    """
+    Crafting trees over the craft recipes of a snapshot: every item costs its cheapest recipe,
+    which costs its time and the cheapest alternative of every component group, down to raw materials.
+
+    Costs are memoized per item and metric for the snapshot, so a tree shares the subtrees computed
+    for other trees. A recipe needing an item that is being crafted higher in the tree is skipped;
+    an item with only such recipes, or deeper than `max_depth`, is counted as a raw material.
+    Costs cut that way are only memoized for the tree being computed, by item and depth, which keeps
+    graphs full of cycles from being walked once per path. A recipe making several units of its result
+    (its charges, or the default charges of the item) is spread over them.
+    """
+
+    def __init__(self, recipes: dict, requirements: dict, items: dict, max_depth: int = MAX_DEPTH):
+        self.recipes = recipes
+        self.requirements = requirements
+        self.items = items
+        self.max_depth = max_depth
+        self._costs: Dict[Tuple[str, str], Cost] = {}
+
+    def __getstate__(self):
+        # costs are filled on demand and never written to the snapshot file
+        return {'recipes': self.recipes, 'requirements': self.requirements, 'items': self.items,
+                'max_depth': self.max_depth}
+
+    def __setstate__(self, state):
+        self.__init__(state['recipes'], state['requirements'], state['items'], state['max_depth'])
+
+    def makes(self, row) -> int:
+        """Units of its result a recipe makes"""
+        if 'charges' in row:
+            charges = row['charges']
+        else:
+            item = self.items.get(row['result'])
+            charges = item['charges'] if item is not None and 'charges' in item else 1
+        return charges if isinstance(charges, int) and charges > 0 else 1
+
+    def cost(self, item_id: str, metric: str = 'time') -> Cost:
+        return self._cost(item_id, metric, 0, set(), {})
+
+    def _cost(self, item_id: str, metric: str, depth: int, path: Set[str],
+              tree: Dict[Tuple[str, int], Cost]) -> Optional[Cost]:
+        """
+        :param tree: costs of the tree being computed by item and depth
+        :return: cost of `item_id` at `depth` below the top of the tree, None if it is in `path` (a cycle)
+        """
+        if item_id in path:
+            return None
+        cost = self._costs.get((item_id, metric))
+        if cost is not None and depth + cost.height <= self.max_depth:
+            return cost
+        if item_id not in self.recipes:
+            return _raw(item_id)
+        if depth >= self.max_depth:
+            return _raw(item_id, False)
+        if (item_id, depth) in tree:
+            return tree[(item_id, depth)]
+        path.add(item_id)
+        try:
+            best = None
+            complete = True
+            for i, (row, requirements) in enumerate(zip(self.recipes[item_id], self.requirements[item_id])):
+                cost = self._recipe_cost(i, row, requirements, metric, depth, path, tree)
+                if cost is None:
+                    complete = False
+                elif best is None or _order(cost, metric) < _order(best, metric):
+                    best = cost
+        finally:
+            path.discard(item_id)
+        if best is None:
+            return _raw(item_id, False)
+        if not complete and best.complete:
+            best = best._replace(complete=False)
+        if best.complete:
+            self._costs[(item_id, metric)] = best
+        tree[(item_id, depth)] = best
+        return best
+
+    def _recipe_cost(self, i: int, row, requirements, metric: str, depth: int, path: Set[str],
+                     tree: Dict[Tuple[str, int], Cost]) -> Optional[Cost]:
+        """:return: cost of recipe `i` of an item, None if every alternative of a component group is in a cycle"""
+        time = row['time_s'] if 'time_s' in row else 0
+        count = 0
+        materials = {}
+        components = []
+        height = 0
+        complete = True
+        for group in requirements.components:
+            best = None
+            for component_id, amount in group:
+                cost = self._cost(component_id, metric, depth + 1, path, tree)
+                if cost is None:
+                    complete = False
+                    continue
+                order = tuple(value * amount for value in _order(cost, metric))
+                if best is None or order < best[0]:
+                    best = order, component_id, amount, cost
+            if best is None:
+                return None
+            _, component_id, amount, cost = best
+            time += cost.time * amount
+            count += cost.count * amount
+            for material_id, material_amount in cost.materials:
+                materials[material_id] = materials.get(material_id, 0) + material_amount * amount
+            components.append((component_id, amount))
+            height = max(height, cost.height + 1)
+            complete = complete and cost.complete
+        makes = self.makes(row)
+        if makes > 1:
+            time /= makes
+            count /= makes
+            materials = {material_id: amount / makes for material_id, amount in materials.items()}
+            components = [(component_id, amount / makes) for component_id, amount in components]
+        return Cost(time, count, tuple(sorted(materials.items())), i, tuple(components), height, complete)
+
+    def walk(self, item_id: str, metric: str = 'time') -> Iterator[Tuple[int, str, float, Cost]]:
+        """Items of the crafting tree of `item_id` from the top: depth, id, amount for one unit of the top and cost"""
+        tree = {}
+
+        # costs of the tree are the ones its top was computed with, its components are the ones that were chosen
+        def walk(node_id: str, amount: float, depth: int):
+            cost = self._cost(node_id, metric, depth, set(), tree)
+            yield depth, node_id, amount, cost
+            for component_id, component_amount in cost.components:
+                yield from walk(component_id, amount * component_amount, depth + 1)
+
+        self._cost(item_id, metric, 0, set(), tree)
+        yield from walk(item_id, 1, 0)
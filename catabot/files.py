@@ -0,0 +1,36 @@
+import os
+import tempfile
+from contextlib import contextmanager
+from typing import IO, Iterator, Tuple
+
+# mkstemp creates files only their owner can read, the replaced files get the usual permissions instead
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+
+def temp_file(path: str) -> Tuple[int, str]:
+    """
+    Create a unique temporary file next to `path`, to be renamed to it once written
+    :return: descriptor and path of the temporary file
+    """
+    fd, tmp_path = tempfile.mkstemp(prefix=os.path.basename(path) + '.', suffix='.tmp',
+                                    dir=os.path.dirname(path) or '.')
+    os.chmod(tmp_path, 0o666 & ~_UMASK)
+    return fd, tmp_path
+
+
+@contextmanager
+def replaced(path: str, mode: str = 'w', **kwargs) -> Iterator[IO]:
+    """
+    Write `path` atomically: the block writes a unique temporary file, which replaces `path` if the block succeeds
+    and is removed if it fails, so concurrent writers never write into the same file
+    """
+    fd, tmp_path = temp_file(path)
+    try:
+        with os.fdopen(fd, mode, **kwargs) as file:
+            yield file
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
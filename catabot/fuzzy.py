@@ -0,0 +1,113 @@
+import heapq
+import re
+from array import array
+from typing import Dict, Iterable, List, Sequence, Tuple
+
+MAX_DISTANCE = 2
+# Bounds for a single lookup: query words considered, close words kept per query word, rows returned
+MAX_QUERY_WORDS = 6
+MAX_WORD_CANDIDATES = 16
+MAX_RESULTS = 50
+
+_WORD = re.compile(r'[^\W_]+')
+
+
+def words(text: str) -> List[str]:
+    """Lowercased words of a name or an id (underscores separate words)"""
+    return _WORD.findall(text.lower())
+
+
+def _allowed_distance(word: str) -> int:
+    # a typo in a three-letter word makes it a different word
+    return min(MAX_DISTANCE, (len(word) - 1) // 3)
+
+
+def _deletes(word: str, distance: int) -> set:
+    result = {word}
+    edge = {word}
+    for _ in range(distance):
+        edge = {w[:i] + w[i + 1:] for w in edge if len(w) > 1 for i in range(len(w))}
+        result |= edge
+    return result
+
+
+def edit_distance(a: str, b: str, limit: int) -> int:
+    """
+    Optimal string alignment distance (Levenshtein with adjacent transpositions)
+    :return: distance or `limit` + 1 if it is greater than `limit`
+    """
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous2 = None
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i] + [0] * len(b)
+        for j, cb in enumerate(b, 1):
+            cost = 0 if ca == cb else 1
+            value = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if previous2 is not None and i > 1 and j > 1 and ca == b[j - 2] and a[i - 2] == cb:
+                value = min(value, previous2[j - 2] + 1)
+            current[j] = value
+        if min(current) > limit:
+            return limit + 1
+        previous2, previous = previous, current
+    return previous[-1] if previous[-1] <= limit else limit + 1
+
+
+class FuzzyIndex:
+    """
+    Typo-tolerant search over the words of row names.
+
+    Every vocabulary word is stored under all its variants with up to :data:`MAX_DISTANCE` deleted letters
+    (SymSpell), so close words are found by looking up the deletes of a query word instead of comparing
+    it with the whole vocabulary. Rows are ranked by the number of query words they match, then by
+    the total edit distance and then by the number of other words in their names.
+    """
+
+    def __init__(self, rows: Iterable[Tuple[str, Sequence[str]]]):
+        self.keys: List[str] = []
+        self.lengths = array('i')
+        postings: Dict[str, List[int]] = {}
+        for i, (key, names) in enumerate(rows):
+            row_words = {w for name in names for w in words(name)}
+            self.keys.append(key)
+            self.lengths.append(len(row_words))
+            for word in row_words:
+                postings.setdefault(word, []).append(i)
+        self.postings = {word: array('i', positions) for word, positions in postings.items()}
+        deletes: Dict[str, List[str]] = {}
+        for word in self.postings:
+            for variant in _deletes(word, _allowed_distance(word)):
+                deletes.setdefault(variant, []).append(word)
+        self.deletes = {variant: tuple(similar) for variant, similar in deletes.items()}
+
+    def _similar_words(self, word: str) -> Dict[str, int]:
+        limit = _allowed_distance(word)
+        distances = {}
+        for variant in _deletes(word, limit):
+            for candidate in self.deletes.get(variant, ()):
+                if candidate not in distances:
+                    distances[candidate] = edit_distance(word, candidate, limit)
+        close = sorted((d, -len(self.postings[w]), w) for w, d in distances.items() if d <= limit)
+        return {w: d for d, _, w in close[:MAX_WORD_CANDIDATES]}
+
+    def search(self, keyword: str, limit: int = MAX_RESULTS) -> List[str]:
+        """
+        Find rows with names close to `keyword`
+        :param keyword: search query, possibly with typos
+        :param limit: max number of rows to return
+        :return: keys of the closest rows, best first
+        """
+        scores: Dict[int, List[int]] = {}
+        for word in words(keyword)[:MAX_QUERY_WORDS]:
+            matched = {}
+            for similar, distance in self._similar_words(word).items():
+                for i in self.postings[similar]:
+                    if i not in matched or matched[i] > distance:
+                        matched[i] = distance
+            for i, distance in matched.items():
+                score = scores.setdefault(i, [0, 0])
+                score[0] -= 1
+                score[1] += distance
+        best = heapq.nsmallest(limit, scores.items(), key=lambda item: (*item[1], self.lengths[item[0]], item[0]))
+        return [self.keys[i] for i, _ in best]
@@ -0,0 +1,269 @@
+import asyncio
+import gzip
+import hashlib
+import http.client
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from typing import Any, Dict, Optional, Tuple
+from urllib.parse import urljoin, urlsplit
+
+from catabot import metrics
+from catabot.cache import LRUCache
+from download_data import GITHUB_CACHE_DIR
+
+DEFAULT_TTL = 60
+TIMEOUT = 30
+MAX_REDIRECTS = 3
+USER_AGENT = 'catabot'
+
+
+class GitHubError(Exception):
+
+    def __init__(self, url: str, status: int, reason: str):
+        super().__init__(f'{url}: {status} {reason}')
+        self.url = url
+        self.status = status
+
+
+class ConnectionPool:
+    """Idle keep-alive connections by (scheme, host, port), at most `size` per host"""
+
+    def __init__(self, size: int = 4, timeout: float = TIMEOUT):
+        self.size = size
+        self.timeout = timeout
+        self._idle: Dict[Tuple[str, str, int], queue.LifoQueue] = {}
+        self._lock = threading.Lock()
+
+    def _queue(self, key) -> queue.LifoQueue:
+        with self._lock:
+            if key not in self._idle:
+                self._idle[key] = queue.LifoQueue(self.size)
+            return self._idle[key]
+
+    def acquire(self, scheme: str, host: str, port: Optional[int]) -> http.client.HTTPConnection:
+        try:
+            return self._queue((scheme, host, port)).get_nowait()
+        except queue.Empty:
+            cls = http.client.HTTPSConnection if scheme == 'https' else http.client.HTTPConnection
+            return cls(host, port, timeout=self.timeout)
+
+    def release(self, scheme: str, host: str, port: Optional[int], connection: http.client.HTTPConnection):
+        try:
+            self._queue((scheme, host, port)).put_nowait(connection)
+        except queue.Full:
+            connection.close()
+
+
+class _Entry:
+    __slots__ = ('url', 'etag', 'last_modified', 'fetched', 'data', 'size')
+
+    def __init__(self, url: str, etag: Optional[str], last_modified: Optional[str], fetched: float, data: Any,
+                 size: int):
+        self.url = url
+        self.etag = etag
+        self.last_modified = last_modified
+        self.fetched = fetched
+        self.data = data
+        self.size = size
+
+
+class GitHubClient:
+    """
+    Client for the GitHub REST API shared by the bot and the changelog announcer.
+
+    Responses are kept on disk by url together with their ``ETag`` and ``Last-Modified``. Within `ttl` seconds
+    a cached response is returned without asking GitHub at all, after that it is revalidated with
+    ``If-None-Match``/``If-Modified-Since`` and a ``304 Not Modified`` (which doesn't count against the rate limit)
+    just renews it. When GitHub can't be reached or refuses the request, a cached response is returned even if stale.
+
+    The async bot sends its requests with aiohttp (:meth:`get_json_async`) through the same cache.
+    Any http(s) url works, so the client can be pointed at a local server.
+    """
+
+    def __init__(self, cache_dir: Optional[str] = GITHUB_CACHE_DIR, ttl: float = DEFAULT_TTL,
+                 pool: Optional[ConnectionPool] = None):
+        self.cache_dir = cache_dir
+        self.ttl = ttl
+        self.pool = pool or ConnectionPool()
+        self.requests = 0
+        self.not_modified = 0
+        # the counters are updated from the handler threads and the event loop
+        self._counters_lock = threading.Lock()
+        self._memory = LRUCache(256, 32 * 1024 * 1024)
+        # aiohttp session of the event loop it was made in
+        self._session = None
+
+    def get_json(self, url: str, ttl: Optional[float] = None) -> Any:
+        """
+        Decoded JSON response of GitHub API `url`
+        :param url: absolute url
+        :param ttl: seconds a cached response is used without revalidation, client's default if None
+        """
+        entry, headers = self._prepare(url, ttl)
+        if headers is None:
+            return entry.data
+        try:
+            status, response_headers, body = self._request(url, headers)
+        except (OSError, http.client.HTTPException, GitHubError) as e:
+            return self._stale(url, entry, e)
+        return self._update(url, entry, status, response_headers, body)
+
+    async def get_json_async(self, url: str, ttl: Optional[float] = None) -> Any:
+        """:meth:`get_json` for the event loop: the request is sent with aiohttp instead of blocking a thread"""
+        import aiohttp
+
+        entry, headers = self._prepare(url, ttl)
+        if headers is None:
+            return entry.data
+        try:
+            status, response_headers, body = await self._request_async(url, headers)
+        except (OSError, asyncio.TimeoutError, aiohttp.ClientError, GitHubError) as e:
+            return self._stale(url, entry, e)
+        return self._update(url, entry, status, response_headers, body)
+
+    def _prepare(self, url: str, ttl: Optional[float]) -> Tuple[Optional[_Entry], Optional[dict]]:
+        """:return: cached response and the headers of the request to send, None if the cached response is fresh"""
+        ttl = self.ttl if ttl is None else ttl
+        entry = self._cached(url)
+        if entry is not None and time.time() - entry.fetched < ttl:
+            return entry, None
+
+        headers = {'Accept': 'application/vnd.github+json', 'Accept-Encoding': 'gzip', 'User-Agent': USER_AGENT}
+        if entry is not None and entry.etag:
+            headers['If-None-Match'] = entry.etag
+        if entry is not None and entry.last_modified:
+            headers['If-Modified-Since'] = entry.last_modified
+        return entry, headers
+
+    @staticmethod
+    def _stale(url: str, entry: Optional[_Entry], error: Exception) -> Any:
+        # a stale response (e.g. while rate limited) is better than none
+        if entry is None:
+            raise error
+        logging.warning('GitHub request %s failed (%s), using a cached response', url, error)
+        return entry.data
+
+    def _update(self, url: str, entry: Optional[_Entry], status: int, response_headers, body: bytes) -> Any:
+        if status == 304 and entry is not None:
+            with self._counters_lock:
+                self.not_modified += 1
+            entry = _Entry(url, entry.etag, entry.last_modified, time.time(), entry.data, entry.size)
+        elif status == 200:
+            entry = _Entry(url, response_headers.get('ETag'), response_headers.get('Last-Modified'), time.time(),
+                           json.loads(body), len(body))
+        else:
+            raise GitHubError(url, status, 'Not Modified without a cached response')
+        self._store(entry)
+        return entry.data
+
+    def _request(self, url: str, headers: dict) -> Tuple[int, http.client.HTTPMessage, bytes]:
+        for _ in range(MAX_REDIRECTS + 1):
+            parts = urlsplit(url)
+            target = parts.path + ('?' + parts.query if parts.query else '')
+            connection = self.pool.acquire(parts.scheme, parts.hostname, parts.port)
+            try:
+                try:
+                    connection.request('GET', target, headers=headers)
+                    response = connection.getresponse()
+                except (ConnectionError, http.client.RemoteDisconnected, http.client.CannotSendRequest):
+                    # the server closed an idle keep-alive connection, try once more on a new one
+                    connection.close()
+                    connection.request('GET', target, headers=headers)
+                    response = connection.getresponse()
+                body = response.read()
+            except BaseException:
+                connection.close()
+                raise
+            with self._counters_lock:
+                self.requests += 1
+            if response.will_close:
+                connection.close()
+            else:
+                self.pool.release(parts.scheme, parts.hostname, parts.port, connection)
+
+            if response.getheader('Content-Encoding') == 'gzip':
+                body = gzip.decompress(body)
+            if response.status in (301, 302, 307, 308) and response.getheader('Location'):
+                url = urljoin(url, response.getheader('Location'))
+                continue
+            if response.status not in (200, 304):
+                raise GitHubError(url, response.status, response.reason)
+            return response.status, response.headers, body
+        raise GitHubError(url, 310, 'too many redirects')
+
+    async def _request_async(self, url: str, headers: dict) -> Tuple[int, Any, bytes]:
+        import aiohttp
+
+        loop = asyncio.get_running_loop()
+        if self._session is None or self._session.closed or self._session.loop is not loop:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit_per_host=self.pool.size),
+                timeout=aiohttp.ClientTimeout(total=self.pool.timeout))
+        # aiohttp follows redirects and decompresses gzip itself
+        async with self._session.get(url, headers=headers, max_redirects=MAX_REDIRECTS) as response:
+            body = await response.read()
+        with self._counters_lock:
+            self.requests += 1
+        if response.status not in (200, 304):
+            raise GitHubError(url, response.status, response.reason)
+        return response.status, response.headers, body
+
+    async def close_async(self):
+        """Close the aiohttp session, before its event loop is closed"""
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    def _path(self, url: str) -> Optional[str]:
+        if self.cache_dir is None:
+            return None
+        return os.path.join(self.cache_dir, hashlib.sha1(url.encode()).hexdigest() + '.json')
+
+    def _cached(self, url: str) -> Optional[_Entry]:
+        entry = self._memory.get(url)
+        if entry is not None:
+            return entry
+        path = self._path(url)
+        if path is None or not os.path.isfile(path):
+            return None
+        try:
+            with open(path, 'r', encoding='utf-8') as file:
+                stored = json.load(file)
+        except (OSError, ValueError) as e:
+            logging.warning('Broken GitHub cache entry %s: %s', path, e)
+            return None
+        if stored.get('url') != url:
+            return None
+        entry = _Entry(url, stored.get('etag'), stored.get('last_modified'), stored.get('fetched', 0), stored['data'],
+                       os.path.getsize(path))
+        self._memory.put(url, entry, entry.size)
+        return entry
+
+    def _store(self, entry: _Entry):
+        self._memory.put(entry.url, entry, entry.size)
+        path = self._path(entry.url)
+        if path is None:
+            return
+        os.makedirs(self.cache_dir, exist_ok=True)
+        tmp_path = f'{path}.{threading.get_ident()}.tmp'
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as file:
+                json.dump({'url': entry.url, 'etag': entry.etag, 'last_modified': entry.last_modified,
+                           'fetched': entry.fetched, 'data': entry.data}, file)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logging.warning('Could not save GitHub cache entry %s: %s', path, e)
+
+    def stats(self) -> dict:
+        return {'requests': self.requests, 'not_modified': self.not_modified, **self._memory.stats()}
+
+
+client = GitHubClient()
+metrics.watch_cache('github', client)
+metrics.register(metrics.Collected(
+    'catabot_github_requests_total', 'Requests sent to GitHub, by result', 'counter', ('result',),
+    lambda: {('sent',): client.requests, ('not_modified',): client.not_modified}))
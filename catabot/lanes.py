@@ -0,0 +1,95 @@
+import logging
+import queue
+import threading
+from collections import deque
+from typing import Callable, Deque, Dict, Hashable, Tuple
+
+from catabot import metrics
+
+
+class Lane:
+    """
+    A bounded pool of worker threads for one kind of commands, taking updates from one shared queue.
+
+    Updates from the same chat are handled in the order they came (a button pressed right after a search needs
+    its results): while one of them is being handled, the next ones wait for it and are picked up by the same
+    worker once it is done. Other chats go on in parallel on the free workers. When `backlog` updates are
+    waiting, new ones are dropped instead of stalling the polling thread.
+    """
+
+    def __init__(self, name: str, workers: int, backlog: int):
+        self.name = name
+        self.backlog = backlog
+        self.dropped = 0
+        self._queue: queue.Queue = queue.Queue()
+        # chats with an update being handled or queued, and their updates waiting behind it
+        self._chats: Dict[Hashable, Deque[Tuple[Callable, tuple]]] = {}
+        self._waiting = 0
+        self._lock = threading.Lock()
+        self._threads = [threading.Thread(target=self._work, name=f'{name}-{i}', daemon=True)
+                         for i in range(max(1, workers))]
+        for thread in self._threads:
+            thread.start()
+
+    def submit(self, chat_id: Hashable, func: Callable, *args):
+        with self._lock:
+            if self._waiting >= self.backlog:
+                self.dropped += 1
+                logging.warning('%s lane is full, dropped an update from chat %s', self.name, chat_id)
+                return
+            self._waiting += 1
+            if chat_id in self._chats:
+                self._chats[chat_id].append((func, args))
+                return
+            self._chats[chat_id] = deque()
+        self._queue.put((chat_id, func, args))
+
+    def pending(self) -> int:
+        return self._waiting
+
+    def stop(self):
+        for _ in self._threads:
+            self._queue.put((None, None, ()))
+        for thread in self._threads:
+            thread.join()
+
+    def _work(self):
+        while True:
+            chat_id, func, args = self._queue.get()
+            if func is None:
+                return
+            while func is not None:
+                with self._lock:
+                    self._waiting -= 1
+                try:
+                    func(*args)
+                except Exception:
+                    logging.exception('unhandled error in %s', getattr(func, '__name__', func))
+                with self._lock:
+                    waiting = self._chats[chat_id]
+                    if waiting:
+                        func, args = waiting.popleft()
+                    else:
+                        del self._chats[chat_id]
+                        func = None
+
+
+class Dispatcher:
+    """
+    Runs handlers in separate lanes, so slow network-bound commands (``/release`` walking GitHub pages)
+    can't take the workers needed by fast local ones (searches, buttons).
+    """
+
+    def __init__(self, lanes: Dict[str, int], backlog: int = 100):
+        self.lanes = {name: Lane(name, workers, backlog) for name, workers in lanes.items()}
+        metrics.register(metrics.Collected('catabot_lane_pending', 'Updates waiting for a worker', 'gauge', ('lane',),
+                                           lambda: {(name,): lane.pending() for name, lane in self.lanes.items()}))
+        metrics.register(metrics.Collected('catabot_lane_dropped_total', 'Updates dropped by a full lane', 'counter',
+                                           ('lane',), lambda: {(name,): lane.dropped for name, lane in self.lanes.items()}))
+
+    def submit(self, lane: str, chat_id: Hashable, func: Callable, *args):
+        self.lanes[lane].submit(chat_id, func, *args)
+
+    def stop(self):
+        for lane in self.lanes.values():
+            lane.stop()
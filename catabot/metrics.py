@@ -0,0 +1,270 @@
+import contextvars
+import functools
+import inspect
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Optional, Tuple
+
+from catabot import profiling
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+BUCKETS = (.001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10)
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names: Tuple[str, ...], values: Tuple) -> str:
+    if not names:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in zip(names, values)) + '}'
+
+
+class Counter:
+
+    def __init__(self, name: str, help_text: str, labels: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help_text
+        self.labels = labels
+        self._values: Dict[Tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def expose(self) -> List[str]:
+        with self._lock:
+            values = dict(self._values)
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} counter']
+        lines += [f'{self.name}{_labels(self.labels, key)} {value}' for key, value in values.items()]
+        return lines
+
+
+class Histogram:
+
+    def __init__(self, name: str, help_text: str, labels: Tuple[str, ...] = (), buckets: Tuple[float, ...] = BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labels = labels
+        self.buckets = buckets
+        # per label values: counts per bucket (the last one is +Inf), sum
+        self._values: Dict[Tuple, Tuple[List[int], List[float]]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels):
+        with self._lock:
+            if labels not in self._values:
+                self._values[labels] = ([0] * (len(self.buckets) + 1), [0.0])
+            counts, total = self._values[labels]
+            counts[bisect_left(self.buckets, value)] += 1
+            total[0] += value
+
+    def expose(self) -> List[str]:
+        with self._lock:
+            values = {key: (list(counts), total[0]) for key, (counts, total) in self._values.items()}
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        names = self.labels + ('le',)
+        for key, (counts, total) in values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), counts):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{_labels(names, key + (bound,))} {cumulative}')
+            lines.append(f'{self.name}_sum{_labels(self.labels, key)} {total}')
+            lines.append(f'{self.name}_count{_labels(self.labels, key)} {cumulative}')
+        return lines
+
+
+class Collected:
+    """Metric read from somewhere else (cache stats, memory) when it's scraped"""
+
+    def __init__(self, name: str, help_text: str, typ: str, labels: Tuple[str, ...],
+                 collect: Callable[[], Dict[Tuple, float]]):
+        self.name = name
+        self.help = help_text
+        self.typ = typ
+        self.labels = labels
+        self.collect = collect
+
+    def expose(self) -> List[str]:
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.typ}']
+        lines += [f'{self.name}{_labels(self.labels, key)} {value}' for key, value in self.collect().items()]
+        return lines
+
+
+requests = Counter('catabot_requests_total', 'Handled updates', ('handler', 'outcome'))
+request_seconds = Histogram('catabot_request_seconds', 'Time to handle an update', ('handler',))
+phase_seconds = Histogram('catabot_phase_seconds', 'Time spent by handlers in each phase', ('handler', 'phase'))
+_registry: list = [requests, request_seconds, phase_seconds]
+_caches: Dict[str, object] = {}
+
+
+def register(metric):
+    _registry.append(metric)
+
+
+def watch_cache(name: str, cache):
+    """Expose hits, misses and size of a cache with ``stats()`` (:class:`catabot.cache.LRUCache` and friends)"""
+    _caches[name] = cache
+
+
+class _Request:
+    __slots__ = ('handler', 'phases', 'stack', 'mark')
+
+    def __init__(self, handler: str):
+        self.handler = handler
+        self.phases: Dict[str, float] = {}
+        self.stack: List[str] = ['other']
+        self.mark = time.perf_counter()
+
+    def switch(self, now: float):
+        phase = self.stack[-1]
+        self.phases[phase] = self.phases.get(phase, 0) + now - self.mark
+        self.mark = now
+
+
+_current: contextvars.ContextVar[Optional[_Request]] = contextvars.ContextVar('catabot_request', default=None)
+
+
+@contextmanager
+def phase(name: str):
+    """
+    Count the time of the block to phase `name` of the current request.
+    Phases don't overlap: time spent in a nested phase isn't counted to the outer one
+    """
+    request = _current.get()
+    if request is None:
+        yield
+        return
+    request.switch(time.perf_counter())
+    request.stack.append(name)
+    try:
+        yield
+    finally:
+        request.switch(time.perf_counter())
+        request.stack.pop()
+
+
+def timed(name: str):
+    """Decorator counting every call to phase `name`"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with phase(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+@contextmanager
+def request(handler: str):
+    """Time an update handled by `handler`, split by phases"""
+    current = _Request(handler)
+    token = _current.set(current)
+    started = current.mark
+    outcome = 'error'
+    try:
+        with profiling.profiled():
+            yield
+        outcome = 'ok'
+    finally:
+        now = time.perf_counter()
+        current.switch(now)
+        _current.reset(token)
+        requests.inc(handler, outcome)
+        request_seconds.observe(now - started, handler)
+        for name, seconds in current.phases.items():
+            phase_seconds.observe(seconds, handler, name)
+
+
+def instrumented(handler: str, func: Callable) -> Callable:
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        with request(handler):
+            return func(*args, **kwargs)
+    return wrapper
+
+
+class TimedApi:
+    """Bot proxy counting the time of every Bot API call to the 'telegram' phase"""
+
+    def __init__(self, bot):
+        self._bot = bot
+
+    def __getattr__(self, name):
+        attr = getattr(self._bot, name)
+        if not callable(attr):
+            return attr
+        if inspect.iscoroutinefunction(attr):
+            async def call_async(*args, **kwargs):
+                with phase('telegram'):
+                    return await attr(*args, **kwargs)
+            return call_async
+
+        def call(*args, **kwargs):
+            with phase('telegram'):
+                return attr(*args, **kwargs)
+        return call
+
+
+def _cache_stats(field: str) -> Dict[Tuple, float]:
+    return {(name,): cache.stats().get(field, 0) for name, cache in _caches.items()}
+
+
+def _memory() -> Dict[Tuple, float]:
+    result = {('peak',): resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024} if resource else {}
+    try:
+        with open('/proc/self/statm', 'r') as file:
+            result[('resident',)] = int(file.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        pass
+    return result
+
+
+register(Collected('catabot_cache_hits_total', 'Cache hits', 'counter', ('cache',), lambda: _cache_stats('hits')))
+register(Collected('catabot_cache_misses_total', 'Cache misses', 'counter', ('cache',), lambda: _cache_stats('misses')))
+register(Collected('catabot_cache_items', 'Entries in a cache', 'gauge', ('cache',), lambda: _cache_stats('items')))
+register(Collected('catabot_cache_bytes', 'Approximate size of a cache', 'gauge', ('cache',), lambda: _cache_stats('bytes')))
+register(Collected('catabot_memory_bytes', 'Resident memory of the bot process', 'gauge', ('kind',), _memory))
+
+
+def expose() -> str:
+    lines = []
+    for metric in list(_registry):
+        lines += metric.expose()
+    return '\n'.join(lines) + '\n'
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        if self.path.split('?')[0] not in ('/', '/metrics'):
+            self.send_error(404)
+            return
+        body = expose().encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def serve(port: int, host: str = '127.0.0.1') -> Optional[ThreadingHTTPServer]:
+    """Serve metrics in Prometheus text format on http://`host`:`port`/metrics, nothing if `port` is 0"""
+    if not port:
+        return None
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    threading.Thread(target=server.serve_forever, name='metrics', daemon=True).start()
+    return server
@@ -0,0 +1,174 @@
+import logging
+import math
+import re
+from typing import NamedTuple, Optional, Tuple, Union
+
+# Polymorphic fields of the game data (unit strings, str or list, int or dict) are parsed here once, when a snapshot
+# is built, the views only read the results
+
+
+class ArmorPortion(NamedTuple):
+    covers: Tuple[str, ...]
+    encumbrance: int
+    # None if the encumbrance doesn't change when the armor is full
+    max_encumbrance: Optional[int]
+    coverage: int
+
+
+class Protection(NamedTuple):
+    bash: float
+    cut: float
+    bullet: float
+    acid: float
+    fire: float
+    environmental: int
+
+
+def parse_volume(vol: Union[str, int]) -> int:
+    """:return: volume in ml, a number without units is in 250 ml"""
+    if not vol:
+        return 0
+    if isinstance(vol, int):
+        return vol * 250
+    try:
+        if vol.lower().endswith("ml"):
+            return int(vol[:-2].strip())
+        if vol.lower().endswith("l"):
+            return int(vol[:-1].strip()) * 1000
+    except ValueError:
+        logging.warning("invalid volume: %s", vol)
+    return 0
+
+
+def parse_mass(weight: Union[str, int]) -> float:
+    """:return: mass in g, a number without units is in g"""
+    if not weight:
+        return 0
+    if isinstance(weight, int):
+        return weight
+    try:
+        if weight.lower().endswith("mg"):
+            return int(weight[:-2].strip()) / 1000
+        if weight.lower().endswith("kg"):
+            return int(weight[:-2].strip()) * 1000
+        if weight.lower().endswith("g"):
+            return int(weight[:-1].strip())
+    except ValueError:
+        logging.warning("invalid weight: %s", weight)
+    return 0
+
+
+def parse_length(length: Union[str, int]) -> int:
+    """:return: length in mm, a number without units is in mm"""
+    if not length:
+        return 0
+    if isinstance(length, int):
+        return length
+    try:
+        for unit, mm in (("mm", 1), ("cm", 10), ("km", 1000000), ("m", 1000)):
+            if length.lower().endswith(unit):
+                return int(length[:-len(unit)].strip()) * mm
+    except ValueError:
+        logging.warning("invalid length: %s", length)
+    return 0
+
+
+_DURATION = re.compile(r'(-?\d+(?:\.\d+)?)\s*([a-z]+)')
+_SECONDS = {'turn': 1, 's': 1, 'sec': 1, 'second': 1, 'm': 60, 'min': 60, 'minute': 60, 'h': 3600, 'hour': 3600,
+            'd': 86400, 'day': 86400}
+
+
+def parse_duration(duration: Union[str, int]) -> float:
+    """:return: duration in seconds, a number without units is in moves (100 per second)"""
+    if not duration:
+        return 0
+    if isinstance(duration, (int, float)):
+        return duration / 100
+    seconds = 0
+    for amount, unit in _DURATION.findall(duration.lower()):
+        unit = unit if unit in _SECONDS else unit.rstrip('s')
+        if unit not in _SECONDS:
+            logging.warning("invalid duration: %s", duration)
+            return 0
+        seconds += float(amount) * _SECONDS[unit]
+    return seconds
+
+
+def to_hit(value: Union[int, dict]) -> int:
+    if isinstance(value, int):
+        return value
+    try:
+        return -2 + {'bad': -1, 'none': 0, 'solid': 1, 'weapon': 2}[value['grip']] + \
+            {'hand': 0, 'short': 1, 'long': 2}[value['length']] + \
+            {'point': -2, 'line': -1, 'any': 0, 'every': 1}[value['surface']] + \
+            {'clumsy': -2, 'uneven': -1, 'neutral': 0, 'good': 1}[value['balance']]
+    except (KeyError, TypeError):
+        logging.warning("invalid to_hit: %s", value)
+        return 0
+
+
+def name(row: dict) -> str:
+    if 'name' in row:
+        if isinstance(row['name'], str):
+            return row['name']
+        elif 'str' in row['name']:
+            return row['name']['str']
+        elif 'str_sp' in row['name']:
+            return row['name']['str_sp']
+    if 'id' in row:
+        return row['id']
+    return ''
+
+
+def _armor_portion(portion: dict) -> ArmorPortion:
+    encumbrance = portion['encumbrance'] if 'encumbrance' in portion else 0
+    max_encumbrance = None
+    if isinstance(encumbrance, list):
+        encumbrance, max_encumbrance = encumbrance[0], encumbrance[1] if len(encumbrance) > 1 else None
+    return ArmorPortion(tuple(portion['covers']) if 'covers' in portion else (), encumbrance, max_encumbrance,
+                        portion['coverage'] if 'coverage' in portion else 0)
+
+
+def material_portions(value: Union[str, list]) -> Tuple[Tuple[str, int], ...]:
+    """:return: material ids and their portions, of a material, a list of them or a list of ``{"type", "portion"}``"""
+    if isinstance(value, str):
+        return (value, 1),
+    return tuple((m['type'], m['portion'] if 'portion' in m else 1) if isinstance(m, dict) else (m, 1) for m in value)
+
+
+def item(row: dict, _) -> dict:
+    """Canonical values and precomputed numbers of an item row, added to its :class:`catabot.records.Item`"""
+    volume_ml = parse_volume(row['volume'])
+    weight_g = parse_mass(row['weight'])
+    materials = tuple(m for m, _ in material_portions(row['material'])) if 'material' in row else ()
+    fields = {
+        'display_name': name(row),
+        'volume_ml': volume_ml,
+        'weight_g': weight_g,
+        'length': row['longest_side'] if 'longest_side' in row else f"{round(volume_ml ** (1.0/3.0))} cm",
+        'length_mm': parse_length(row['longest_side']) if 'longest_side' in row
+        else round(volume_ml ** (1.0/3.0)) * 10,
+        'materials': materials,
+        'to_hit_bonus': to_hit(row['to_hit']) if 'to_hit' in row else 0,
+        'moves_per_attack': math.floor(65 + math.floor(volume_ml / 62.5) + math.floor(weight_g / 60.0)),
+    }
+    containers = [pocket for pocket in row['pocket_data'] if pocket.get('pocket_type', 'CONTAINER') == 'CONTAINER'] \
+        if 'pocket_data' in row else []
+    if containers:
+        fields['storage_ml'] = sum(parse_volume(pocket['max_contains_volume']) for pocket in containers
+                                   if 'max_contains_volume' in pocket)
+    covered = set(row['covers']) if 'covers' in row else set()
+    if 'armor' in row:
+        fields['armor_portions'] = tuple(_armor_portion(portion) for portion in row['armor'])
+        for portion in fields['armor_portions']:
+            covered.update(portion.covers)
+    fields['covered'] = frozenset(covered)
+    return fields
+
+
+def recipe(row: dict, _) -> dict:
+    return {'time_s': parse_duration(row['time']) if 'time' in row else 0}
+
+
+def named(row: dict, _) -> dict:
+    return {'display_name': name(row)}
@@ -0,0 +1,53 @@
+import re
+from array import array
+from bisect import bisect_left
+from typing import Iterable, List, Sequence, Tuple
+
+_WORD = re.compile(r'[^\W_]+')
+
+
+class PrefixIndex:
+    """
+    Autocomplete over the names of table rows.
+
+    Every lowercased name is stored from the start of each of its words ("wooden spear", "spear") in one sorted array,
+    so the rows completing a prefix are a contiguous range found by binary search. A name equal to the prefix sorts
+    before its longer completions, so exact matches come first.
+    """
+
+    def __init__(self, rows: Iterable[Tuple[str, Sequence[str]]]):
+        self.keys: List[str] = []
+        entries = set()
+        for i, (key, names) in enumerate(rows):
+            self.keys.append(key)
+            for name in names:
+                name = name.lower()
+                for word in _WORD.finditer(name):
+                    entries.add((name[word.start():], i))
+        entries = sorted(entries)
+        self.completions: List[str] = [completion for completion, _ in entries]
+        self.positions = array('i', (i for _, i in entries))
+
+    def search(self, prefix: str, limit: int) -> List[str]:
+        """
+        Find rows with a name or a word of a name starting with `prefix`
+        :param prefix: beginning of a name, case-insensitive
+        :param limit: max number of rows to return
+        :return: keys of the rows in alphabetical order of their completions, exact matches first
+        """
+        prefix = prefix.lower().strip()
+        if not prefix or limit <= 0:
+            return []
+        found = []
+        seen = set()
+        completions = self.completions
+        for i in range(bisect_left(completions, prefix), len(completions)):
+            if not completions[i].startswith(prefix):
+                break
+            position = self.positions[i]
+            if position not in seen:
+                seen.add(position)
+                found.append(self.keys[position])
+                if len(found) == limit:
+                    break
+        return found
@@ -0,0 +1,203 @@
+import contextvars
+import cProfile
+import io
+import pstats
+import threading
+import tracemalloc
+from contextlib import contextmanager
+from typing import Callable, Optional
+
+# Lines of the reports: functions by cumulative time, allocation sites
+TOP_FUNCTIONS = 60
+TOP_ALLOCATIONS = 40
+TRACEMALLOC_FRAMES = 10
+
+
+class ProfileSession:
+    """
+    cProfile of the next `requests` handled updates, merged into one report.
+
+    cProfile only sees the thread it was enabled in, so every update is profiled separately in the thread handling it
+    (and in the executor threads it waits for) and the results are added up. Since Python 3.12 one profiler sees all
+    threads and only one can run, the threads that can't start theirs are counted to the one running.
+    `on_done` gets the report once the last of them is finished.
+    """
+
+    def __init__(self, requests: int, on_done: Callable[[str], None]):
+        self.remaining = requests
+        self.profiled = 0
+        self.on_done = on_done
+        self._running = 0
+        self._stats: Optional[pstats.Stats] = None
+        self._lock = threading.Lock()
+
+    def acquire(self) -> bool:
+        with self._lock:
+            if self.remaining <= 0:
+                return False
+            self.remaining -= 1
+            self._running += 1
+            return True
+
+    def add(self, profile: Optional[cProfile.Profile], finished: bool):
+        """Add a profile of (a part of) an update, `finished` when the update is handled"""
+        with self._lock:
+            if profile is not None and self._stats is None:
+                self._stats = pstats.Stats(profile)
+            elif profile is not None:
+                self._stats.add(profile)
+            if finished:
+                self._running -= 1
+                self.profiled += 1
+            done = self.remaining <= 0 and self._running == 0
+        if done and finished:
+            self.finish()
+
+    def stop(self):
+        with self._lock:
+            self.remaining = 0
+            done = self._running == 0
+        if done:
+            self.finish()
+
+    def finish(self):
+        global _session
+        if _session is self:
+            _session = None
+        self.on_done(self.report())
+
+    def report(self) -> str:
+        if self._stats is None:
+            return 'No updates were profiled'
+        out = io.StringIO()
+        stats = self._stats
+        stats.stream = out
+        out.write(f'{self.profiled} updates profiled\n\n')
+        stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(TOP_FUNCTIONS)
+        stats.sort_stats(pstats.SortKey.TIME).print_stats(TOP_FUNCTIONS)
+        return out.getvalue()
+
+
+_session: Optional[ProfileSession] = None
+# set while an update is profiled, so executor threads working for it are profiled too
+_profiling: contextvars.ContextVar[Optional[ProfileSession]] = contextvars.ContextVar('catabot_profiling', default=None)
+_thread = threading.local()
+_baseline: Optional[tracemalloc.Snapshot] = None
+
+
+def start_profile(requests: int, on_done: Callable[[str], None]) -> bool:
+    """
+    Profile the next `requests` updates
+    :return: False if profiling is already running
+    """
+    global _session
+    if _session is not None:
+        return False
+    _session = ProfileSession(requests, on_done)
+    return True
+
+
+def stop_profile() -> bool:
+    session = _session
+    if session is None:
+        return False
+    session.stop()
+    return True
+
+
+@contextmanager
+def _enabled(session: ProfileSession, finished: bool):
+    # a thread can run one profiler at a time (the event loop thread handles several updates at once)
+    if getattr(_thread, 'busy', False):
+        # already counted to the profile running in this thread
+        yield
+        if finished:
+            session.add(None, True)
+        return
+    _thread.busy = True
+    profile = cProfile.Profile()
+    try:
+        try:
+            profile.enable()
+        except ValueError:
+            # since Python 3.12 a profiler is active for all threads and there can be only one: the update profiled
+            # in another thread already sees the calls of this one
+            profile = None
+        yield
+    finally:
+        if profile is not None:
+            profile.disable()
+        _thread.busy = False
+        session.add(profile, finished)
+
+
+@contextmanager
+def profiled():
+    """Profile the update handled in the block if a profile session wants more updates"""
+    session = _session
+    if session is None or not session.acquire():
+        yield
+        return
+    token = _profiling.set(session)
+    try:
+        with _enabled(session, True):
+            yield
+    finally:
+        _profiling.reset(token)
+
+
+def in_profiled_context(func: Callable) -> Callable:
+    """`func` profiled for the update it's called for, when that update is being profiled"""
+    session = _profiling.get()
+    if session is None:
+        return func
+
+    def run():
+        with _enabled(session, False):
+            return func()
+    return run
+
+
+def start_tracemalloc() -> bool:
+    """
+    Start tracing allocations, :func:`memory_report` shows what was allocated since
+    :return: False if allocations are already traced
+    """
+    global _baseline
+    if tracemalloc.is_tracing():
+        return False
+    tracemalloc.start(TRACEMALLOC_FRAMES)
+    _baseline = tracemalloc.take_snapshot()
+    return True
+
+
+def memory_report(stop: bool = False) -> Optional[str]:
+    """
+    Top allocation sites and their growth since allocations are traced
+    :param stop: stop tracing after the report
+    :return: report or None if allocations aren't traced
+    """
+    global _baseline
+    if not tracemalloc.is_tracing():
+        return None
+    snapshot = tracemalloc.take_snapshot().filter_traces((
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+    ))
+    current, peak = tracemalloc.get_traced_memory()
+    out = io.StringIO()
+    out.write(f'Traced memory: {current / 1024 / 1024:.1f} MiB, peak {peak / 1024 / 1024:.1f} MiB\n\n')
+    out.write(f'Top {TOP_ALLOCATIONS} growing allocation sites:\n')
+    for diff in snapshot.compare_to(_baseline, 'lineno')[:TOP_ALLOCATIONS]:
+        out.write(f'{diff}\n')
+    out.write(f'\nTop {TOP_ALLOCATIONS} allocation sites:\n')
+    for stat in snapshot.statistics('lineno')[:TOP_ALLOCATIONS]:
+        out.write(f'{stat}\n')
+    out.write(f'\nTop {TOP_ALLOCATIONS // 4} tracebacks:\n')
+    for stat in snapshot.statistics('traceback')[:TOP_ALLOCATIONS // 4]:
+        out.write(f'\n{stat}\n')
+        out.write('\n'.join(stat.traceback.format()) + '\n')
+    if stop:
+        tracemalloc.stop()
+        _baseline = None
+    return out.getvalue()
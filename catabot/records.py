@@ -0,0 +1,222 @@
+import hashlib
+import json
+import logging
+import mmap
+import os
+import sys
+import threading
+from typing import Any, Dict, FrozenSet, Optional, Tuple
+
+from catabot.files import temp_file
+
+# Shorter strings (ids, flags, materials, units) are interned, longer ones (descriptions) are only shared when equal
+INTERN_LENGTH = 64
+
+
+class Record:
+    """
+    Row of a game data table with only the fields the bot shows.
+
+    Fields are slots instead of dict entries and a field missing from the JSON is an unset slot,
+    so rows are read the same way as the JSON dicts they are made of: ``'flags' in row``, ``row['flags']``.
+    """
+    __slots__ = ('_present',)
+    FIELDS: Tuple[str, ...] = ()
+
+    def __init__(self, row: dict, share: 'Sharer'):
+        present = []
+        for field in self.FIELDS:
+            if field in row:
+                setattr(self, field, share(row[field]))
+                present.append(field)
+        # checking a set is a lot faster than failing to read an unset slot
+        self._present: FrozenSet[str] = share.one(frozenset(present))
+
+    def __contains__(self, field: str) -> bool:
+        return field in self._present
+
+    def __getitem__(self, field: str) -> Any:
+        if field in self._present:
+            return getattr(self, field)
+        raise KeyError(field)
+
+    def get(self, field: str, default: Any = None) -> Any:
+        return getattr(self, field) if field in self._present else default
+
+    def __repr__(self):
+        fields = ', '.join(f'{field}={getattr(self, field)!r}' for field in self.FIELDS if field in self._present)
+        return f'{type(self).__name__}({fields})'
+
+
+def _record_type(name: str, fields: Tuple[str, ...]) -> type:
+    return type(name, (Record,), {'__slots__': fields, 'FIELDS': fields, '__module__': __name__})
+
+
+# fields read by the views in catabot.commands.search, the ones after the JSON fields are made by catabot.normalize
+Item = _record_type('Item', (
+    'type', 'id', 'name', 'description', 'material', 'volume', 'weight', 'longest_side', 'flags', 'qualities',
+    'covers', 'armor', 'sided', 'warmth', 'encumbrance', 'max_encumbrance', 'coverage', 'environmental_protection',
+    'material_thickness', 'charges_per_use', 'power_draw', 'turns_per_charge', 'sub', 'calories', 'quench', 'fun',
+    'charges', 'spoils_in', 'healthy', 'vitamins', 'bashing', 'cutting', 'to_hit', 'techniques', 'pocket_data',
+    'ammo_type',
+    'display_name', 'volume_ml', 'weight_g', 'length', 'length_mm', 'materials', 'to_hit_bonus', 'moves_per_attack',
+    'covered', 'armor_portions', 'protection', 'storage_ml',
+))
+Monster = _record_type('Monster', ('type', 'id', 'name', 'display_name'))
+Material = _record_type('Material', (
+    'id', 'name', 'bash_resist', 'cut_resist', 'bullet_resist', 'acid_resist', 'fire_resist', 'display_name',
+))
+Recipe = _record_type('Recipe', (
+    'result', 'skill_used', 'difficulty', 'skills_required', 'proficiencies', 'time', 'activity_level',
+    'batch_time_factors', 'charges', 'delete_flags', 'flags', 'tools', 'qualities', 'components', 'using',
+    'byproducts', 'autolearn', 'book_learn',
+    'time_s',
+))
+Requirement = _record_type('Requirement', ('id', 'tools', 'qualities', 'components', 'using'))
+Named = _record_type('Named', ('id', 'name', 'display_name'))
+
+RECORDS = {
+    'item': Item,
+    'monster': Monster,
+    'material': Material,
+    'recipe': Recipe,
+    'uncraft': Recipe,
+    'requirement': Requirement,
+    'ammunition_type': Named,
+    'tool_quality': Named,
+    'proficiency': Named,
+}
+
+
+class Sharer:
+    """
+    Makes equal values of different rows one object: short strings are interned, equal lists and dicts
+    (flags, pockets, armor portions, requirement groups) are kept once. Shared values must never be changed.
+    """
+
+    def __init__(self):
+        self._shared: Dict[Any, Any] = {}
+
+    def __call__(self, value: Any) -> Any:
+        return self._share(value)[0]
+
+    def one(self, value: Any) -> Any:
+        """Equal hashable values (sets of fields) as one object"""
+        return self._shared.setdefault(value, value)
+
+    def _share(self, value: Any) -> Tuple[Any, Any]:
+        # key of a value tells apart values that are equal in Python but not in JSON: 1, 1.0 and true
+        if isinstance(value, str):
+            if len(value) <= INTERN_LENGTH:
+                value = sys.intern(value)
+            else:
+                value = self._shared.setdefault(value, value)
+            return value, value
+        if isinstance(value, list):
+            shared = [self._share(v) for v in value]
+            value = [v for v, _ in shared]
+            key = (list, tuple(k for _, k in shared))
+        elif isinstance(value, tuple):
+            # precomputed fields: tuples and named tuples of catabot.normalize
+            shared = [self._share(v) for v in value]
+            values = [v for v, _ in shared]
+            value = type(value)(*values) if hasattr(value, '_fields') else tuple(values)
+            key = (type(value), tuple(k for _, k in shared))
+        elif isinstance(value, frozenset):
+            return self.one(frozenset(self(v) for v in value)), (frozenset, value)
+        elif isinstance(value, dict):
+            shared = [(sys.intern(k), self._share(v)) for k, v in value.items()]
+            value = {k: v for k, (v, _) in shared}
+            key = (dict, tuple((k, vk) for k, (_, vk) in shared))
+        else:
+            return value, (type(value), value)
+        return self._shared.setdefault(key, value), key
+
+
+class RawJson:
+    """
+    Complete JSON of table rows, in a file written along with the snapshot (see :class:`RawJsonWriter`).
+
+    Rows are written one per line and only the offset of every row is kept in memory, the Raw JSON views parse
+    a row out of a memory map of the file. The file ends with the SHA-1 of the rows, so a snapshot never reads
+    rows of other data.
+    """
+
+    def __init__(self, path: str, offsets: Dict[str, Dict[str, int]], digest: bytes):
+        self.path = path
+        self.offsets = offsets
+        self.digest = digest
+        self._map: Optional[mmap.mmap] = None
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        return {'path': self.path, 'offsets': self.offsets, 'digest': self.digest}
+
+    def __setstate__(self, state):
+        self.__init__(state['path'], state['offsets'], state['digest'])
+
+    def open(self) -> bool:
+        """
+        Map the file, a snapshot opens it when it's loaded, before a newer download can replace the file
+        :return: False if the file is missing or belongs to other data
+        """
+        with self._lock:
+            if self._map is not None:
+                return True
+            try:
+                with open(self.path, 'rb') as file:
+                    mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+            except (OSError, ValueError):
+                logging.warning("Can't map raw JSON file '%s'", self.path)
+                return False
+            if mapped[-len(self.digest):] != self.digest:
+                mapped.close()
+                logging.warning("Raw JSON file '%s' was written for other game data", self.path)
+                return False
+            self._map = mapped
+            return True
+
+    def get(self, typ: str, row_id: str) -> Optional[Any]:
+        """:return: JSON of a row or None if the file is gone"""
+        offset = self.offsets[typ][row_id]
+        if not self.open():
+            return None
+        # an (offset, length) pair per row would take twice the memory, the row ends at the next newline
+        return json.loads(self._map[offset:self._map.find(b'\n', offset)])
+
+
+class RawJsonWriter:
+    """
+    Writes the complete JSON of table rows to `path` for :class:`RawJson`, replacing the old file atomically.
+    Every writer has its own temporary file, so the bot and download_data can build snapshots at the same time
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        fd, self._tmp_path = temp_file(path)
+        self._file = os.fdopen(fd, 'wb')
+        self._sha1 = hashlib.sha1()
+        self._offsets: Dict[str, Dict[str, int]] = {}
+        self._offset = 0
+
+    def add(self, typ: str, row_id: str, value: Any):
+        data = json.dumps(value, separators=(',', ':')).encode() + b'\n'
+        self._file.write(data)
+        self._sha1.update(data)
+        self._offsets.setdefault(typ, {})[row_id] = self._offset
+        self._offset += len(data)
+
+    def close(self) -> RawJson:
+        digest = self._sha1.digest()
+        self._file.write(digest)
+        self._file.close()
+        os.replace(self._tmp_path, self.path)
+        raw = RawJson(self.path, self._offsets, digest)
+        raw.open()
+        return raw
+
+    def discard(self):
+        """Remove the temporary file of a snapshot that failed to build"""
+        self._file.close()
+        if os.path.exists(self._tmp_path):
+            os.remove(self._tmp_path)
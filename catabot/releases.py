@@ -0,0 +1,182 @@
+import json
+import logging
+import os
+import re
+import threading
+from typing import Callable, Dict, List, NamedTuple, Optional
+
+from catabot.files import replaced
+from catabot.github import GitHubClient, GitHubError, client as github_client
+
+PER_PAGE = 100
+# Pages read when the index is empty, later syncs stop at the first page with an already indexed release
+MAX_PAGES = 10
+
+_BUILD = re.compile(r'(\d+)$')
+
+
+class Release(NamedTuple):
+    id: int
+    name: str
+    published: str
+    build: Optional[int]
+    links: Dict[str, Optional[str]]
+
+
+def release_build(name: str) -> Optional[int]:
+    """Build number at the end of a release name ("... #12345"), if any"""
+    match = _BUILD.search(name)
+    return int(match.group(1)) if match else None
+
+
+class _Lookup(NamedTuple):
+    releases: List[Release]
+    by_build: Dict[int, Release]
+    latest_for: Dict[str, Release]
+    latest_complete: Optional[Release]
+    stable: Optional[Release]
+    oldest_build: Optional[int]
+
+
+class ReleaseIndex:
+    """
+    Releases of one GitHub repository with their download links, kept in memory and on disk.
+
+    A background thread syncs the index: the first page of releases is always re-read (assets are attached
+    to a release after it's published) and older pages only until an indexed release is found,
+    every request being conditional through :class:`catabot.github.GitHubClient`. Lookups never go
+    to the network, they only read dictionaries rebuilt after every sync.
+    """
+
+    def __init__(self, api: str, path: str, to_release: Callable[[dict], Release],
+                 client: GitHubClient = github_client):
+        self.api = api
+        self.path = path
+        self.to_release = to_release
+        self.client = client
+        self._lookup = _Lookup([], {}, {}, None, None, None)
+        self._lock = threading.Lock()
+        self._load()
+
+    @property
+    def synced(self) -> bool:
+        return bool(self._lookup.releases)
+
+    def latest(self) -> Optional[Release]:
+        return self._lookup.releases[0] if self._lookup.releases else None
+
+    def latest_for(self, platform: str) -> Optional[Release]:
+        """Latest release with a build for `platform`"""
+        return self._lookup.latest_for.get(platform)
+
+    def latest_complete(self) -> Optional[Release]:
+        """Latest release with builds for all platforms"""
+        return self._lookup.latest_complete
+
+    def stable(self) -> Optional[Release]:
+        return self._lookup.stable
+
+    def build(self, number: int) -> Optional[Release]:
+        return self._lookup.by_build.get(number)
+
+    def covers_build(self, number: int) -> bool:
+        """Whether the index goes back far enough to know if build `number` exists"""
+        oldest = self._lookup.oldest_build
+        return oldest is not None and number >= oldest
+
+    def sync(self) -> int:
+        """
+        Fetch releases published or changed since the last sync
+        :return: number of releases read from GitHub
+        """
+        with self._lock:
+            lookup = self._lookup
+            known = {release.id: release for release in lookup.releases}
+            fetched = {}
+            for page in range(1, MAX_PAGES + 1):
+                releases = self.client.get_json(f'{self.api}?page={page}&per_page={PER_PAGE}', ttl=0 if page == 1 else None)
+                for release in releases:
+                    fetched[release['id']] = self.to_release(release)
+                if len(releases) < PER_PAGE or any(release['id'] in known for release in releases):
+                    break
+            try:
+                stable = self.to_release(self.client.get_json(f'{self.api}/latest', ttl=0))
+            except GitHubError as e:
+                if e.status != 404:
+                    raise
+                stable = None
+
+            known.update(fetched)
+            releases = sorted(known.values(), key=lambda release: release.id, reverse=True)
+            if releases != lookup.releases or stable != lookup.stable:
+                self._lookup = _build_lookup(releases, stable)
+                self._save()
+            return len(fetched)
+
+    def _load(self):
+        if not os.path.isfile(self.path):
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as file:
+                stored = json.load(file)
+            releases = [Release(*release) for release in stored['releases']]
+            stable = Release(*stored['stable']) if stored['stable'] else None
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            logging.warning("Can't read release index '%s': %s", self.path, e)
+            return
+        self._lookup = _build_lookup(releases, stable)
+
+    def _save(self):
+        lookup = self._lookup
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with replaced(self.path, encoding='utf-8') as file:
+                json.dump({'releases': lookup.releases, 'stable': lookup.stable}, file)
+        except OSError as e:
+            logging.warning("Can't save release index '%s': %s", self.path, e)
+
+
+def _build_lookup(releases: List[Release], stable: Optional[Release]) -> _Lookup:
+    by_build = {}
+    latest_for = {}
+    latest_complete = None
+    for release in releases:
+        if release.build is not None:
+            by_build.setdefault(release.build, release)
+        for platform, link in release.links.items():
+            if link and platform not in latest_for:
+                latest_for[platform] = release
+        if latest_complete is None and all(release.links.values()):
+            latest_complete = release
+    return _Lookup(releases, by_build, latest_for, latest_complete, stable, min(by_build) if by_build else None)
+
+
+class ReleaseSync:
+    """Syncs a set of release indexes every `interval` seconds from a background thread"""
+
+    def __init__(self, indexes: List[ReleaseIndex]):
+        self.indexes = indexes
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self, interval: float = 300):
+        if interval <= 0 or self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._watch, args=(interval,), name='release-sync', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def sync_all(self):
+        for index in self.indexes:
+            try:
+                count = index.sync()
+                logging.debug('Synced %d releases from %s', count, index.api)
+            except Exception:
+                logging.exception("Can't sync releases from %s", index.api)
+
+    def _watch(self, interval: float):
+        self.sync_all()
+        while not self._stop.wait(interval):
+            self.sync_all()
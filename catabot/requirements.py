@@ -0,0 +1,109 @@
+import logging
+from typing import Dict, NamedTuple, Optional, Set, Tuple
+
+
+class Quality(NamedTuple):
+    id: str
+    level: int
+    amount: int
+
+
+class Requirements(NamedTuple):
+    """
+    Fully expanded requirements of a recipe or a requirement.
+
+    ``tools`` and ``components`` are groups of alternatives: (item id, charges) and (item id, count).
+    """
+    tools: Tuple[Tuple[Tuple[str, int], ...], ...]
+    qualities: Tuple[Quality, ...]
+    components: Tuple[Tuple[Tuple[str, int], ...], ...]
+
+
+def _quality(q: dict) -> Quality:
+    return Quality(q['id'], q['level'], q['amount'] if 'amount' in q else 1)
+
+
+class RequirementExpander:
+    """
+    Expands ``LIST`` components and tools and ``using`` requirements, to any depth.
+
+    Every requirement id is expanded once and the result is shared by all recipes using it.
+    Rows of the game data are only read, never changed.
+    """
+
+    def __init__(self, requirements: dict):
+        self.requirements = requirements
+        self._expanded: Dict[str, Requirements] = {}
+        self._expanding: Set[str] = set()
+
+    def requirement(self, req_id: str) -> Optional[Requirements]:
+        if req_id in self._expanded:
+            return self._expanded[req_id]
+        if req_id not in self.requirements:
+            logging.warning('unknown requirement: %s', req_id)
+            return None
+        if req_id in self._expanding:
+            logging.warning('requirement %s requires itself', req_id)
+            return None
+        self._expanding.add(req_id)
+        try:
+            expanded = self.expand(self.requirements[req_id])
+        finally:
+            self._expanding.discard(req_id)
+        self._expanded[req_id] = expanded
+        return expanded
+
+    def _group(self, group: list, nested: str) -> Tuple[Tuple[str, int], ...]:
+        expanded = []
+        for entry in group:
+            if len(entry) == 3 and entry[2] == 'LIST':
+                req_id, count, _ = entry
+                req = self.requirement(req_id)
+                alternatives = getattr(req, nested) if req else ()
+                if alternatives:
+                    expanded += ((item_id, amount * count) for item_id, amount in alternatives[0])
+            else:
+                expanded.append((entry[0], entry[1]))
+        return tuple(expanded)
+
+    def expand(self, data: dict) -> Requirements:
+        """Expanded requirements of a recipe, an uncraft or a requirement row"""
+        tools = [self._group(group, 'tools') for group in data['tools']] if 'tools' in data else []
+        qualities = [_quality(q) for q in data['qualities']] if 'qualities' in data else []
+        components = [self._group(group, 'components') for group in data['components']] \
+            if 'components' in data else []
+        for req_id, count in data['using'] if 'using' in data else []:
+            req = self.requirement(req_id)
+            if req is None:
+                continue
+            for quality in req.qualities:
+                if quality not in qualities:
+                    qualities.append(quality)
+            for group in req.tools:
+                group = tuple((item_id, charges * count) for item_id, charges in group)
+                if group not in tools:
+                    tools.append(group)
+            for group in req.components:
+                group = tuple((item_id, amount * count) for item_id, amount in group)
+                if group not in components:
+                    components.append(group)
+        # TODO: sum
+        return Requirements(tuple(tools), tuple(qualities), tuple(components))
+
+
+def expand_recipes(tables: dict) -> Dict[str, Dict[str, Tuple[Requirements, ...]]]:
+    """Expanded requirements of every craft and uncraft recipe, in the same order as the recipe rows"""
+    expander = RequirementExpander(tables['requirement'])
+    by_row = {}
+    result = {}
+    for typ in ('recipe', 'uncraft'):
+        result[typ] = {}
+        for row_id, rows in tables[typ].items():
+            expanded = []
+            for row in rows:
+                # reversible recipes are both in 'recipe' and 'uncraft'
+                if id(row) not in by_row:
+                    by_row[id(row)] = expander.expand(row)
+                expanded.append(by_row[id(row)])
+            result[typ][row_id] = tuple(expanded)
+    return result
@@ -0,0 +1,53 @@
+from array import array
+from typing import Callable, Iterable, List
+
+
+def item_flags(row: dict) -> Iterable[str]:
+    return row['flags'] if 'flags' in row else ()
+
+
+def ammo_types(row: dict) -> Iterable[str]:
+    if row['type'] != 'AMMO' or 'ammo_type' not in row:
+        return ()
+    return [row['ammo_type']] if isinstance(row['ammo_type'], str) else row['ammo_type']
+
+
+def recipe_items(recipes: Iterable[tuple]) -> Iterable[str]:
+    """Items used by the recipes of a result as components, tools or byproducts; recipes are (row, requirements)"""
+    for row, requirements in recipes:
+        for group in requirements.components + requirements.tools:
+            yield from (item_id for item_id, _ in group)
+        for byproduct in row['byproducts'] if 'byproducts' in row else ():
+            yield byproduct[0] if isinstance(byproduct, list) else byproduct
+
+
+def recipe_qualities(recipes: Iterable[tuple]) -> Iterable[str]:
+    """Tool qualities needed by the recipes of a result as ``<quality id>:<level>``"""
+    for _, requirements in recipes:
+        yield from (f'{quality.id}:{quality.level}' for quality in requirements.qualities)
+
+
+def item_qualities(row: dict) -> List[str]:
+    """Values of :func:`recipe_qualities` an item satisfies: its qualities at their levels and all lower ones"""
+    if 'qualities' not in row:
+        return []
+    return [f'{quality_id}:{level}' for quality_id, max_level in row['qualities'] for level in range(max_level + 1)]
+
+
+class ReverseIndex:
+    """Rows of a table by the values of one of their fields (flags, ammo types), in the order of the table"""
+
+    def __init__(self, table: dict, values: Callable[[dict], Iterable[str]]):
+        self.keys: List[str] = list(table)
+        postings = {}
+        for i, row in enumerate(table.values()):
+            for value in set(values(row)):
+                postings.setdefault(value, []).append(i)
+        self.postings = {value: array('i', positions) for value, positions in postings.items()}
+
+    def lookup(self, values: Iterable[str]) -> List[str]:
+        """Keys of the rows having any of `values`"""
+        positions = set()
+        for value in values:
+            positions.update(self.postings.get(value, ()))
+        return [self.keys[i] for i in sorted(positions)]
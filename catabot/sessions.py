@@ -0,0 +1,35 @@
+import secrets
+from typing import NamedTuple, Optional, Tuple
+
+from catabot.cache import LRUCache
+
+
+class Session(NamedTuple):
+    """Results of a search or a listing, shown page by page"""
+    build: str
+    action: str
+    keyword: str
+    ids: Tuple[str, ...]
+    fuzzy: bool
+
+
+class SessionStore:
+    """
+    Keeps search results under short random tokens, so page buttons carry only the token
+    and a page flip is a slice of the stored ids instead of a new search.
+    """
+
+    def __init__(self, max_sessions: int = 20000, max_bytes: int = 64 * 1024 * 1024, ttl: float = 24 * 3600):
+        self._sessions = LRUCache(max_sessions, max_bytes, ttl)
+
+    def put(self, session: Session) -> str:
+        token = secrets.token_urlsafe(6)
+        # references to ids already kept by the snapshot, plus the tuple itself
+        self._sessions.put(token, session, 8 * len(session.ids) + 100)
+        return token
+
+    def get(self, token: str) -> Optional[Session]:
+        return self._sessions.get(token)
+
+    def stats(self) -> dict:
+        return self._sessions.stats()
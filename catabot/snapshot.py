@@ -0,0 +1,384 @@
+import gc
+import json
+import logging
+import os
+import pickle
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, List, Optional, Tuple
+
+from catabot import metrics, normalize
+from catabot.armor import ArmorBoards, armor_protection, has_protection
+from catabot.columns import ItemColumns
+from catabot.crafting import CraftingGraph
+from catabot.files import replaced
+from catabot.fuzzy import FuzzyIndex
+from catabot.prefix import PrefixIndex
+from catabot.records import RECORDS, RawJson, RawJsonWriter, Sharer
+from catabot.requirements import expand_recipes
+from catabot.reverse_index import ReverseIndex, ammo_types, item_flags, recipe_items, recipe_qualities
+from catabot.trigram import TrigramIndex
+from download_data import ALL_DATA_FILE, FALLBACK_RAW_JSON_FILE, RAW_JSON_FILE, SNAPSHOT_FILE
+
+# Bump when the layout of Snapshot changes, so compiled snapshots from older code are not loaded
+SNAPSHOT_FORMAT = 14
+
+TABLES = ('item', 'uncraft', 'recipe', 'material', 'monster', 'ammunition_type', 'requirement', 'tool_quality',
+          'proficiency')
+SEARCHABLE = ('item', 'monster')
+# Fields computed from the JSON of a row when its record is made
+NORMALIZERS = {
+    'item': normalize.item,
+    'recipe': normalize.recipe,
+    'uncraft': normalize.recipe,
+    'monster': normalize.named,
+    'material': normalize.named,
+    'ammunition_type': normalize.named,
+    'tool_quality': normalize.named,
+    'proficiency': normalize.named,
+}
+# Tables with Raw JSON views
+RAW_TABLES = ('item', 'monster', 'recipe', 'uncraft')
+
+
+class Snapshot:
+    """
+    Game data for a single build.
+
+    A snapshot is built completely before it is published and is never cleared or refilled afterwards:
+    a newer build gets a new snapshot, so handlers can keep reading the one they started with.
+    """
+
+    def __init__(self, version: str, tables: dict, search_index: dict, fuzzy_index: dict, prefix_index: dict,
+                 flag_index: ReverseIndex, ammo_index: ReverseIndex, requirements: dict, raw: RawJson,
+                 item_columns: ItemColumns, armor_boards: ArmorBoards, used_in: ReverseIndex,
+                 quality_used_in: ReverseIndex, crafting: CraftingGraph):
+        self.version = version
+        self.tables = tables
+        self.search_index = search_index
+        self.fuzzy_index = fuzzy_index
+        self.prefix_index = prefix_index
+        self.flag_index = flag_index
+        self.ammo_index = ammo_index
+        # expanded requirements of 'recipe' and 'uncraft' rows, by result, in the order of the rows
+        self.requirements = requirements
+        # rows are compact records, their complete JSON is only in a file mapped by this
+        self.raw = raw
+        # numeric and categorical attributes of items for /find
+        self.item_columns = item_columns
+        # armor sorted by protection per body part for /top
+        self.armor_boards = armor_boards
+        # results of 'recipe' rows by the items (components, tools, byproducts) and the qualities they use
+        self.used_in = used_in
+        self.quality_used_in = quality_used_in
+        # crafting trees for /tree, their costs are computed on demand and kept as long as the snapshot
+        self.crafting = crafting
+
+    def __getitem__(self, typ: str) -> dict:
+        return self.tables[typ]
+
+
+def row_name(row: dict) -> str:
+    if 'display_name' in row:
+        return row['display_name']
+    return normalize.name(row)
+
+
+def row_names(row: dict) -> List[str]:
+    names = []
+    if 'name' in row:
+        if isinstance(row['name'], str):
+            names.append(row['name'])
+        elif 'str' in row['name']:
+            names.append(row['name']['str'])
+        elif 'str_sp' in row['name']:
+            names.append(row['name']['str_sp'])
+    if 'id' in row:
+        names.append(row['id'])
+    return names
+
+
+def _mapped_type(typ: str) -> str:
+    if typ in {"AMMO", "GUN", "ARMOR", "PET_ARMOR", "TOOL", "TOOLMOD", "TOOL_ARMOR", "BOOK",
+               "COMESTIBLE", "ENGINE", "WHEEL", "GUNMOD", "MAGAZINE", "BATTERY", "GENERIC", "BIONIC_ITEM"}:
+        return "item"
+    elif typ == "city_building":
+        return "overmap_special"
+    else:
+        return typ.lower()
+
+
+def _add_copy_from(table: dict, row: dict):
+    if 'copy-from' in row:
+        fr = table[row['copy-from']]
+        row.pop('copy-from')
+        for key in fr:
+            if key not in row and key != 'abstract':
+                row[key] = fr[key]
+        _add_copy_from(table, row)
+
+
+def _compact(tables: dict) -> dict:
+    """Tables of :mod:`catabot.records` records made of the JSON rows, with equal values shared"""
+    share = Sharer()
+    records = {}
+    # fields computed for many rows at once, by row
+    computed = {}
+    armor = [row for row in tables['item'].values() if has_protection(row)]
+    for row, protection in zip(armor, armor_protection(armor, tables['material'])):
+        computed[id(row)] = {'protection': protection}
+
+    def record(typ: str, row: dict):
+        # reversible recipes are both in 'recipe' and 'uncraft'
+        key = id(row)
+        if key not in records:
+            if typ in NORMALIZERS:
+                row = {**row, **NORMALIZERS[typ](row, tables['material']), **computed.get(key, {})}
+            records[key] = RECORDS[typ](row, share)
+        return records[key]
+
+    compact = {}
+    for typ, table in tables.items():
+        if typ in ('recipe', 'uncraft'):
+            compact[typ] = {share(row_id): tuple(record(typ, row) for row in rows) for row_id, rows in table.items()}
+        else:
+            compact[typ] = {share(row_id): record(typ, row) for row_id, row in table.items()}
+    return compact
+
+
+def build_snapshot(data_json: dict, raw_path: str = RAW_JSON_FILE) -> Snapshot:
+    """
+    Build a snapshot of the game data
+    :param data_json: parsed data.json
+    :param raw_path: where to write the complete JSON of the rows for the Raw JSON views
+    """
+    tables = {typ: {} for typ in TABLES}
+    typs = set()
+    for row in data_json['data']:
+        typ = _mapped_type(row['type'])
+        if typ in {'item', 'material', 'monster'}:
+            if 'id' in row:
+                row_id = row['id']
+            elif 'abstract' in row:
+                row_id = row['abstract']
+            else:
+                logging.warning('no id and no abstract: %s', row)
+                continue
+            tables[typ][row_id] = row
+        elif typ == 'recipe':
+            # TODO: there are some abstract craft recipes
+            if 'result' in row and 'category' in row and row['category'] != 'CC_BUILDING' and \
+                    ('on_display' not in row or row['on_display']):
+                tables['recipe'].setdefault(row['result'], []).append(row)
+        elif typ == 'uncraft' and 'result' in row:  # TODO: there are some abstract uncraft recipes
+            tables['uncraft'].setdefault(row['result'], []).append(row)
+        elif typ in {'ammunition_type', 'requirement', 'tool_quality', 'proficiency'}:
+            tables[typ][row['id']] = row
+        else:
+            typs.add(typ)
+    for typ in {'item', 'material', 'monster'}:
+        for row in tables[typ].values():
+            if 'copy-from' in row:
+                _add_copy_from(tables[typ], row)
+            if 'volume' not in row:
+                row['volume'] = 0
+            if 'weight' not in row:
+                row['weight'] = 0
+    for rows_row in tables['recipe'].values():
+        for row in rows_row:
+            if 'reversible' in row and row['reversible']:
+                tables['uncraft'].setdefault(row['result'], []).append(row)
+    writer = RawJsonWriter(raw_path)
+    try:
+        for typ in RAW_TABLES:
+            for row_id, value in tables[typ].items():
+                writer.add(typ, row_id, value)
+        raw = writer.close()
+    except BaseException:
+        writer.discard()
+        raise
+    tables = _compact(tables)
+    search_index = {}
+    fuzzy_index = {}
+    prefix_index = {}
+    for typ in SEARCHABLE:
+        names = [(row['id'], row_names(row)) for row in tables[typ].values() if 'id' in row]
+        search_index[typ] = TrigramIndex(names)
+        fuzzy_index[typ] = FuzzyIndex(names)
+        prefix_index[typ] = PrefixIndex(names)
+    flag_index = ReverseIndex(tables['item'], item_flags)
+    ammo_index = ReverseIndex(tables['item'], ammo_types)
+    requirements = expand_recipes(tables)
+    recipes = {result: tuple(zip(rows, requirements['recipe'][result])) for result, rows in tables['recipe'].items()}
+    used_in = ReverseIndex(recipes, recipe_items)
+    quality_used_in = ReverseIndex(recipes, recipe_qualities)
+    crafting = CraftingGraph(tables['recipe'], requirements['recipe'], tables['item'])
+    items = [(row_id, row) for row_id, row in tables['item'].items() if 'id' in row]
+    item_columns = ItemColumns(items)
+    armor_boards = ArmorBoards((row for _, row in items), item_columns)
+    return Snapshot(data_json['build_number'], tables, search_index, fuzzy_index, prefix_index, flag_index,
+                    ammo_index, requirements, raw, item_columns, armor_boards, used_in, quality_used_in,
+                    crafting)
+
+
+@contextmanager
+def gc_paused():
+    # loading creates millions of container objects, which makes the cyclic GC run over and over for nothing
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+
+def load_data_file(path: str = ALL_DATA_FILE, raw_path: str = RAW_JSON_FILE) -> Snapshot:
+    with gc_paused(), open(path, 'r') as file:
+        return build_snapshot(json.load(file), raw_path)
+
+
+def write_snapshot(snapshot: Snapshot, path: str = SNAPSHOT_FILE):
+    """
+    Save a compiled snapshot, replacing the old one atomically
+    :param snapshot: snapshot to save
+    :param path: compiled snapshot path
+    """
+    with replaced(path, 'wb') as file:
+        pickle.dump({'format': SNAPSHOT_FORMAT, 'build_number': snapshot.version}, file, pickle.HIGHEST_PROTOCOL)
+        pickle.dump(snapshot, file, pickle.HIGHEST_PROTOCOL)
+
+
+def read_snapshot(path: str = SNAPSHOT_FILE) -> Optional[Snapshot]:
+    """
+    Load a compiled snapshot
+    :param path: compiled snapshot path
+    :return: snapshot or None if it was compiled with an incompatible format
+    """
+    with gc_paused(), open(path, 'rb') as file:
+        header = pickle.load(file)
+        if header.get('format') != SNAPSHOT_FORMAT:
+            return None
+        snapshot = pickle.load(file)
+    snapshot.raw.open()
+    return snapshot
+
+
+def read_snapshot_header(path: str = SNAPSHOT_FILE) -> Optional[dict]:
+    """
+    Read only the header of a compiled snapshot
+    :return: header with the snapshot format and build number or None if there is no readable snapshot
+    """
+    try:
+        with open(path, 'rb') as file:
+            return pickle.load(file)
+    except (OSError, pickle.UnpicklingError, EOFError):
+        return None
+
+
+def _file_signature(path: str) -> Optional[Tuple[int, int, int]]:
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_ino, stat.st_size, stat.st_mtime_ns
+
+
+class SnapshotManager:
+    """
+    Keeps the current :class:`Snapshot` and replaces it when the data files change.
+
+    The compiled snapshot written by ``download_data`` is preferred, data.json is only parsed when
+    there is no up-to-date compiled snapshot, and its raw JSON then goes to `raw_path`, apart from the data.raw
+    the compiled snapshot reads. Changes are detected with ``stat`` calls (inode, size, mtime)
+    from a background thread, so handlers calling :meth:`current` never touch the files
+    once the first snapshot is loaded.
+    """
+
+    def __init__(self, path: str = ALL_DATA_FILE, snapshot_path: str = SNAPSHOT_FILE,
+                 raw_path: str = FALLBACK_RAW_JSON_FILE):
+        self.path = path
+        self.snapshot_path = snapshot_path
+        self.raw_path = raw_path
+        self._snapshot: Optional[Snapshot] = None
+        self._signature = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._listeners: List[Callable[[Snapshot], None]] = []
+        self.load_seconds: Optional[float] = None
+
+    def current(self) -> Snapshot:
+        snapshot = self._snapshot
+        if snapshot is None:
+            self.reload()
+            snapshot = self._snapshot
+        return snapshot
+
+    def on_swap(self, listener: Callable[[Snapshot], None]):
+        """Call `listener` with every newly published snapshot"""
+        self._listeners.append(listener)
+
+    def reload(self, force: bool = False) -> bool:
+        """
+        Load a new snapshot if the data files have changed and publish it
+        :param force: reload even if the files look unchanged
+        :return: True if a new snapshot was published
+        """
+        with self._lock:
+            signature = _file_signature(self.path), _file_signature(self.snapshot_path)
+            if signature == (None, None):
+                if self._snapshot is None:
+                    raise FileNotFoundError(f"No game data at '{self.path}', run `python -m download_data` first")
+                return False
+            if signature == self._signature and not force:
+                return False
+
+            started = time.perf_counter()
+            snapshot = self._load(*signature)
+            self._signature = signature
+            if self._snapshot is not None and self._snapshot.version == snapshot.version and not force:
+                return False
+            self._snapshot = snapshot
+        self.load_seconds = time.perf_counter() - started
+        logging.info('Loaded game data for build %s in %.2fs', snapshot.version, self.load_seconds)
+        for listener in self._listeners:
+            listener(snapshot)
+        return True
+
+    def _load(self, data_signature, snapshot_signature) -> Snapshot:
+        # the compiled snapshot is written right after data.json, an older one belongs to a previous download
+        if snapshot_signature is not None and (data_signature is None or snapshot_signature[2] >= data_signature[2]):
+            snapshot = read_snapshot(self.snapshot_path)
+            if snapshot is not None:
+                return snapshot
+            logging.warning("Compiled snapshot '%s' has an old format, loading '%s'", self.snapshot_path, self.path)
+        return load_data_file(self.path, self.raw_path)
+
+    def start(self, interval: float = 60):
+        """Load the first snapshot and watch the data file every `interval` seconds"""
+        self.current()
+        if interval <= 0 or self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._watch, args=(interval,), name='snapshot-reloader', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _watch(self, interval: float):
+        while not self._stop.wait(interval):
+            try:
+                self.reload()
+            except Exception:
+                logging.exception("Can't reload game data from '%s'", self.path)
+
+
+snapshots = SnapshotManager()
+metrics.register(metrics.Collected(
+    'catabot_snapshot_load_seconds', 'Time to load the current game data', 'gauge', (),
+    lambda: {(): snapshots.load_seconds} if snapshots.load_seconds is not None else {}))
+metrics.register(metrics.Collected(
+    'catabot_snapshot_info', 'Build of the current game data', 'gauge', ('build',),
+    lambda: {(snapshots._snapshot.version,): 1} if snapshots._snapshot is not None else {}))
@@ -3,7 +3,13 @@ import os
 from argparse import ArgumentParser
 from logging.handlers import TimedRotatingFileHandler
 
+from catabot.snapshot import snapshots
+from catabot import metrics
+from catabot.async_tgbot import AsyncTelegramBot
+from catabot.commands.release import release_sync
+from catabot.control import ControlServer
 from catabot.tgbot import TelegramBot
+from download_data import CONTROL_SOCKET
 
 
 class CataBot:
@@ -11,7 +17,11 @@ class CataBot:
     def __init__(self):
         self.args = self._parse_args()
         self._init_logger(self.args.logfile, self.args.loglevel)
-        self.tgbot = TelegramBot(self._get_bot_token(), self.args.clean, self.args.debug)
+        if self.args.use_async:
+            self.tgbot = AsyncTelegramBot(self._get_bot_token(), self.args.clean, self.args.debug, self.args.workers)
+        else:
+            self.tgbot = TelegramBot(self._get_bot_token(), self.args.clean, self.args.debug,
+                                     self.args.fast_workers, self.args.slow_workers, self.args.lane_backlog)
 
     def _parse_args(self):
         parser = ArgumentParser(description="CDDA_Bot: CDDA itembrowser for Telegram")
@@ -71,6 +81,92 @@ class CataBot:
             default=False,
         )
 
+        # Game data reload interval
+        parser.add_argument(
+            "-reload",
+            dest="reload_interval",
+            type=int,
+            help="check the game data file for changes every N seconds (0 to disable)",
+            default=60,
+            required=False,
+            metavar="SECONDS")
+
+        # Control socket
+        parser.add_argument(
+            "-control",
+            dest="control_socket",
+            help="unix socket download_data uses to tell the bot about new game data (empty to disable)",
+            default=CONTROL_SOCKET,
+            required=False,
+            metavar="SOCKET")
+
+        # Release index sync interval
+        parser.add_argument(
+            "-release-sync",
+            dest="release_sync_interval",
+            type=int,
+            help="sync the local index of game releases with GitHub every N seconds (0 to disable)",
+            default=300,
+            required=False,
+            metavar="SECONDS")
+
+        # Worker lanes
+        parser.add_argument(
+            "-fast-workers",
+            dest="fast_workers",
+            type=int,
+            help="threads for local commands: searches, buttons",
+            default=4,
+            required=False,
+            metavar="N")
+
+        parser.add_argument(
+            "-slow-workers",
+            dest="slow_workers",
+            type=int,
+            help="threads for commands waiting on GitHub: /release",
+            default=2,
+            required=False,
+            metavar="N")
+
+        parser.add_argument(
+            "-lane-backlog",
+            dest="lane_backlog",
+            type=int,
+            help="updates queued per lane before new ones are dropped",
+            default=100,
+            required=False,
+            metavar="N")
+
+        # Metrics endpoint
+        parser.add_argument(
+            "-metrics-port",
+            dest="metrics_port",
+            type=int,
+            help="serve Prometheus metrics on http://127.0.0.1:PORT/metrics (0 to disable)",
+            default=0,
+            required=False,
+            metavar="PORT")
+
+        # Async runtime
+        parser.add_argument(
+            "--async",
+            dest="use_async",
+            action="store_true",
+            help="run on AsyncTeleBot, handling updates concurrently",
+            required=False,
+            default=False)
+
+        # Threads for searches and rendering in async mode
+        parser.add_argument(
+            "-workers",
+            dest="workers",
+            type=int,
+            help="number of threads for searches and rendering with --async",
+            default=4,
+            required=False,
+            metavar="N")
+
         return parser.parse_args()
 
     # Configure logging
@@ -122,5 +218,12 @@ class CataBot:
             exit("ERROR: Can't read bot token")
 
     def start(self):
+        metrics.serve(self.args.metrics_port)
+        snapshots.start(self.args.reload_interval)
+        try:
+            ControlServer(self.args.control_socket).start()
+        except RuntimeError as e:
+            exit(f"ERROR: {e}")
+        release_sync.start(self.args.release_sync_interval)
         self.tgbot.bot_start_polling()
         self.tgbot.bot_idle()
@@ -1,51 +1,96 @@
 from telebot import TeleBot
 from telebot.apihelper import ApiException
-from telebot.types import User, Message, CallbackQuery
+from telebot.types import User, Message, CallbackQuery, InlineQuery
 
-from catabot import constants
+from catabot import constants, metrics
+from catabot.commands.admin import is_admin, memory, profile
 from catabot.commands.release import get_release
-from catabot.commands.search import search, btn_pressed
+from catabot.commands.search import search, btn_pressed, find_items, flag, inline, top
+from catabot.lanes import Dispatcher
 
 
 ALL_CONTENT_TYPES = ['text', 'animation', 'audio', 'contact', 'dice', 'document', 'location',
                      'photo', 'poll', 'sticker', 'venue', 'video', 'video_note', 'voice']
 
 
+def callback_handler(data: str) -> str:
+    """Handler name of a pressed button for metrics: button:<action>, button:cdda_page or button:cdda_cancel"""
+    if data.startswith('cdda:'):
+        return 'button:' + data.split(':')[1]
+    return 'button:' + data.split(':')[0].rstrip('0123456789')
+
+
 class TelegramBot:
 
-    def __init__(self, token, clean=False, debug=False):
+    def __init__(self, token, clean=False, debug=False, fast_workers=4, slow_workers=2, backlog=100):
         self.token: str = token
         self.clean: bool = clean
         self.debug: bool = debug
 
-        self.bot: TeleBot = TeleBot(token, skip_pending=clean)
+        # Handlers only queue updates into lanes: 'fast' for local commands, 'slow' for GitHub lookups and admin reports
+        self.bot: TeleBot = TeleBot(token, skip_pending=clean, threaded=False)
         self.me: User = self.bot.get_me()
+        self.dispatcher = Dispatcher({'fast': fast_workers, 'slow': slow_workers}, backlog)
+        # handlers get a proxy of the bot timing Bot API calls
+        self.api = metrics.TimedApi(self.bot)
 
         @self.bot.message_handler(['search', 's', 'item', 'i',
                                    'craft', 'c', 'recipe', 'r',
                                    'disassemble', 'disasm', 'd', 'uncraft', 'u',
-                                   'monster', 'mob', 'm'])
+                                   'monster', 'mob', 'm',
+                                   'uses', 'tree'])
         def _search(message: Message):
-            search(self.bot, message)
+            self.dispatcher.submit('fast', message.chat.id, metrics.instrumented('search', search), self.api, message)
+
+        @self.bot.message_handler(['flag'])
+        def _flag(message: Message):
+            self.dispatcher.submit('fast', message.chat.id, metrics.instrumented('flag', flag), self.api, message)
+
+        @self.bot.message_handler(['find'])
+        def _find(message: Message):
+            self.dispatcher.submit('fast', message.chat.id, metrics.instrumented('find', find_items), self.api, message)
+
+        @self.bot.message_handler(['top'])
+        def _top(message: Message):
+            self.dispatcher.submit('fast', message.chat.id, metrics.instrumented('top', top), self.api, message)
+
+        @self.bot.inline_handler(func=lambda query: True)
+        def _inline(query: InlineQuery):
+            self.dispatcher.submit('fast', query.from_user.id, metrics.instrumented('inline', inline), self.api, query)
 
         @self.bot.callback_query_handler(func=lambda call: call.data)
         def _btn_pressed(call: CallbackQuery):
-            if call.message and call.message.reply_to_message:
-                if call.message.reply_to_message.from_user.id != call.from_user.id:
-                    self.bot.answer_callback_query(call.id, "Эти кнопки только для того кто вызвал команду", True)
-                    return
-            btn_pressed(self.bot, call.message, call.data)
+            chat_id = call.message.chat.id if call.message else call.from_user.id
+            self.dispatcher.submit('fast', chat_id, metrics.instrumented(callback_handler(call.data), self._btn_pressed), call)
 
         @self.bot.message_handler(['release', 'get_release'])
         def _get_release(message):
-            get_release(self.bot, message)
+            self.dispatcher.submit('slow', message.chat.id, metrics.instrumented('release', get_release), self.api, message)
+
+        @self.bot.message_handler(['profile'], func=is_admin)
+        def _profile(message: Message):
+            self.dispatcher.submit('slow', message.chat.id, metrics.instrumented('profile', profile), self.api, message)
+
+        @self.bot.message_handler(['memory'], func=is_admin)
+        def _memory(message: Message):
+            self.dispatcher.submit('slow', message.chat.id, metrics.instrumented('memory', memory), self.api, message)
 
         @self.bot.message_handler(func=lambda m: m.from_user and m.from_user.id == 777000, content_types=ALL_CONTENT_TYPES)
         def _unpin(message):
-            try:
-                self.bot.unpin_chat_message(message.chat.id, message.message_id)
-            except ApiException:
-                pass
+            self.dispatcher.submit('fast', message.chat.id, metrics.instrumented('unpin', self._unpin), message)
+
+    def _btn_pressed(self, call: CallbackQuery):
+        if call.message and call.message.reply_to_message:
+            if call.message.reply_to_message.from_user.id != call.from_user.id:
+                self.api.answer_callback_query(call.id, "Эти кнопки только для того кто вызвал команду", True)
+                return
+        btn_pressed(self.api, call.message, call.data)
+
+    def _unpin(self, message: Message):
+        try:
+            self.api.unpin_chat_message(message.chat.id, message.message_id)
+        except ApiException:
+            pass
 
     # Start the bot
     def bot_start_polling(self):
@@ -54,7 +99,11 @@ class TelegramBot:
 
     # Go in idle mode
     def bot_idle(self):
-        if self.debug:
-            self.bot.polling(True)
-        else:
-            self.bot.infinity_polling()
+        try:
+            if self.debug:
+                self.bot.polling(True)
+            else:
+                self.bot.infinity_polling()
+        finally:
+            # let the workers finish the updates they have already taken
+            self.dispatcher.stop()
@@ -0,0 +1,64 @@
+from array import array
+from typing import Iterable, List, Sequence, Tuple
+
+# Candidates left after intersecting posting lists are checked one by one,
+# intersecting with the remaining (longer) lists stops paying off below this
+_VERIFY_THRESHOLD = 64
+
+
+def _trigrams(text: str) -> set:
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+def _grams(text: str) -> set:
+    # bigrams are posted as well, so two-letter keywords don't need a full scan
+    return _trigrams(text) | {text[i:i + 2] for i in range(len(text) - 1)}
+
+
+class TrigramIndex:
+    """
+    Case-insensitive substring search over the names of table rows.
+
+    Every row is posted under each trigram (and bigram) of its lowercased names. A keyword is looked up by
+    intersecting the posting lists of its trigrams (shortest first) and checking the remaining candidates,
+    so the result is exactly the rows for which ``keyword.lower() in name.lower()`` for some name.
+    """
+
+    def __init__(self, rows: Iterable[Tuple[str, Sequence[str]]]):
+        self.keys: List[str] = []
+        self.names: List[Tuple[str, ...]] = []
+        postings = {}
+        for i, (key, names) in enumerate(rows):
+            names = tuple(name.lower() for name in names)
+            self.keys.append(key)
+            self.names.append(names)
+            for gram in set().union(*map(_grams, names)):
+                postings.setdefault(gram, []).append(i)
+        self.postings = {gram: array('i', positions) for gram, positions in postings.items()}
+
+    def search(self, keyword: str) -> List[str]:
+        """
+        Find rows with `keyword` in any of their names
+        :param keyword: substring to look for
+        :return: keys of the matching rows in the order they were indexed
+        """
+        keyword = keyword.lower()
+        grams = _trigrams(keyword) if len(keyword) > 2 else {keyword}
+        if len(keyword) > 1:
+            lists = []
+            for gram in grams:
+                positions = self.postings.get(gram)
+                if positions is None:
+                    return []
+                lists.append(positions)
+            lists.sort(key=len)
+            candidates = set(lists[0])
+            for positions in lists[1:]:
+                if len(candidates) < _VERIFY_THRESHOLD:
+                    break
+                candidates.intersection_update(positions)
+            candidates = sorted(candidates)
+        else:
+            candidates = range(len(self.keys))
+        names = self.names
+        return [self.keys[i] for i in candidates if any(keyword in name for name in names[i])]
@@ -1,7 +1,20 @@
+import asyncio
+import contextvars
+from concurrent.futures import Executor
+from typing import TYPE_CHECKING, Any, Callable, Optional
+
 from telebot import TeleBot
 from telebot.apihelper import ApiException
 from telebot.types import Message
 
+from catabot import profiling
+
+if TYPE_CHECKING:
+    from telebot.async_telebot import AsyncTeleBot
+
+# sent when a search finds nothing
+NOT_FOUND_STICKER = 'CAADAgADxgADOtDfAeLvpRcG6I1bFgQ'
+
 
 def get_command(message: Message):
     return message.text.split(' ')[0].split('@')[0].lower()
@@ -14,8 +27,9 @@ def get_atmention(message: Message):
     return None
 
 
-def get_keyword(message: Message, with_reply=True) -> str:
-    keyword = message.text[len(message.text.split(' ')[0]) + 1::].replace(',', '').strip()
+def get_keyword(message: Message, with_reply=True, keep_commas=False) -> str:
+    keyword = message.text[len(message.text.split(' ')[0]) + 1::]
+    keyword = (keyword if keep_commas else keyword.replace(',', '')).strip()
     if with_reply and not keyword and message.reply_to_message:
         rm = message.reply_to_message
         keyword = rm.caption if rm.caption else rm.text
@@ -39,3 +53,19 @@ def delete_message(bot: TeleBot, message: Message):
         bot.delete_message(message.chat.id, message.message_id)
     except ApiException:
         pass
+
+
+async def async_delete_message(bot: 'AsyncTeleBot', message: Message):
+    from telebot.asyncio_helper import ApiException as AsyncApiException
+
+    try:
+        await bot.delete_message(message.chat.id, message.message_id)
+    except AsyncApiException:
+        pass
+
+
+async def in_executor(func: Callable[[], Any], executor: Optional[Executor] = None) -> Any:
+    """Run blocking `func` in `executor` (default executor of the running loop if None), so the loop keeps polling"""
+    # with the context of the caller, so metrics count the time to the handler that waits for it (and it's profiled with it)
+    return await asyncio.get_running_loop().run_in_executor(executor, contextvars.copy_context().run,
+                                                            profiling.in_profiled_context(func))
@@ -1,8 +1,7 @@
-import json
-import urllib.request
 from dataclasses import dataclass
 from typing import Iterator, Optional, List
 
+from catabot.github import client
 from changelog import published
 
 CATADDA_GIT_API = "https://api.github.com/repos/CleverRaven/Cataclysm-DDA/"
@@ -22,7 +21,8 @@ class Release:
 def get_releases() -> Iterator[Release]:
     last_posted = published.get()
 
-    releases = json.loads(urllib.request.urlopen(RELEASES_API).read())
+    # always revalidated, but an unchanged list costs nothing against the rate limit
+    releases = client.get_json(RELEASES_API, ttl=0)
     result = []
     for i, release in enumerate(releases):
         if release['id'] <= last_posted:
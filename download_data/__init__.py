@@ -2,4 +2,12 @@ from os import path
 
 ROOT_DIR = path.dirname(path.dirname(__file__))
 ALL_DATA_FILE = path.join(ROOT_DIR, "data.json")
+ALL_DATA_META_FILE = path.join(ROOT_DIR, "data.json.meta")
+SNAPSHOT_FILE = path.join(ROOT_DIR, "data.snapshot")
+RAW_JSON_FILE = path.join(ROOT_DIR, "data.raw")
+# raw JSON of the data the bot builds itself when there is no up-to-date compiled snapshot
+FALLBACK_RAW_JSON_FILE = path.join(ROOT_DIR, "data.fallback.raw")
 ALL_DATA_URL = "https://raw.githubusercontent.com/nornagon/cdda-data/main/data/latest/all.json"
+GITHUB_CACHE_DIR = path.join(ROOT_DIR, "cache", "github")
+RELEASES_CACHE_DIR = path.join(ROOT_DIR, "cache", "releases")
+CONTROL_SOCKET = path.join(ROOT_DIR, "catabot.sock")
@@ -1,14 +1,196 @@
-import shutil
+import hashlib
+import json
+import logging
+import os
+import re
+import tempfile
+import time
+import zlib
+from argparse import ArgumentParser
+from typing import Optional
 from urllib import request
+from urllib.error import HTTPError
 
-from . import ALL_DATA_FILE, ALL_DATA_URL
+from catabot.control import send_command
+from catabot.files import temp_file
+from catabot.snapshot import (SNAPSHOT_FORMAT, build_snapshot, gc_paused, load_data_file, read_snapshot,
+                              read_snapshot_header, write_snapshot)
+from . import ALL_DATA_FILE, ALL_DATA_META_FILE, ALL_DATA_URL, SNAPSHOT_FILE
 
+CHUNK_SIZE = 1024 * 1024
+_BUILD_NUMBER = re.compile(r'^[\w.-]+$')
 
-def download_data():
-    with open(ALL_DATA_FILE, 'wb') as data_file, \
-            request.urlopen(ALL_DATA_URL) as response:
-        shutil.copyfileobj(response, data_file)
+
+class DownloadError(Exception):
+    pass
+
+
+def _read_meta() -> dict:
+    try:
+        with open(ALL_DATA_META_FILE, 'r') as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return {}
+
+
+def _sha256(path: str) -> Optional[str]:
+    digest = hashlib.sha256()
+    try:
+        with open(path, 'rb') as file:
+            for chunk in iter(lambda: file.read(CHUNK_SIZE), b''):
+                digest.update(chunk)
+    except OSError:
+        return None
+    return digest.hexdigest()
+
+
+def download_data() -> Optional[dict]:
+    """
+    Download the game data if it has changed since the last download.
+
+    The request is conditional on the ``ETag``/``Last-Modified`` of the previous download, as long as data.json
+    is still the file it was (same checksum). The response is streamed into a temporary file, checked and only then
+    renamed to data.json, so an interrupted download never leaves a broken data.json behind.
+
+    The snapshot is compiled before data.json is replaced: a data.json newer than the snapshot would make the bot
+    rebuild the snapshot itself, while this one is being compiled.
+    :return: parsed game data or None if data.json is up to date
+    """
+    started = time.perf_counter()
+    meta = _read_meta()
+    headers = {'Accept-Encoding': 'gzip'}
+    if meta and meta.get('sha256') == _sha256(ALL_DATA_FILE):
+        if meta.get('etag'):
+            headers['If-None-Match'] = meta['etag']
+        if meta.get('last_modified'):
+            headers['If-Modified-Since'] = meta['last_modified']
+
+    try:
+        response = request.urlopen(request.Request(ALL_DATA_URL, headers=headers))
+    except HTTPError as e:
+        if e.code == 304:
+            print(f"data.json is up to date (build {meta.get('build_number')}), "
+                  f"checked in {time.perf_counter() - started:.1f}s")
+            return None
+        raise
+
+    transferred = 0
+    digest = hashlib.sha256()
+    decompressor = zlib.decompressobj(zlib.MAX_WBITS | 16) if response.headers.get('Content-Encoding') == 'gzip' else None
+    fd, tmp_path = temp_file(ALL_DATA_FILE)
+    try:
+        with response, os.fdopen(fd, 'wb') as tmp_file:
+            for chunk in iter(lambda: response.read(CHUNK_SIZE), b''):
+                transferred += len(chunk)
+                if decompressor is not None:
+                    chunk = decompressor.decompress(chunk)
+                digest.update(chunk)
+                tmp_file.write(chunk)
+            if decompressor is not None:
+                chunk = decompressor.flush()
+                digest.update(chunk)
+                tmp_file.write(chunk)
+            size = tmp_file.tell()
+        expected = response.headers.get('Content-Length')
+        if expected is not None and int(expected) != transferred:
+            raise DownloadError(f"Download was cut short: {transferred} of {expected} bytes")
+
+        with gc_paused(), open(tmp_path, 'r') as file:
+            data_json = json.load(file)
+        build_number = data_json.get('build_number') if isinstance(data_json, dict) else None
+        if not isinstance(build_number, str) or not _BUILD_NUMBER.match(build_number) \
+                or not isinstance(data_json.get('data'), list):
+            raise DownloadError(f"Downloaded file doesn't look like game data (build_number: {build_number!r})")
+        compile_snapshot(data_json)
+        # the renamed file keeps the time it was written, which is before the snapshot's
+        os.replace(tmp_path, ALL_DATA_FILE)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+    with open(ALL_DATA_META_FILE, 'w') as file:
+        json.dump({
+            'etag': response.headers.get('ETag'),
+            'last_modified': response.headers.get('Last-Modified'),
+            'sha256': digest.hexdigest(),
+            'build_number': build_number,
+        }, file)
+    print(f"Downloaded build {build_number}: {transferred} bytes transferred ({size} bytes of JSON) "
+          f"in {time.perf_counter() - started:.1f}s")
+    return data_json
+
+
+def _snapshot_is_current() -> bool:
+    header = read_snapshot_header(SNAPSHOT_FILE)
+    return header is not None and header.get('format') == SNAPSHOT_FORMAT \
+        and os.path.getmtime(SNAPSHOT_FILE) >= os.path.getmtime(ALL_DATA_FILE)
+
+
+def compile_snapshot(data_json: Optional[dict] = None):
+    if data_json is None:
+        snapshot = load_data_file(ALL_DATA_FILE)
+    else:
+        with gc_paused():
+            snapshot = build_snapshot(data_json)
+    write_snapshot(snapshot, SNAPSHOT_FILE)
+
+
+def compare_load_times(repeat: int = 3):
+    """Print how long the bot needs to load the game data from data.json and from the compiled snapshot"""
+    def _best(load) -> float:
+        times = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            load()
+            times.append(time.perf_counter() - started)
+        return min(times)
+
+    # the raw JSON written while loading data.json must not replace the one of the compiled snapshot
+    with tempfile.TemporaryDirectory() as raw_dir:
+        from_json = _best(lambda: load_data_file(ALL_DATA_FILE, os.path.join(raw_dir, 'data.raw')))
+    from_snapshot = _best(lambda: read_snapshot(SNAPSHOT_FILE))
+    print(f"data.json: {from_json:.3f}s")
+    print(f"compiled snapshot: {from_snapshot:.3f}s ({from_json / from_snapshot:.1f}x faster)")
 
 
 if __name__ == "__main__":
-    download_data()
+    parser = ArgumentParser(description="Download Cataclysm: DDA game data and compile it for CataBot")
+    parser.add_argument(
+        "--no-download",
+        dest="download",
+        action="store_false",
+        help="only compile the snapshot from the existing data.json",
+        default=True)
+    parser.add_argument(
+        "--timing",
+        dest="timing",
+        action="store_true",
+        help="compare load times of data.json and the compiled snapshot",
+        default=False)
+    parser.add_argument(
+        "--no-notify",
+        dest="notify",
+        action="store_false",
+        help="don't tell the running bot to load the new data",
+        default=True)
+    args = parser.parse_args()
+
+    # a download compiles the snapshot of the new data itself
+    data_json = download_data() if args.download else None
+    compiled = data_json is not None
+    if not compiled and (not args.download or not _snapshot_is_current()):
+        compile_snapshot()
+        compiled = True
+    if compiled and args.notify:
+        # the data is already updated, a bot that doesn't answer picks it up on its next stat check
+        try:
+            response = send_command({'command': 'reload',
+                                     'build_number': read_snapshot_header(SNAPSHOT_FILE)['build_number']})
+        except (OSError, ValueError) as e:
+            logging.warning("Can't tell the bot to reload the game data: %r", e)
+        else:
+            if response is not None:
+                print(f"Bot reloaded: {response}")
+    if args.timing:
+        compare_load_times()